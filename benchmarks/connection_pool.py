@@ -0,0 +1,71 @@
+"""Measure lookup throughput through one shared Connection as threads grow.
+
+Each simulated HTTP request sleeps for a fixed latency (no network is used),
+so throughput should scale with the number of threads
+until it reaches the size of the connection pool.
+
+Usage::
+
+  python benchmarks/connection_pool.py [latency_ms] [requests_per_thread]
+"""
+
+import sys
+import threading
+import time
+
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore.connection import Connection
+
+
+class LatencyHttp(object):
+  """A fake transport which answers every request after a fixed delay."""
+
+  def __init__(self, latency):
+    self._latency = latency
+    self._response = datastore_pb.LookupResponse().SerializeToString()
+
+  def request(self, uri, method='GET', body=None, headers=None):
+    time.sleep(self._latency)
+    return {'status': '200'}, self._response
+
+
+class LatencyConnection(Connection):
+
+  def __init__(self, latency, **kwargs):
+    super(LatencyConnection, self).__init__(**kwargs)
+    self._latency = latency
+
+  def _make_http(self):
+    return LatencyHttp(self._latency)
+
+
+def run(connection, threads, requests_per_thread):
+  key_pb = datastore_pb.Key()
+  key_pb.path_element.add(kind='Thing', id=1)
+
+  def worker():
+    for _ in xrange(requests_per_thread):
+      connection.lookup('dataset-id', key_pb)
+
+  workers = [threading.Thread(target=worker) for _ in xrange(threads)]
+  start = time.time()
+  for thread in workers:
+    thread.start()
+  for thread in workers:
+    thread.join()
+  return threads * requests_per_thread / (time.time() - start)
+
+
+def main():
+  latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.02
+  requests_per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+  connection = LatencyConnection(latency, max_connections=32)
+  print 'threads  lookups/sec'
+  for threads in (1, 2, 4, 8, 16, 32, 64):
+    print '%7d  %11.1f' % (threads, run(connection, threads,
+                                         requests_per_thread))
+
+
+if __name__ == '__main__':
+  main()
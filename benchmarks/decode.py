@@ -0,0 +1,73 @@
+"""Compare decoding a large runQuery response entity by entity, in batch,
+lazily (reading a couple of properties from each entity) and into columns.
+
+Usage::
+
+  python benchmarks/decode.py [entities]
+"""
+
+import sys
+import time
+
+from gcloud.datastore import columns
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore.dataset import Dataset
+from gcloud.datastore.decoder import EntityDecoder
+from gcloud.datastore.entity import Entity
+
+
+def build_response(count):
+  response = datastore_pb.RunQueryResponse()
+  batch = response.batch
+  batch.entity_result_type = datastore_pb.EntityResult.FULL
+  batch.more_results = datastore_pb.QueryResultBatch.NO_MORE_RESULTS
+
+  for i in xrange(count):
+    entity_pb = batch.entity_result.add().entity
+    entity_pb.key.partition_id.dataset_id = 's~dataset-id'
+    entity_pb.key.path_element.add(kind='Thing', id=i + 1)
+    for n in xrange(4):
+      entity_pb.property.add(name='int%d' % n).value.integer_value = i * n
+    entity_pb.property.add(name='name').value.string_value = u'thing'
+    entity_pb.property.add(name='score').value.double_value = i / 3.0
+    entity_pb.property.add(name='active').value.boolean_value = bool(i % 2)
+    entity_pb.property.add(
+        name='created').value.timestamp_microseconds_value = i * 1000000
+    parent = entity_pb.property.add(name='parent').value.key_value
+    parent.path_element.add(kind='Parent', id=i % 100 + 1)
+
+  # Parse a serialized copy, as a real response would be.
+  return datastore_pb.RunQueryResponse.FromString(response.SerializeToString())
+
+
+def timed(name, func):
+  start = time.time()
+  results = func()
+  elapsed = time.time() - start
+  print '%-24s %7.3f s  %8.0f entities/sec' % (name, elapsed,
+                                                len(results) / elapsed)
+
+
+def main():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+  response = build_response(count)
+  dataset = Dataset('dataset-id')
+
+  timed('Entity.from_protobuf', lambda: [
+      Entity.from_protobuf(result.entity, dataset=dataset)
+      for result in response.batch.entity_result])
+  timed('EntityDecoder', lambda: EntityDecoder(dataset).decode_response(
+      response))
+
+  def lazy():
+    entities = EntityDecoder(dataset, lazy=True).decode_response(response)
+    for entity in entities:
+      entity['name'], entity['score']
+    return entities
+  timed('EntityDecoder(lazy=True)', lazy)
+  timed('columns_from_batches', lambda: columns.columns_from_batches(
+      [response.batch], dataset=dataset)[columns.KEY_COLUMN])
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,59 @@
+"""Time importing parts of gcloud.datastore in a fresh interpreter.
+
+Each import is run several times in a new process
+(Python 2 has no ``-X importtime``), and the best time is reported
+along with which of the expensive dependencies got loaded.
+
+Usage::
+
+  python benchmarks/imports.py [runs]
+"""
+
+import subprocess
+import sys
+
+MODULES = [
+    'gcloud.datastore',
+    'gcloud.datastore.key',
+    'gcloud.datastore.dataset',
+    'gcloud.datastore.entity',
+    'gcloud.datastore.helpers',
+    'gcloud.datastore.credentials',
+    'gcloud.datastore.query',
+    'gcloud.datastore.connection',
+    ]
+
+EXPENSIVE = [
+    'gcloud.datastore.datastore_v1_pb2',
+    'httplib2',
+    'oauth2client.client',
+    'pytz',
+    ]
+
+SCRIPT = """
+import sys, time
+start = time.time()
+import %s
+elapsed = time.time() - start
+print elapsed, ' '.join(name for name in %r if name in sys.modules)
+"""
+
+
+def time_import(module):
+  output = subprocess.check_output(
+      [sys.executable, '-c', SCRIPT % (module, EXPENSIVE)])
+  elapsed, _, loaded = output.strip().partition(' ')
+  return float(elapsed), loaded.split()
+
+
+def main():
+  runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+  for module in MODULES:
+    results = [time_import(module) for i in xrange(runs)]
+    elapsed = min(elapsed for elapsed, _ in results)
+    print '%-32s %6.1f ms  %s' % (module, elapsed * 1000,
+                                  ', '.join(results[0][1]) or '-')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,42 @@
+"""Measure the cost of building, hashing and encoding Keys.
+
+Usage::
+
+  python benchmarks/key.py [iterations]
+"""
+
+import sys
+import timeit
+
+from gcloud.datastore.dataset import Dataset
+from gcloud.datastore.key import Key
+
+
+def bench(name, func, iterations):
+  seconds = min(timeit.repeat(func, number=iterations, repeat=3))
+  print '%-28s %8.2f us' % (name, seconds / iterations * 1e6)
+
+
+def main():
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+  dataset = Dataset('dataset-id')
+  key = Key.from_path('Parent', 'p', 'Thing', 1234, dataset=dataset)
+  key.to_protobuf()
+
+  bench('from_path', lambda: Key.from_path('Parent', 'p', 'Thing', 1234,
+                                           dataset=dataset), iterations)
+  bench('kind().id() chain',
+        lambda: Key(dataset=dataset).kind('Thing').id(1234), iterations)
+  bench('hash', lambda: hash(key), iterations)
+  bench('to_protobuf (repeated)', key.to_protobuf, iterations)
+  bench('to_protobuf (fresh key)',
+        lambda: Key.from_path('Thing', 1234, dataset=dataset).to_protobuf(),
+        iterations)
+
+  serialized = getattr(key, 'serialized',
+                       lambda: key.to_protobuf().SerializeToString())
+  bench('serialize (repeated)', serialized, iterations)
+
+
+if __name__ == '__main__':
+  main()
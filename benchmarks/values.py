@@ -0,0 +1,71 @@
+"""Time encoding and decoding single property values with the codec registry.
+
+The ``isinstance`` chain the registry replaced is timed too, for comparison.
+
+Usage::
+
+  python benchmarks/values.py [iterations]
+"""
+
+import datetime
+import decimal
+import sys
+import time
+
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore import helpers
+from gcloud.datastore.key import Key
+
+
+def isinstance_chain(value_pb, val):
+  if isinstance(val, datetime.datetime):
+    value_pb.timestamp_microseconds_value = (
+        helpers.get_microseconds_from_datetime(val))
+  elif isinstance(val, Key):
+    value_pb.key_value.CopyFrom(val.to_protobuf())
+  elif isinstance(val, bool):
+    value_pb.boolean_value = val
+  elif isinstance(val, float):
+    value_pb.double_value = val
+  elif isinstance(val, (int, long)):
+    value_pb.integer_value = val
+  elif isinstance(val, basestring):
+    value_pb.string_value = val
+
+
+def timed(name, func, values, count):
+  start = time.time()
+  for i in xrange(count):
+    for value in values:
+      func(value)
+  elapsed = time.time() - start
+  print '%-28s %7.3f us/value' % (name, elapsed * 1e6 / (count * len(values)))
+
+
+def main():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+  helpers.register_type(decimal.Decimal, str, decimal.Decimal, meaning=101)
+
+  values = {
+      'integer': 1234,
+      'string': u'thing',
+      'boolean': True,
+      'double': 1.5,
+      'timestamp': datetime.datetime(2014, 3, 1, 12, 30),
+      'decimal': decimal.Decimal('9.99'),
+      }
+
+  for name, value in sorted(values.iteritems()):
+    value_pb = datastore_pb.Value()
+    if name != 'decimal':
+      timed('isinstance chain (%s)' % name,
+            lambda v: isinstance_chain(datastore_pb.Value(), v), [value], count)
+    timed('encode (%s)' % name,
+          lambda v: helpers.CODECS.encode(datastore_pb.Value(), v),
+          [value], count)
+    helpers.CODECS.encode(value_pb, value)
+    timed('decode (%s)' % name, helpers.CODECS.decode, [value_pb], count)
+
+
+if __name__ == '__main__':
+  main()
@@ -36,7 +36,7 @@ The main concepts with this API are:
 __version__ = '0.1.2'
 
 
-def get_connection(client_email, private_key_path):
+def get_connection(client_email, private_key_path, token_cache_path=None):
   """Shortcut method to establish a connection to the Cloud Datastore.
 
   Use this if you are going to access several datasets
@@ -55,17 +55,25 @@ def get_connection(client_email, private_key_path):
                            given to you when you created the service
                            account).
 
+  :type token_cache_path: string
+  :param token_cache_path: A file to share access tokens through
+                           with other processes on this machine
+                           (see :class:`gcloud.datastore.tokens.TokenManager`).
+
   :rtype: :class:`gcloud.datastore.connection.Connection`
   :returns: A connection defined with the proper credentials.
   """
   from connection import Connection
   from credentials import Credentials
+  from tokens import TokenManager
 
   credentials = Credentials.get_for_service_account(
       client_email, private_key_path)
-  return Connection(credentials=credentials)
+  tokens = TokenManager(credentials, cache_path=token_cache_path)
+  return Connection(credentials=tokens)
 
-def get_dataset(dataset_id, client_email, private_key_path):
+def get_dataset(dataset_id, client_email, private_key_path,
+                token_cache_path=None):
   """Shortcut method to establish a connection to a particular dataset in the Cloud Datastore.
 
   You'll generally use this as the first call to working with the API:
@@ -90,8 +98,13 @@ def get_dataset(dataset_id, client_email, private_key_path):
                            given to you when you created the service
                            account).
 
+  :type token_cache_path: string
+  :param token_cache_path: A file to share access tokens through
+                           with other processes on this machine.
+
   :rtype: :class:`gcloud.datastore.dataset.Dataset`
   :returns: A dataset with a connection using the provided credentials.
   """
-  connection = get_connection(client_email, private_key_path)
+  connection = get_connection(client_email, private_key_path,
+                              token_cache_path)
   return connection.dataset(dataset_id)
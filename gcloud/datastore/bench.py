@@ -0,0 +1,431 @@
+"""Benchmarking the client with mixed workloads.
+
+A :class:`Workload` drives a mix of gets, puts, queries and transactions
+through the public :class:`gcloud.datastore.dataset.Dataset` API
+from several threads at once,
+and reports how it went::
+
+  >>> from gcloud.datastore.bench import Workload
+  >>> from gcloud.datastore.emulator import Emulator
+  >>> workload = Workload(Emulator().dataset('bench'), key_count=1000)
+  >>> workload.populate()
+  >>> report = workload.run(operations=10000, concurrency=8)
+  >>> report['throughput'], report['latency_ms']['p99']
+  (2650.1, 9.8)
+
+By default it runs against an in-process
+:class:`gcloud.datastore.emulator.Emulator`,
+so what's measured is the client
+(encoding, decoding, batching and locking)
+rather than the network
+(unless a network is simulated, with ``--latency`` and the like;
+see :mod:`gcloud.datastore.network`).
+Reports are JSON, to compare one version of the client with another::
+
+  $ python -m gcloud.datastore.bench --operations=20000 --concurrency=8 \\
+      --mix=get:70,put:20,query:10 --distribution=zipf > before.json
+"""
+
+import bisect
+import json
+import optparse
+import random
+import sys
+import time
+
+try:
+  import resource
+except ImportError:
+  resource = None  # CPU time and memory just aren't reported.
+
+import gcloud
+from gcloud.datastore.connection import RequestError
+from gcloud.datastore.key import Key
+from gcloud.datastore.workers import WorkerPool
+
+
+OPERATIONS = ('get', 'put', 'query', 'transaction')
+"""The kinds of operation a workload can mix."""
+
+DISTRIBUTIONS = ('uniform', 'zipf', 'sequential')
+"""How the keys operated on are chosen."""
+
+DEFAULT_MIX = {'get': 50, 'put': 30, 'query': 15, 'transaction': 5}
+"""The default relative weight of each operation."""
+
+PERCENTILES = (50, 95, 99)
+"""The latency percentiles reported."""
+
+
+def parse_mix(text):
+  """Parse a mix of operations like ``get:70,put:20,query:10``.
+
+  :type text: string
+  :param text: Comma-separated ``operation:weight`` pairs.
+
+  :rtype: dict
+  :returns: A map of operation to weight.
+  """
+  mix = {}
+  for part in text.split(','):
+    operation, _, weight = part.partition(':')
+    operation = operation.strip()
+    if operation not in OPERATIONS:
+      raise ValueError('Unknown operation %r (expected one of %s).' %
+                       (operation, ', '.join(OPERATIONS)))
+    try:
+      mix[operation] = float(weight)
+    except ValueError:
+      raise ValueError('Bad weight for %s: %r.' % (operation, weight))
+  return mix
+
+
+def _percentile(ordered, percent):
+  """Get a percentile of a sorted list (by nearest rank)."""
+  if not ordered:
+    return None
+  rank = int(round(len(ordered) * percent / 100.0))
+  return ordered[max(rank, 1) - 1]
+
+
+def _summarize(latencies):
+  ordered = sorted(latencies)
+  summary = {}
+  for percent in PERCENTILES:
+    value = _percentile(ordered, percent)
+    summary['p%d' % percent] = None if value is None else value * 1000
+  summary['mean'] = (sum(ordered) * 1000 / len(ordered)) if ordered else None
+  summary['max'] = ordered[-1] * 1000 if ordered else None
+  return summary
+
+
+def _cpu_seconds():
+  if resource is None:
+    return None
+  usage = resource.getrusage(resource.RUSAGE_SELF)
+  return usage.ru_utime + usage.ru_stime
+
+
+def _peak_memory_kb():
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports kilobytes, but Mac OS X reports bytes.
+  return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class _KeyChooser(object):
+  """Picks the IDs of the entities to operate on."""
+
+  ZIPF_EXPONENT = 1.1
+
+  def __init__(self, key_count, distribution, rng):
+    if distribution not in DISTRIBUTIONS:
+      raise ValueError('Unknown distribution %r (expected one of %s).' %
+                       (distribution, ', '.join(DISTRIBUTIONS)))
+    self._key_count = key_count
+    self._distribution = distribution
+    self._random = rng
+    self._next = rng.randint(0, key_count - 1)
+
+    if distribution == 'zipf':
+      # A few hot keys, scattered over the key space.
+      total = 0
+      self._cumulative = []
+      for rank in xrange(1, key_count + 1):
+        total += 1.0 / rank ** self.ZIPF_EXPONENT
+        self._cumulative.append(total)
+      self._ids = range(1, key_count + 1)
+      random.Random(key_count).shuffle(self._ids)
+
+  def __call__(self):
+    if self._distribution == 'uniform':
+      return self._random.randint(1, self._key_count)
+    elif self._distribution == 'sequential':
+      self._next = (self._next + 1) % self._key_count
+      return self._next + 1
+    point = self._random.random() * self._cumulative[-1]
+    index = bisect.bisect_left(self._cumulative, point)
+    return self._ids[min(index, self._key_count - 1)]
+
+
+class Workload(object):
+  """A mix of operations on a kind of entity.
+
+  :type dataset: :class:`gcloud.datastore.dataset.Dataset`
+  :param dataset: The dataset to operate on.
+
+  :type mix: dict
+  :param mix: The relative weight of each of :data:`OPERATIONS`
+              (see :data:`DEFAULT_MIX`).
+
+  :type key_count: integer
+  :param key_count: The number of entities operated on.
+
+  :type distribution: string
+  :param distribution: How keys are chosen: one of :data:`DISTRIBUTIONS`.
+
+  :type entity_bytes: integer
+  :param entity_bytes: The approximate size of each entity's properties.
+
+  :type query_limit: integer
+  :param query_limit: The most entities each query fetches.
+
+  :type seed: integer
+  :param seed: A seed for the random choices, to make runs repeatable
+               (with a concurrency of 1).
+
+  :type kind: string
+  :param kind: The kind of entity to operate on.
+  """
+
+  GROUPS = 100
+  """The number of distinct values of the indexed property queried on."""
+
+  def __init__(self, dataset, mix=None, key_count=1000,
+               distribution='uniform', entity_bytes=200, query_limit=20,
+               seed=None, kind='BenchEntity'):
+    mix = DEFAULT_MIX if mix is None else mix
+    for operation in mix:
+      if operation not in OPERATIONS:
+        raise ValueError('Unknown operation %r.' % operation)
+    if not any(weight > 0 for weight in mix.values()):
+      raise ValueError('At least one operation needs a positive weight.')
+    if key_count < 1:
+      raise ValueError('The key count must be at least 1.')
+    _KeyChooser(1, distribution, random.Random())  # Check it's known.
+
+    self._dataset = dataset
+    self._operations = [operation for operation in OPERATIONS
+                        if mix.get(operation, 0) > 0]
+    self._cumulative = []
+    total = 0
+    for operation in self._operations:
+      total += mix[operation]
+      self._cumulative.append(total)
+
+    self._key_count = key_count
+    self._distribution = distribution
+    self._entity_bytes = entity_bytes
+    self._query_limit = query_limit
+    self._seed = seed
+    self._kind = kind
+    self._config = {
+        'mix': dict((operation, mix[operation])
+                    for operation in self._operations),
+        'key_count': key_count, 'distribution': distribution,
+        'entity_bytes': entity_bytes, 'query_limit': query_limit,
+        }
+
+  def _key(self, id):
+    return Key(dataset=self._dataset, path=[{'kind': self._kind, 'id': id}])
+
+  def _entity(self, id, rng):
+    entity = self._dataset.entity(self._kind).key(self._key(id))
+    entity['group'] = id % self.GROUPS
+    entity['score'] = rng.random()
+    entity['updated'] = time.time()
+    entity['payload'] = u'x' * max(self._entity_bytes - 40, 0)
+    return entity.exclude_from_indexes('payload')
+
+  def populate(self, batch_size=500):
+    """Save every entity the workload operates on.
+
+    :type batch_size: integer
+    :param batch_size: The number of entities to save per commit.
+    """
+    rng = random.Random(self._seed)
+    for start in xrange(1, self._key_count + 1, batch_size):
+      stop = min(start + batch_size, self._key_count + 1)
+      self._dataset.put_entities(
+          [self._entity(id, rng) for id in xrange(start, stop)])
+
+  def _get(self, choose_key, rng):
+    self._dataset.get_entity(self._key(choose_key()))
+
+  def _put(self, choose_key, rng):
+    self._entity(choose_key(), rng).save()
+
+  def _query(self, choose_key, rng):
+    query = self._dataset.query(self._kind).filter(
+        'group =', choose_key() % self.GROUPS)
+    query.fetch(self._query_limit)
+
+  def _transaction(self, choose_key, rng):
+    # Move some score from one entity to another.
+    with self._dataset.transaction():
+      ids = set([choose_key(), choose_key()])
+      entities = self._dataset.get_entities([self._key(id) for id in ids])
+      for entity in entities:
+        entity['score'] = rng.random()
+      self._dataset.put_entities(entities)
+
+  def _worker(self, index, operations, results):
+    seed = None if self._seed is None else self._seed + index
+    rng = random.Random(seed)
+    choose_key = _KeyChooser(self._key_count, self._distribution, rng)
+    handlers = {'get': self._get, 'put': self._put,
+                'query': self._query, 'transaction': self._transaction}
+    latencies = dict((operation, []) for operation in self._operations)
+    errors = dict((operation, 0) for operation in self._operations)
+
+    for _ in xrange(operations):
+      point = rng.random() * self._cumulative[-1]
+      operation = self._operations[
+          bisect.bisect_right(self._cumulative, point)]
+      start = time.time()
+      try:
+        handlers[operation](choose_key, rng)
+      except RequestError:
+        # Transaction conflicts, for the most part.
+        errors[operation] += 1
+        continue
+      latencies[operation].append(time.time() - start)
+
+    results[index] = (latencies, errors)
+
+  def run(self, operations=10000, concurrency=1):
+    """Run the workload and report on it.
+
+    :type operations: integer
+    :param operations: The total number of operations to perform.
+
+    :type concurrency: integer
+    :param concurrency: The number of threads performing them.
+
+    :rtype: dict
+    :returns: A JSON-friendly report with the throughput (operations/s),
+              latency percentiles (in milliseconds),
+              CPU time per operation (for the whole process)
+              and the peak memory use of the process (in kilobytes),
+              overall and for each operation.
+    """
+    if concurrency < 1:
+      raise ValueError('The concurrency must be at least 1.')
+
+    shares = [operations // concurrency] * concurrency
+    for i in range(operations % concurrency):
+      shares[i] += 1
+    results = [None] * concurrency
+
+    pool = WorkerPool(max_workers=concurrency)
+    cpu_before = _cpu_seconds()
+    start = time.time()
+    try:
+      pool.map(lambda i: self._worker(i, shares[i], results),
+               range(concurrency))
+    finally:
+      pool.close()
+    seconds = time.time() - start
+    cpu_after = _cpu_seconds()
+
+    by_operation = {}
+    all_latencies = []
+    total_errors = 0
+    for operation in self._operations:
+      latencies = []
+      errors = 0
+      for worker_latencies, worker_errors in results:
+        latencies.extend(worker_latencies[operation])
+        errors += worker_errors[operation]
+      all_latencies.extend(latencies)
+      total_errors += errors
+      by_operation[operation] = {'count': len(latencies), 'errors': errors,
+                                 'latency_ms': _summarize(latencies)}
+
+    cpu_per_operation = None
+    if cpu_before is not None and operations:
+      cpu_per_operation = (cpu_after - cpu_before) / operations
+
+    config = dict(self._config, operations=operations,
+                  concurrency=concurrency)
+    return {
+        'version': gcloud.__version__,
+        'config': config,
+        'operations': operations,
+        'errors': total_errors,
+        'seconds': seconds,
+        'throughput': operations / seconds if seconds else None,
+        'latency_ms': _summarize(all_latencies),
+        'cpu_seconds_per_operation': cpu_per_operation,
+        'peak_memory_kb': _peak_memory_kb(),
+        'by_operation': by_operation,
+        }
+
+
+def main(argv=None):
+  """Run a workload against the emulator and print the report as JSON."""
+  parser = optparse.OptionParser(
+      usage='python -m gcloud.datastore.bench [options]')
+  parser.add_option('--operations', type='int', default=10000)
+  parser.add_option('--concurrency', type='int', default=1,
+                    help='The number of threads.')
+  parser.add_option('--mix', default='get:50,put:30,query:15,transaction:5',
+                    help='The weight of each operation.')
+  parser.add_option('--keys', type='int', default=1000,
+                    help='The number of entities.')
+  parser.add_option('--distribution', choices=DISTRIBUTIONS,
+                    default='uniform', help=', '.join(DISTRIBUTIONS) + '.')
+  parser.add_option('--entity-bytes', type='int', default=200)
+  parser.add_option('--query-limit', type='int', default=20)
+  parser.add_option('--batch-size', type='int', default=1000,
+                    help='The most results the emulator returns per query.')
+  parser.add_option('--seed', type='int')
+  parser.add_option('--latency', type='float', default=0,
+                    help='The median round-trip time (seconds) to simulate.')
+  parser.add_option('--jitter', type='float', default=0,
+                    help='The most extra latency (seconds) to simulate.')
+  parser.add_option('--bandwidth', type='int',
+                    help='The bytes per second to simulate.')
+  parser.add_option('--connection-setup', type='float', default=0,
+                    help='The seconds to simulate opening a connection.')
+  parser.add_option('--max-connections', type='int',
+                    help='The most connections to simulate at once.')
+  parser.add_option('--error-rate', type='float', default=0,
+                    help='The fraction of requests to fail.')
+  options, args = parser.parse_args(argv)
+  if args:
+    parser.error('Unexpected arguments: %s' % ' '.join(args))
+
+  # These imports are here so the emulator is only loaded when it's needed.
+  from gcloud.datastore.connection import Connection
+  from gcloud.datastore.emulator import Emulator
+  from gcloud.datastore import network
+
+  try:
+    mix = parse_mix(options.mix)
+  except ValueError, e:
+    parser.error(str(e))
+
+  emulator = Emulator(batch_size=options.batch_size)
+  connection = Connection(backend=emulator)
+  dataset = connection.dataset('bench')
+  workload = Workload(dataset, mix=mix, key_count=options.keys,
+                      distribution=options.distribution,
+                      entity_bytes=options.entity_bytes,
+                      query_limit=options.query_limit, seed=options.seed)
+  # Populate straight through the emulator,
+  # so only the measured operations see the simulated network.
+  workload.populate()
+
+  simulated = dict((name, getattr(options, name)) for name in (
+      'latency', 'jitter', 'bandwidth', 'connection_setup', 'max_connections',
+      'error_rate'))
+  if any(simulated.values()):
+    connection.backend(network.NetworkBackend(
+        emulator, latency=network.lognormal(options.latency, 0.25),
+        jitter=options.jitter, bandwidth=options.bandwidth,
+        connection_setup=options.connection_setup,
+        max_connections=options.max_connections,
+        error_rate=options.error_rate, seed=options.seed))
+  report = workload.run(operations=options.operations,
+                        concurrency=options.concurrency)
+  report['config']['batch_size'] = options.batch_size
+  if any(simulated.values()):
+    report['config']['network'] = simulated
+  json.dump(report, sys.stdout, indent=2, sort_keys=True)
+  print
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,203 @@
+"""An in-process cache of entities read from the Cloud Datastore.
+
+Give a :class:`gcloud.datastore.connection.Connection` an :class:`EntityCache`
+and repeated lookups of the same keys are answered from memory::
+
+  >>> from gcloud.datastore.cache import EntityCache
+  >>> from gcloud.datastore.connection import Connection
+  >>> connection = Connection(credentials, cache=EntityCache(max_size=10000))
+  >>> dataset = connection.dataset('dataset-id')
+  >>> dataset.get_entity(key)  # Sends a lookup request.
+  <Entity object>
+  >>> dataset.get_entity(key)  # Doesn't.
+  <Entity object>
+
+The cache is filled by lookups and by the results of (non-projection) queries,
+and entries are dropped whenever the connection commits a mutation
+touching their keys
+(that is, when saving or deleting entities, or committing a transaction).
+
+Reads made inside a transaction always go to the Cloud Datastore
+(and don't fill the cache).
+
+A read which was already in flight when an entity was invalidated
+could return the entity as it was before the commit,
+so reads note the cache's :func:`EntityCache.generation` when they start,
+and :func:`EntityCache.put` ignores results
+for keys invalidated since then.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from gcloud.datastore import helpers
+
+
+class EntityCache(object):
+  """A thread-safe LRU cache of Entity protobufs.
+
+  Entries are keyed on the dataset ID and the key's path
+  (see :func:`gcloud.datastore.helpers.get_key_path`).
+
+  .. warning::
+    The protobufs handed out are shared with the cache,
+    so they must not be modified.
+
+  :type max_size: integer
+  :param max_size: The maximum number of entities to keep.
+                   When full, the least recently used entity is evicted.
+
+  :type ttl: integer or float
+  :param ttl: The number of seconds an entity stays fresh.
+              If ``None``, entities stay until evicted or invalidated.
+  """
+
+  def __init__(self, max_size=1000, ttl=None):
+    self._max_size = max_size
+    self._ttl = ttl
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+    self._hits = 0
+    self._misses = 0
+    self._evictions = 0
+
+    # Each invalidation gets the next epoch, which is remembered for
+    # (up to max_size of) the keys most recently invalidated.
+    # Results of reads which started before the floor are all ignored,
+    # since the invalidations they might have missed were forgotten.
+    self._epoch = 0
+    self._invalidated = OrderedDict()
+    self._floor = 0
+
+  @staticmethod
+  def _cache_key(dataset_id, key_pb):
+    # The API prefixes dataset IDs with 's~' on keys it returns.
+    if dataset_id and dataset_id.startswith('s~'):
+      dataset_id = dataset_id[2:]
+    return dataset_id, helpers.get_key_path(key_pb)
+
+  def get(self, dataset_id, key_pb):
+    """Get a cached entity.
+
+    :type dataset_id: string
+    :param dataset_id: The ID of the dataset holding the entity.
+
+    :type key_pb: :class:`gcloud.datastore.datastore_v1_pb2.Key`
+    :param key_pb: The key of the entity.
+
+    :rtype: :class:`gcloud.datastore.datastore_v1_pb2.Entity` or ``None``
+    :returns: The cached entity, or ``None`` if it's not cached (or stale).
+    """
+    cache_key = self._cache_key(dataset_id, key_pb)
+    with self._lock:
+      entry = self._entries.pop(cache_key, None)
+
+      if entry is not None and (entry[1] is None or entry[1] > time.time()):
+        self._entries[cache_key] = entry  # Move to the most recent end.
+        self._hits += 1
+        return entry[0]
+
+      self._misses += 1
+
+  def generation(self):
+    """Get the current generation of the cache, for :func:`put`.
+
+    Take this before sending the request whose results will be cached.
+
+    :rtype: integer
+    """
+    return self._epoch
+
+  def put(self, dataset_id, entity_pb, generation=None):
+    """Add an entity to the cache (replacing any existing entry).
+
+    :type dataset_id: string
+    :param dataset_id: The ID of the dataset holding the entity.
+
+    :type entity_pb: :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+    :param entity_pb: The entity to cache.
+
+    :type generation: integer
+    :param generation: The :func:`generation` when the entity was read.
+                       If the entity has been invalidated since then,
+                       it may be out of date, so isn't cached.
+    """
+    cache_key = self._cache_key(dataset_id, entity_pb.key)
+    expires = time.time() + self._ttl if self._ttl is not None else None
+
+    with self._lock:
+      if generation is not None and (
+          generation < self._floor or
+          self._invalidated.get(cache_key, 0) > generation):
+        return
+
+      self._entries.pop(cache_key, None)
+      self._entries[cache_key] = (entity_pb, expires)
+
+      while len(self._entries) > self._max_size:
+        self._entries.popitem(last=False)
+        self._evictions += 1
+
+  def invalidate(self, dataset_id, key_pb):
+    """Drop an entity from the cache.
+
+    :type dataset_id: string
+    :param dataset_id: The ID of the dataset holding the entity.
+
+    :type key_pb: :class:`gcloud.datastore.datastore_v1_pb2.Key`
+    :param key_pb: The key of the entity to drop.
+    """
+    cache_key = self._cache_key(dataset_id, key_pb)
+    with self._lock:
+      self._entries.pop(cache_key, None)
+
+      self._epoch += 1
+      self._invalidated.pop(cache_key, None)
+      self._invalidated[cache_key] = self._epoch
+      while len(self._invalidated) > self._max_size:
+        _, epoch = self._invalidated.popitem(last=False)
+        self._floor = max(self._floor, epoch)
+
+  def invalidate_mutation(self, dataset_id, mutation_pb):
+    """Drop every entity touched by a mutation from the cache.
+
+    :type dataset_id: string
+    :param dataset_id: The ID of the dataset the mutation applies to.
+
+    :type mutation_pb: :class:`gcloud.datastore.datastore_v1_pb2.Mutation`
+    :param mutation_pb: The mutation being committed.
+    """
+    for entity_pbs in (mutation_pb.upsert, mutation_pb.update,
+                       mutation_pb.insert):
+      for entity_pb in entity_pbs:
+        self.invalidate(dataset_id, entity_pb.key)
+
+    for key_pb in mutation_pb.delete:
+      self.invalidate(dataset_id, key_pb)
+
+  def clear(self):
+    """Drop every entity from the cache."""
+    with self._lock:
+      self._entries.clear()
+      # Reads in flight may be older than whatever prompted this.
+      self._epoch += 1
+      self._floor = self._epoch
+      self._invalidated.clear()
+
+  def stats(self):
+    """Get statistics about how well the cache is doing.
+
+    >>> cache.stats()
+    {'size': 120, 'hits': 5630, 'misses': 120, 'evictions': 0}
+
+    :rtype: dict
+    :returns: The number of entities cached,
+              and the number of hits, misses and evictions so far.
+    """
+    with self._lock:
+      return {'size': len(self._entries), 'hits': self._hits,
+              'misses': self._misses, 'evictions': self._evictions}
+
+  def __len__(self):
+    return len(self._entries)
@@ -0,0 +1,239 @@
+"""Decoding query results into columns rather than entities.
+
+Analytic reads usually want one array per property,
+not one dictionary per entity.
+A :class:`ColumnBuilder` goes straight from result batches to columns,
+without building an :class:`gcloud.datastore.entity.Entity` for every row::
+
+  >>> columns = query.fetch_columns()
+  >>> columns['age']
+  masked_array(data=[31, 25, --], mask=[False, False, True], ...)
+  >>> columns['__key__']
+  array([<Key[...]>, <Key[...]>, <Key[...]>], dtype=object)
+
+If `NumPy <http://www.numpy.org/>`_ is installed,
+each column is a :class:`numpy.ma.MaskedArray`,
+masked wherever an entity doesn't have the property (or it's null):
+
+- integers, doubles and booleans are ``int64``, ``float64`` and ``bool``,
+- timestamps are ``datetime64[us]`` (in UTC),
+- a column mixing integers and doubles is ``float64``,
+- anything else (strings, keys and mixed columns) is an ``object`` array.
+
+Without NumPy, each column is a list of Python values, with ``None`` for nulls.
+
+Columns can also be turned into a `pandas <http://pandas.pydata.org/>`_
+DataFrame (see :func:`to_dataframe`).
+"""
+
+from itertools import izip
+
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore import helpers
+from gcloud.datastore.decoder import EntityDecoder
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+KEY_COLUMN = '__key__'
+"""The name of the column holding each entity's key."""
+
+_FIELDS = datastore_pb.Value.DESCRIPTOR.fields_by_name
+_BOOLEAN = _FIELDS['boolean_value']
+_INTEGER = _FIELDS['integer_value']
+_DOUBLE = _FIELDS['double_value']
+_TIMESTAMP = _FIELDS['timestamp_microseconds_value']
+
+_DTYPES = {
+    _BOOLEAN: 'bool',
+    _INTEGER: 'int64',
+    _DOUBLE: 'float64',
+    _TIMESTAMP: 'int64',  # Viewed as datetime64[us] once filled.
+    }
+
+
+class ColumnBuilder(object):
+  """Accumulates query results into per-property columns.
+
+  Add as many batches as you like with :func:`add_batch`,
+  then get the columns with :func:`columns`.
+
+  :type dataset: :class:`gcloud.datastore.dataset.Dataset`
+  :param dataset: The dataset to attach to the keys decoded.
+  """
+
+  def __init__(self, dataset=None):
+    decoder = EntityDecoder(dataset)
+    self._decode_key = decoder.decode_key
+    self._keys = []
+    # Each property maps value fields to the rows and values seen for them,
+    # so that columns only have to be typed once all the rows are in.
+    self._properties = {}
+    # The group each property was last added to, for the common case
+    # of a property always having the same type.
+    self._recent = {}
+
+    # Scalars are kept as they are until the column is built.
+    self._converters = {
+        _BOOLEAN: None,
+        _INTEGER: None,
+        _DOUBLE: None,
+        _TIMESTAMP: None,
+        _FIELDS['string_value']: None,
+        _FIELDS['blob_value']: None,
+        _FIELDS['blob_key_value']: None,
+        _FIELDS['key_value']: self._decode_key,
+        }
+
+  def __len__(self):
+    return len(self._keys)
+
+  def add_batch(self, batch):
+    """Add the results in a batch as new rows.
+
+    :type batch: :class:`gcloud.datastore.datastore_v1_pb2.QueryResultBatch`
+    :param batch: The batch returned by the API.
+    """
+    decode_key = self._decode_key
+    recent = self._recent
+    keys = self._keys
+
+    for result in batch.entity_result:
+      entity_pb = result.entity
+      row = len(keys)
+      keys.append(decode_key(entity_pb.key))
+
+      for property_pb in entity_pb.property:
+        fields = property_pb.value.ListFields()
+        if not fields:
+          continue
+
+        group = recent.get(property_pb.name)
+        if group is None or group[0] is not fields[0][0]:
+          self._add_value(row, property_pb.name, fields)
+          continue
+
+        field, add_row, add_value, converter = group
+        add_row(row)
+        if converter is None:
+          add_value(fields[0][1])
+        else:
+          add_value(converter(fields[0][1]))
+
+  def _add_value(self, row, name, fields):
+    """Add a value to a column, the slow way."""
+    for field, value in fields:
+      if field in self._converters:
+        break
+    else:
+      return  # A null, or a type that isn't supported yet.
+
+    groups = self._properties.setdefault(name, {})
+    if field not in groups:
+      groups[field] = ([], [])
+    rows, values = groups[field]
+    converter = self._converters[field]
+    self._recent[name] = (field, rows.append, values.append, converter)
+
+    rows.append(row)
+    values.append(value if converter is None else converter(value))
+
+  def columns(self):
+    """Get the columns for every row added so far.
+
+    :rtype: dict
+    :returns: A column for each property,
+              plus the keys (in :data:`KEY_COLUMN`).
+    """
+    count = len(self._keys)
+    columns = {}
+    for name, groups in self._properties.iteritems():
+      columns[name] = self._build_column(groups, count)
+
+    if numpy is not None:
+      keys = numpy.empty(count, dtype=object)
+      keys[:] = self._keys
+    else:
+      keys = list(self._keys)
+    columns[KEY_COLUMN] = keys
+    return columns
+
+  @staticmethod
+  def _build_column(groups, count):
+    fields = set(groups)
+    if len(fields) == 1:
+      dtype = _DTYPES.get(fields.pop())
+    elif fields == set([_INTEGER, _DOUBLE]):
+      dtype = 'float64'
+    else:
+      dtype = None
+
+    if numpy is None:
+      column = [None] * count
+      for field, (rows, values) in groups.iteritems():
+        if field is _TIMESTAMP:
+          values = map(helpers.get_datetime_from_microseconds, values)
+        for row, value in izip(rows, values):
+          column[row] = value
+      return column
+
+    if dtype is None:
+      column = numpy.empty(count, dtype=object)
+      for field, (rows, values) in groups.iteritems():
+        if field is _TIMESTAMP:
+          values = map(helpers.get_datetime_from_microseconds, values)
+        column[rows] = values
+    else:
+      column = numpy.zeros(count, dtype=dtype)
+      for rows, values in groups.itervalues():
+        column[rows] = values
+      if _TIMESTAMP in groups:
+        column = column.view('datetime64[us]')
+
+    mask = numpy.ones(count, dtype=bool)
+    for rows, _ in groups.itervalues():
+      mask[rows] = False
+    return numpy.ma.MaskedArray(column, mask=mask)
+
+
+def columns_from_batches(batches, dataset=None):
+  """Decode result batches into columns.
+
+  :type batches: iterable of
+                 :class:`gcloud.datastore.datastore_v1_pb2.QueryResultBatch`
+  :param batches: The batches returned by the API.
+
+  :type dataset: :class:`gcloud.datastore.dataset.Dataset`
+  :param dataset: The dataset to attach to the keys decoded.
+
+  :rtype: dict
+  :returns: See :func:`ColumnBuilder.columns`.
+  """
+  builder = ColumnBuilder(dataset)
+  for batch in batches:
+    builder.add_batch(batch)
+  return builder.columns()
+
+
+def to_dataframe(columns):
+  """Convert columns into a pandas DataFrame.
+
+  Masked values become ``NaN`` (or ``NaT`` for timestamps),
+  so integer and boolean columns with nulls become floats or objects.
+
+  :type columns: dict
+  :param columns: Columns, as returned by :func:`ColumnBuilder.columns`.
+
+  :rtype: :class:`pandas.DataFrame`
+  :returns: A DataFrame with the keys as its first column
+            and a column per property (sorted by name) after that.
+
+  :raises: ImportError if pandas isn't installed.
+  """
+  import pandas
+
+  names = sorted(name for name in columns if name != KEY_COLUMN)
+  return pandas.DataFrame(columns, columns=[KEY_COLUMN] + names)
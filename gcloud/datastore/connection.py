@@ -1,19 +1,179 @@
-import httplib2
+import threading
+import time
 
 from gcloud.datastore import datastore_v1_pb2 as datastore_pb
 from gcloud.datastore import helpers
 from gcloud.datastore.dataset import Dataset
+from gcloud.datastore.pool import HttpPool
+from gcloud.datastore.workers import Future
+from gcloud.datastore.workers import WorkerPool
 from gcloud.datastore.transaction import Transaction
 
 
+class RequestError(Exception):
+  """Raised when the API responds to a request with an error.
+
+  :type method: string
+  :param method: The API method called (``lookup``, ``commit`` and so on).
+
+  :type status: integer
+  :param status: The HTTP status of the response.
+
+  :type content: string
+  :param content: The body of the response.
+  """
+
+  def __init__(self, method, status, content):
+    super(RequestError, self).__init__(
+        'Request failed. Error was: %s' % content)
+    self.method = method
+    self.status = status
+    self.content = content
+
+
+def _mutation_count(mutation_pb):
+  return (len(mutation_pb.upsert) + len(mutation_pb.update) +
+          len(mutation_pb.insert) + len(mutation_pb.insert_auto_id) +
+          len(mutation_pb.delete))
+
+
+# How to count the entities (or keys) an RPC handled.
+_ENTITY_COUNTS = {
+    'lookup': lambda request_pb, response_pb: len(response_pb.found),
+    'runQuery': lambda request_pb, response_pb: len(
+        response_pb.batch.entity_result),
+    'commit': lambda request_pb, response_pb: _mutation_count(
+        request_pb.mutation),
+    'allocateIds': lambda request_pb, response_pb: len(request_pb.key),
+    }
+
+
+class RpcStats(object):
+  """What happened during a single RPC, as reported to listeners.
+
+  See :func:`Connection.add_listener`.
+
+  :type dataset_id: string
+  :param dataset_id: The dataset the request was made to.
+
+  :type method: string
+  :param method: The API method called (``lookup``, ``commit`` and so on).
+  """
+
+  def __init__(self, dataset_id, method):
+    self.dataset_id = dataset_id
+    self.method = method
+
+    self.serialize_seconds = 0.0
+    """Time spent serializing the request."""
+
+    self.wire_seconds = 0.0
+    """Time spent sending the request and waiting for the response."""
+
+    self.parse_seconds = 0.0
+    """Time spent parsing the response."""
+
+    self.request_bytes = 0
+    self.response_bytes = 0
+
+    self.entities = 0
+    """The number of entities (or keys) looked up, returned or committed."""
+
+    self.status = None
+    """The HTTP status of the response
+    (or ``None`` if there wasn't one)."""
+
+    self.error = None
+    """The exception raised, if the RPC failed."""
+
+  def total_seconds(self):
+    """Get the total time the RPC took.
+
+    :rtype: float
+    """
+    return self.serialize_seconds + self.wire_seconds + self.parse_seconds
+
+
+class HttpBackend(object):
+  """Sends requests to the Cloud Datastore API over HTTP.
+
+  This is the backend every :class:`Connection` uses
+  unless it's given another one (see :func:`Connection.backend`).
+  A backend only has to provide :func:`request`,
+  so anything with the same method
+  (such as :class:`gcloud.datastore.emulator.Emulator`)
+  can stand in for the real API.
+
+  :type connection: :class:`Connection`
+  :param connection: The connection whose HTTP transports
+                     (see :attr:`Connection.http`) to use.
+  """
+
+  def __init__(self, connection):
+    self._connection = connection
+
+  def request(self, dataset_id, method, data):
+    """Make a request to the Cloud Datastore API.
+
+    :type dataset_id: string
+    :param dataset_id: The ID of the dataset of which to make the request.
+
+    :type method: string
+    :param method: The API call method name (ie, ``runQuery``, ``lookup``, etc)
+
+    :type data: string
+    :param data: The serialized request protobuf.
+
+    :rtype: string
+    :returns: The serialized response protobuf.
+
+    :raises: :class:`RequestError` if the response code is not 200 OK.
+    """
+    headers = {
+        'Content-Type': 'application/x-protobuf',
+        'Content-Length': str(len(data)),
+        }
+    headers, content = self._connection.http.request(
+        uri=self._connection.build_api_url(dataset_id=dataset_id,
+                                           method=method),
+        method='POST', headers=headers, body=data)
+
+    if headers['status'] != '200':
+      raise RequestError(method, int(headers['status']), content)
+
+    return content
+
+
 class Connection(object):
   """A connection to the Google Cloud Datastore via the Protobuf API.
 
   This class should understand only the basic types (and protobufs)
   in method arguments, however should be capable of returning advanced types.
 
+  A single connection can be shared between many threads.
+  Requests are sent over a pool of keep-alive HTTP transports
+  (see :class:`gcloud.datastore.pool.HttpPool`)
+  and the current transaction is tracked per thread.
+
   :type credentials: :class:`gcloud.datastore.credentials.Credentials`
   :param credentials: The OAuth2 Credentials to use for this connection.
+
+  :type max_connections: integer
+  :param max_connections: The maximum number of HTTP connections
+                          to keep open at once.
+                          Defaults to ``MAX_CONNECTIONS``.
+
+  :type idle_timeout: integer or float
+  :param idle_timeout: The number of seconds after which an unused
+                       HTTP connection is closed.
+                       Defaults to ``IDLE_TIMEOUT``.
+
+  :type cache: :class:`gcloud.datastore.cache.EntityCache`
+  :param cache: An optional cache for entities read over this connection.
+
+  :type backend: object
+  :param backend: Where to send requests (see :func:`backend`).
+                  Defaults to the Cloud Datastore API, over HTTP.
   """
 
   API_BASE_URL = 'https://www.googleapis.com'
@@ -26,29 +186,172 @@ class Connection(object):
                       '/datasets/{dataset_id}/{method}')
   """A template used to craft the URL pointing toward a particular API call."""
 
+  MAX_CONNECTIONS = 10
+  """The default maximum number of pooled HTTP connections."""
+
+  IDLE_TIMEOUT = 60
+  """The default number of seconds to keep an idle HTTP connection open."""
+
+  MAX_LOOKUP_KEYS = 1000
+  """The maximum number of keys to send in a single lookup request."""
+
+  MAX_LOOKUP_ROUNDS = 5
+  """The most times to request keys which the API keeps deferring."""
+
+  LOOKUP_RETRY_DELAY = 0.05
+  """Seconds to wait before requesting deferred keys again (then doubled)."""
+
+  MAX_COMMIT_ENTITIES = 500
+  """The maximum number of entities the API accepts in a single commit."""
+
+  MAX_COMMIT_BYTES = 10 * 1024 * 1024
+  """The maximum size of a commit request the API accepts."""
+
+  COMMIT_ENTITY_OVERHEAD = 8
+  """Bytes added to each entity's (or key's) size for its framing in a commit."""
+
   _EMPTY = object()
   """A pointer to represent an empty value for default arguments."""
 
-  def __init__(self, credentials=None):
+  def __init__(self, credentials=None, max_connections=None,
+               idle_timeout=None, cache=None, backend=None):
     self._credentials = credentials
-    self._current_transaction = None
+    self._cache = cache
+    self._max_connections = max_connections or self.MAX_CONNECTIONS
+    self._idle_timeout = idle_timeout or self.IDLE_TIMEOUT
+    self._local = threading.local()
     self._http = None
+    self._http_lock = threading.Lock()
+    # Used to send the pieces of a large request side by side.
+    self._fan_out = WorkerPool(max_workers=self._max_connections)
+    self._index_updates = 0
+    self._index_updates_lock = threading.Lock()
+    self._listeners = ()
+    self._backend = backend or HttpBackend(self)
 
   @property
   def http(self):
     """A getter for the HTTP transport used in talking to the API.
 
-    :rtype: :class:`httplib2.Http`
-    :returns: A Http object used to transport data.
+    This is a pool of authorized :class:`httplib2.Http` objects
+    which can be used concurrently from many threads.
+
+    :rtype: :class:`gcloud.datastore.pool.HttpPool`
+    :returns: A pool of Http objects used to transport data.
     """
     if not self._http:
-      self._http = httplib2.Http()
-      if self._credentials:
-        self._http = self._credentials.authorize(self._http)
+      with self._http_lock:
+        if not self._http:
+          self._http = HttpPool(self._make_http,
+                                max_connections=self._max_connections,
+                                idle_timeout=self._idle_timeout)
     return self._http
 
+  def _make_http(self):
+    """Build a new HTTP transport for the pool.
+
+    :rtype: :class:`httplib2.Http`
+    :returns: An Http object, authorized with our credentials (if any).
+    """
+    # This import is here so httplib2 is only loaded when it's needed.
+    import httplib2
+
+    http = httplib2.Http()
+    if self._credentials:
+      http = self._credentials.authorize(http)
+    return http
+
+  def cache(self):
+    """Get the entity cache used by this connection.
+
+    :rtype: :class:`gcloud.datastore.cache.EntityCache` or ``None``
+    :returns: The cache, if one was provided.
+    """
+    return self._cache
+
+  def index_updates(self):
+    """Get the number of index entries written by this connection's commits.
+
+    This adds up ``index_updates`` from every commit's
+    :class:`gcloud.datastore.datastore_v1_pb2.MutationResult`,
+    so it shows how much excluding properties from indexes saves
+    (see :func:`gcloud.datastore.entity.Entity.exclude_from_indexes`).
+
+    >>> before = connection.index_updates()
+    >>> entity.save()
+    >>> connection.index_updates() - before
+    4
+
+    :rtype: integer
+    """
+    return self._index_updates
+
+  def backend(self, backend=_EMPTY):
+    """Get or set where this connection sends its requests.
+
+    A backend is anything with a ``request(dataset_id, method, data)`` method
+    taking a serialized request protobuf
+    and returning a serialized response protobuf
+    (or raising :class:`RequestError`), like :class:`HttpBackend`.
+    Everything built on the connection works the same whatever the backend,
+    so one can stand in for the real API::
+
+      >>> from gcloud.datastore.emulator import Emulator
+      >>> connection.backend(Emulator())
+
+    :type backend: object
+    :param backend: The new backend.
+
+    :returns: If no arguments, returns the current backend.
+              If a backend is provided, returns this connection.
+    """
+    if backend is self._EMPTY:
+      return self._backend
+    else:
+      self._backend = backend
+      return self
+
+  def add_listener(self, listener):
+    """Call a function after every RPC made by this connection.
+
+    The listener is passed an :class:`RpcStats`
+    once the RPC has finished (or failed)::
+
+      >>> def log_slow(stats):
+      ...   if stats.total_seconds() > 1:
+      ...     print stats.method, stats.wire_seconds, stats.request_bytes
+      >>> connection.add_listener(log_slow)
+
+    Listeners are called on the thread which made the RPC,
+    so they should be quick (and thread-safe).
+    See :class:`gcloud.datastore.metrics.Metrics`
+    for a listener which keeps histograms of these.
+
+    :type listener: callable
+    :param listener: The function to call.
+
+    :rtype: :class:`Connection`
+    :returns: This connection.
+    """
+    # Replaced rather than changed, so RPCs in flight needn't lock it.
+    self._listeners = self._listeners + (listener,)
+    return self
+
+  def remove_listener(self, listener):
+    """Stop calling a function added with :func:`add_listener`.
+
+    :type listener: callable
+    :param listener: The function to stop calling.
+
+    :rtype: :class:`Connection`
+    :returns: This connection.
+    """
+    self._listeners = tuple(added for added in self._listeners
+                            if added != listener)
+    return self
+
   def _request(self, dataset_id, method, data):
-    """Make a request over the Http transport to the Cloud Datastore API.
+    """Make a request to the Cloud Datastore API through the :func:`backend`.
 
     :type dataset_id: string
     :param dataset_id: The ID of the dataset of which to make the request.
@@ -63,25 +366,50 @@ class Connection(object):
     :rtype: string
     :returns: The string response content from the API call.
 
-    :raises: Exception if the response code is not 200 OK.
+    :raises: :class:`RequestError` if the response code is not 200 OK.
     """
-    headers = {
-        'Content-Type': 'application/x-protobuf',
-        'Content-Length': str(len(data)),
-        }
-    headers, content = self.http.request(
-        uri=self.build_api_url(dataset_id=dataset_id, method=method),
-        method='POST', headers=headers, body=data)
-
-    if headers['status'] != '200':
-      raise Exception('Request failed. Error was: %s' % content)
-
-    return content
+    return self._backend.request(dataset_id, method, data)
 
   def _rpc(self, dataset_id, method, request_pb, response_pb_cls):
-    response = self._request(dataset_id=dataset_id, method=method,
-                             data=request_pb.SerializeToString())
-    return response_pb_cls.FromString(response)
+    listeners = self._listeners
+    if not listeners:
+      response = self._request(dataset_id=dataset_id, method=method,
+                               data=request_pb.SerializeToString())
+      return response_pb_cls.FromString(response)
+
+    stats = RpcStats(dataset_id, method)
+    try:
+      start = time.time()
+      data = request_pb.SerializeToString()
+      sent = time.time()
+      stats.serialize_seconds = sent - start
+      stats.request_bytes = len(data)
+
+      try:
+        response = self._request(dataset_id=dataset_id, method=method,
+                                 data=data)
+      finally:
+        received = time.time()
+        stats.wire_seconds = received - sent
+
+      stats.status = 200
+      stats.response_bytes = len(response)
+      response_pb = response_pb_cls.FromString(response)
+      stats.parse_seconds = time.time() - received
+
+      count = _ENTITY_COUNTS.get(method)
+      if count is not None:
+        stats.entities = count(request_pb, response_pb)
+      return response_pb
+
+    except Exception, e:
+      stats.error = e
+      stats.status = getattr(e, 'status', stats.status)
+      raise
+
+    finally:
+      for listener in listeners:
+        listener(stats)
 
   @classmethod
   def build_api_url(cls, dataset_id, method, base_url=None, api_version=None):
@@ -113,12 +441,53 @@ class Connection(object):
         dataset_id=dataset_id, method=method)
 
   def transaction(self, transaction=_EMPTY):
+    """Get or set the current transaction for the calling thread.
+
+    Transactions are tracked per thread,
+    so a transaction started in one thread
+    has no effect on requests made from any other thread.
+
+    :type transaction: :class:`gcloud.datastore.transaction.Transaction`
+    :param transaction: The transaction to set (or ``None`` to clear it).
+
+    :rtype: :class:`gcloud.datastore.transaction.Transaction` or
+            :class:`Connection`
+    :returns: If no arguments, returns the current transaction.
+              If a transaction is provided, returns this connection.
+    """
     if transaction is self._EMPTY:
-      return self._current_transaction
+      return getattr(self._local, 'transaction', None)
     else:
-      self._current_transaction = transaction
+      self._local.transaction = transaction
       return self
 
+  def submit(self, func, *args, **kwargs):
+    """Run a function on behalf of one of the ``*_async`` methods.
+
+    A plain :class:`Connection` has no worker threads,
+    so the function is called right away
+    and the returned future is already resolved.
+    See :class:`AsyncConnection` for a connection
+    which runs these calls concurrently.
+
+    :type func: callable
+    :param func: The function to call with the remaining arguments.
+
+    :rtype: :class:`gcloud.datastore.workers.Future`
+    :returns: A future holding the result of the call.
+    """
+    return Future.from_call(func, *args, **kwargs)
+
+  def _map_concurrently(self, func, items):
+    """Call a function with each item, concurrently if there are several.
+
+    :rtype: list
+    :returns: The results, in the same order as ``items``.
+    """
+    if len(items) == 1:
+      return [func(items[0])]
+    return self._fan_out.map(func, items)
+
   def mutation(self):
     if self.transaction():
       return self.transaction().mutation()
@@ -181,6 +550,36 @@ class Connection(object):
     self._rpc(dataset_id, 'rollback', request,
               datastore_pb.RollbackResponse)
 
+  def allocate_ids(self, dataset_id, key_pbs):
+    """Reserve IDs for partial keys.
+
+    The Cloud Datastore won't assign the IDs returned
+    to any other entity,
+    so they can be used to complete keys without a commit::
+
+      >>> key_pb = dataset.entity('Person').key().to_protobuf()
+      >>> connection.allocate_ids('dataset-id', [key_pb] * 3)
+      [<Key protobuf>, <Key protobuf>, <Key protobuf>]
+
+    :type dataset_id: string
+    :param dataset_id: The dataset the keys belong to.
+
+    :type key_pbs: list of :class:`gcloud.datastore.datastore_v1_pb2.Key`
+    :param key_pbs: Partial keys (with the same key repeated
+                    for as many IDs as are needed).
+
+    :rtype: list of :class:`gcloud.datastore.datastore_v1_pb2.Key`
+    :returns: The keys, completed with the IDs reserved,
+              in the same order.
+    """
+    request = datastore_pb.AllocateIdsRequest()
+    for key_pb in key_pbs:
+      request.key.add().CopyFrom(key_pb)
+
+    response = self._rpc(dataset_id, 'allocateIds', request,
+                         datastore_pb.AllocateIdsResponse)
+    return list(response.key)
+
   def run_query(self, dataset_id, query_pb, namespace=None):
     """Run a query on the Cloud Datastore.
 
@@ -218,14 +617,47 @@ class Connection(object):
     :type namespace: string
     :param namespace: The namespace over which to run the query.
     """
+    batch = self.run_query_batch(dataset_id, query_pb, namespace=namespace)
+    return [e.entity for e in batch.entity_result]
+
+  def run_query_batch(self, dataset_id, query_pb, namespace=None):
+    """Run a query on the Cloud Datastore and return the whole result batch.
+
+    This is like :func:`run_query`,
+    but also provides the cursor at the end of the batch
+    and whether there are more results to fetch,
+    which are needed to page through large result sets
+    (see :func:`gcloud.datastore.query.Query.iter`).
+
+    :type dataset_id: string
+    :param dataset_id: The ID of the dataset over which to run the query.
+
+    :type query_pb: :class:`gcloud.datastore.datastore_v1_pb2.Query`
+    :param query_pb: The Protobuf representing the query to run.
+
+    :type namespace: string
+    :param namespace: The namespace over which to run the query.
+
+    :rtype: :class:`gcloud.datastore.datastore_v1_pb2.QueryResultBatch`
+    :returns: The batch of results.
+    """
     request = datastore_pb.RunQueryRequest()
 
     if namespace:
       request.partition_id.namespace = namespace
 
     request.query.CopyFrom(query_pb)
+    cache = self._cache if not self.transaction() else None
+    generation = cache.generation() if cache is not None else None
     response = self._rpc(dataset_id, 'runQuery', request, datastore_pb.RunQueryResponse)
-    return [e.entity for e in response.batch.entity_result]
+    batch = response.batch
+
+    if (cache is not None and
+        batch.entity_result_type == datastore_pb.EntityResult.FULL):
+      for result in batch.entity_result:
+        cache.put(dataset_id, result.entity, generation)
+
+    return batch
 
   def lookup(self, dataset_id, key_pbs):
     """Lookup keys from a dataset in the Cloud Datastore.
@@ -253,6 +685,10 @@ class Connection(object):
     >>> connection.lookup('dataset-id', key.to_protobuf())
     <Entity protobuf>
 
+    The keys are looked up using :func:`batch_lookup`,
+    so any number of keys can be requested at once,
+    and the entities are returned in the same order as the keys.
+
     :type dataset_id: string
     :param dataset_id: The dataset to look up the keys.
 
@@ -268,20 +704,13 @@ class Connection(object):
               If multiple keys were provided and no results matched,
               this will return an empty list.
     """
-    lookup_request = datastore_pb.LookupRequest()
-
     single_key = isinstance(key_pbs, datastore_pb.Key)
 
     if single_key:
       key_pbs = [key_pbs]
 
-    for key_pb in key_pbs:
-      lookup_request.key.add().CopyFrom(key_pb)
-
-    lookup_response = self._rpc(dataset_id, 'lookup', lookup_request,
-                                datastore_pb.LookupResponse)
-
-    results = [result.entity for result in lookup_response.found]
+    results = [entity_pb for entity_pb in self.batch_lookup(dataset_id, key_pbs)
+               if entity_pb is not None]
 
     if single_key:
       if results:
@@ -291,7 +720,110 @@ class Connection(object):
 
     return results
 
+  def batch_lookup(self, dataset_id, key_pbs, max_keys=None):
+    """Lookup any number of keys, returning results aligned to the keys.
+
+    Duplicate keys are only requested once.
+    The remaining keys are split into requests
+    of at most ``max_keys`` keys each,
+    which are sent concurrently.
+    Any keys the API defers (rather than returning)
+    are requested again, after a short backoff,
+    until every key is either found or missing
+    (up to ``MAX_LOOKUP_ROUNDS`` requests for each key).
+
+    If the connection has a :func:`cache`,
+    only the keys that aren't cached are requested
+    (unless the calling thread is in a transaction).
+
+    >>> connection.batch_lookup('dataset-id', [key1_pb, key2_pb, key1_pb])
+    [<Entity protobuf>, None, <Entity protobuf>]
+
+    :type dataset_id: string
+    :param dataset_id: The dataset to look up the keys.
+
+    :type key_pbs: list of :class:`gcloud.datastore.datastore_v1_pb2.Key`
+    :param key_pbs: The keys to retrieve from the datastore.
+
+    :type max_keys: integer
+    :param max_keys: The maximum number of keys in each request.
+                     Defaults to ``MAX_LOOKUP_KEYS``.
+
+    :rtype: list of :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+            and ``None``
+    :returns: A list with an entry for each key provided:
+              the entity if it was found, otherwise ``None``.
+
+    :raises: :class:`RequestError` (with a ``503`` status)
+             if the API is still deferring keys
+             after ``MAX_LOOKUP_ROUNDS`` requests.
+    """
+    max_keys = max_keys or self.MAX_LOOKUP_KEYS
+    paths = [helpers.get_key_path(key_pb) for key_pb in key_pbs]
+    cache = self._cache if not self.transaction() else None
+    generation = cache.generation() if cache is not None else None
+
+    found = {}
+    pending = []
+    for path, key_pb in zip(paths, key_pbs):
+      if path in found:
+        continue
+
+      if cache is not None:
+        found[path] = cache.get(dataset_id, key_pb)
+      else:
+        found[path] = None
+      if found[path] is None:
+        pending.append(key_pb)
+
+    def lookup_chunk(chunk):
+      request = datastore_pb.LookupRequest()
+      for key_pb in chunk:
+        request.key.add().CopyFrom(key_pb)
+      return self._rpc(dataset_id, 'lookup', request,
+                       datastore_pb.LookupResponse)
+
+    rounds = 0
+    while pending:
+      if rounds == self.MAX_LOOKUP_ROUNDS:
+        raise RequestError('lookup', 503, '%d keys were still deferred after '
+                           '%d lookups.' % (len(pending), rounds))
+      if rounds:
+        time.sleep(self.LOOKUP_RETRY_DELAY * 2 ** (rounds - 1))
+      rounds += 1
+
+      chunks = [pending[i:i + max_keys]
+                for i in xrange(0, len(pending), max_keys)]
+      pending = []
+
+      for response in self._map_concurrently(lookup_chunk, chunks):
+        for result in response.found:
+          found[helpers.get_key_path(result.entity.key)] = result.entity
+          if cache is not None:
+            cache.put(dataset_id, result.entity, generation)
+        pending.extend(response.deferred)
+
+    return [found.get(path) for path in paths]
+
   def commit(self, dataset_id, mutation_pb):
+    """Commit a mutation to the Cloud Datastore.
+
+    If the calling thread is in a transaction,
+    the mutation is committed as part of that transaction.
+
+    Any entities touched by the mutation
+    are dropped from the connection's :func:`cache`.
+
+    :type dataset_id: string
+    :param dataset_id: The dataset to which the mutation applies.
+
+    :type mutation_pb: :class:`gcloud.datastore.datastore_v1_pb2.Mutation`
+    :param mutation_pb: The mutation to commit.
+
+    :rtype: :class:`gcloud.datastore.datastore_v1_pb2.MutationResult`
+    :returns: The result of the mutation
+              (including any automatically assigned keys).
+    """
     request = datastore_pb.CommitRequest()
 
     if self.transaction():
@@ -301,11 +833,20 @@ class Connection(object):
       request.mode = datastore_pb.CommitRequest.NON_TRANSACTIONAL
 
     request.mutation.CopyFrom(mutation_pb)
-    response = self._rpc(dataset_id, 'commit', request,
-                         datastore_pb.CommitResponse)
+    try:
+      response = self._rpc(dataset_id, 'commit', request,
+                           datastore_pb.CommitResponse)
+    finally:
+      # Even a failed commit may have been applied, so don't trust the cache.
+      if self._cache is not None:
+        self._cache.invalidate_mutation(dataset_id, mutation_pb)
+
+    with self._index_updates_lock:
+      self._index_updates += response.mutation_result.index_updates
     return response.mutation_result
 
-  def save_entity(self, dataset_id, key_pb, properties):
+  def save_entity(self, dataset_id, key_pb, properties, property_pbs=None,
+                  exclude_from_indexes=()):
     """Save an entity to the Cloud Datastore with the provided properties.
 
     :type dataset_id: string
@@ -316,6 +857,17 @@ class Connection(object):
 
     :type properties: dict
     :param properties: The properties to store on the entity.
+
+    :type property_pbs: list of
+                        :class:`gcloud.datastore.datastore_v1_pb2.Property`
+    :param property_pbs: Properties which are already encoded
+                         (for instance, untouched properties of a
+                         :class:`gcloud.datastore.entity.LazyEntity`).
+                         These are copied onto the entity as they are.
+
+    :type exclude_from_indexes: set of strings
+    :param exclude_from_indexes: The names of properties
+                                 which shouldn't be indexed.
     """
     # TODO: Is this the right method name?
     # TODO: How do you delete properties? Set them to None?
@@ -332,15 +884,13 @@ class Connection(object):
       insert = mutation.upsert.add()
 
     insert.key.CopyFrom(key_pb)
+    helpers.add_properties(insert, properties, exclude_from_indexes)
 
-    for name, value in properties.iteritems():
-      prop = insert.property.add()
-      # Set the name of the property.
-      prop.name = name
-
-      # Set the appropriate value.
-      pb_attr, pb_value = helpers.get_protobuf_attribute_and_value(value)
-      setattr(prop.value, pb_attr, pb_value)
+    for property_pb in property_pbs or ():
+      added = insert.property.add()
+      added.CopyFrom(property_pb)
+      if property_pb.name in exclude_from_indexes:
+        added.value.indexed = False
 
     # If this is in a transaction, we should just return True. The transaction
     # will handle assigning any keys as necessary.
@@ -386,3 +936,105 @@ class Connection(object):
     # TODO: Is this the right way to handle deleting
     #       (single and multiple as separate methods)?
     return self.delete_entities(dataset_id, [key_pb])
+
+
+class AsyncConnection(Connection):
+  """A connection which can keep many API calls in flight at once.
+
+  Every RPC method has an ``*_async`` twin
+  which returns a :class:`gcloud.datastore.workers.Future`
+  instead of blocking::
+
+    >>> connection = AsyncConnection(credentials=credentials)
+    >>> futures = [connection.lookup_async('dataset-id', key_pb)
+    ...            for key_pb in key_pbs]
+    >>> [future.get() for future in futures]
+    [<Entity protobuf>, ...]
+
+  The higher level objects have ``*_async`` methods too
+  (:func:`gcloud.datastore.dataset.Dataset.get_entities_async`,
+  :func:`gcloud.datastore.query.Query.fetch_async`,
+  :func:`gcloud.datastore.entity.Entity.save_async`, etc)
+  which run concurrently when used with an :class:`AsyncConnection`.
+
+  Requests are built exactly as they are by :class:`Connection`,
+  then sent from a pool of worker threads
+  over the pooled HTTP transport.
+
+  .. note::
+    While the calling thread is in a transaction,
+    calls are run right away in the calling thread.
+    Writes in a transaction are only added to its mutation
+    (there's no request to wait on),
+    and this keeps them in the order they were made.
+    Use :func:`gcloud.datastore.transaction.Transaction.commit_async`
+    to send the transaction itself without blocking.
+
+  :type credentials: :class:`gcloud.datastore.credentials.Credentials`
+  :param credentials: The OAuth2 Credentials to use for this connection.
+
+  :type max_workers: integer
+  :param max_workers: The maximum number of API calls in flight at once.
+                      Defaults to ``MAX_WORKERS``.
+
+  :param kwargs: Any other arguments are passed along to :class:`Connection`.
+                 The HTTP pool defaults to one connection per worker.
+  """
+
+  MAX_WORKERS = 100
+  """The default maximum number of API calls in flight at once."""
+
+  def __init__(self, credentials=None, max_workers=None, **kwargs):
+    max_workers = max_workers or self.MAX_WORKERS
+    kwargs.setdefault('max_connections', max_workers)
+    super(AsyncConnection, self).__init__(credentials=credentials, **kwargs)
+    self._workers = WorkerPool(max_workers=max_workers)
+
+  def submit(self, func, *args, **kwargs):
+    """Run a function on a worker thread.
+
+    :type func: callable
+    :param func: The function to call with the remaining arguments.
+
+    :rtype: :class:`gcloud.datastore.workers.Future`
+    :returns: A future which is resolved when the call finishes.
+    """
+    if self.transaction():
+      return Future.from_call(func, *args, **kwargs)
+    return self._workers.submit(func, *args, **kwargs)
+
+  def close(self):
+    """Wait for any calls in flight to finish and stop the worker threads."""
+    self._workers.close()
+
+  def begin_transaction_async(self, *args, **kwargs):
+    """Like :func:`Connection.begin_transaction` but returns a future."""
+    return self.submit(self.begin_transaction, *args, **kwargs)
+
+  def rollback_transaction_async(self, *args, **kwargs):
+    """Like :func:`Connection.rollback_transaction` but returns a future."""
+    return self.submit(self.rollback_transaction, *args, **kwargs)
+
+  def allocate_ids_async(self, *args, **kwargs):
+    """Like :func:`Connection.allocate_ids` but returns a future."""
+    return self.submit(self.allocate_ids, *args, **kwargs)
+
+  def run_query_async(self, *args, **kwargs):
+    """Like :func:`Connection.run_query` but returns a future."""
+    return self.submit(self.run_query, *args, **kwargs)
+
+  def lookup_async(self, *args, **kwargs):
+    """Like :func:`Connection.lookup` but returns a future."""
+    return self.submit(self.lookup, *args, **kwargs)
+
+  def commit_async(self, *args, **kwargs):
+    """Like :func:`Connection.commit` but returns a future."""
+    return self.submit(self.commit, *args, **kwargs)
+
+  def save_entity_async(self, *args, **kwargs):
+    """Like :func:`Connection.save_entity` but returns a future."""
+    return self.submit(self.save_entity, *args, **kwargs)
+
+  def delete_entities_async(self, *args, **kwargs):
+    """Like :func:`Connection.delete_entities` but returns a future."""
+    return self.submit(self.delete_entities, *args, **kwargs)
@@ -1,6 +1,6 @@
 """A simple wrapper around the OAuth2 credentials library."""
 
-from oauth2client import client
+import threading
 
 
 class Credentials(object):
@@ -23,6 +23,10 @@ class Credentials(object):
   def get_for_service_account(cls, client_email, private_key_path):
     """Gets the credentials for a service account.
 
+    Neither the OAuth2 library nor the private key file
+    are loaded until the credentials are first used
+    (typically, when the first request is made).
+
     :type client_email: string
     :param client_email: The e-mail attached to the service account.
 
@@ -31,7 +35,40 @@ class Credentials(object):
                              given to you when you created the service
                              account).
     """
-    return client.SignedJwtAssertionCredentials(
-        service_account_name=client_email,
-        private_key=open(private_key_path).read(),
-        scope=cls.SCOPE)
+    return _DeferredCredentials(client_email, private_key_path, cls.SCOPE)
+
+
+class _DeferredCredentials(object):
+  """Service account credentials which read the private key when needed.
+
+  Every attribute (``authorize``, ``refresh``, ``access_token`` and so on)
+  is passed through to a
+  :class:`oauth2client.client.SignedJwtAssertionCredentials`,
+  which is created the first time one is used.
+  """
+
+  def __init__(self, client_email, private_key_path, scope):
+    self._client_email = client_email
+    self._private_key_path = private_key_path
+    self._scope = scope
+    self._credentials = None
+    self._lock = threading.Lock()
+
+  def _load(self):
+    with self._lock:
+      if self._credentials is None:
+        # This import is here so oauth2client is only loaded when it's needed.
+        from oauth2client import client
+
+        with open(self._private_key_path) as key_file:
+          private_key = key_file.read()
+        self._credentials = client.SignedJwtAssertionCredentials(
+            service_account_name=self._client_email,
+            private_key=private_key, scope=self._scope)
+      return self._credentials
+
+  def __getattr__(self, name):
+    # Only called for attributes which aren't set on this object.
+    if name.startswith('_'):
+      raise AttributeError(name)
+    return getattr(self._credentials or self._load(), name)
@@ -1,3 +1,28 @@
+import Queue
+import sys
+import threading
+from itertools import izip
+
+from gcloud.datastore.workers import WorkerPool
+
+
+def _commit_batches(items, sizes, max_count, max_bytes, overhead):
+  """Split items into lists small enough to commit at once."""
+  batch = []
+  size = 0
+  for item, item_size in izip(items, sizes):
+    item_size += overhead
+    if batch and (len(batch) >= max_count or size + item_size > max_bytes):
+      yield batch
+      batch = []
+      size = 0
+    batch.append(item)
+    size += item_size
+
+  if batch:
+    yield batch
+
+
 class Dataset(object):
   """A dataset in the Cloud Datastore.
 
@@ -30,6 +55,7 @@ class Dataset(object):
   def __init__(self, id, connection=None):
     self._connection = connection
     self._id = id
+    self._exclude_from_indexes = {}
 
   def connection(self):
     """Get the current connection.
@@ -57,6 +83,33 @@ class Dataset(object):
 
     return self._id
 
+  def exclude_from_indexes(self, kind, *names):
+    """Get or add the properties of a kind which shouldn't be indexed.
+
+    These apply to every entity of the kind saved through this dataset,
+    on top of any set on the entity itself
+    (see :func:`gcloud.datastore.entity.Entity.exclude_from_indexes`).
+
+      >>> dataset.exclude_from_indexes('Article', 'body', 'view_count')
+      <Dataset object>
+      >>> dataset.exclude_from_indexes('Article')
+      frozenset(['body', 'view_count'])
+
+    :type kind: string
+    :param kind: The kind of entity.
+
+    :type names: strings
+    :param names: The names of the properties to exclude.
+
+    :returns: Either the names excluded from indexes for the kind
+              or the :class:`Dataset`.
+    """
+    if names:
+      self._exclude_from_indexes[kind] = (
+          self.exclude_from_indexes(kind) | frozenset(names))
+      return self
+    return self._exclude_from_indexes.get(kind, frozenset())
+
   def query(self, *args, **kwargs):
     from gcloud.datastore.query import Query
     kwargs['dataset'] = self
@@ -71,28 +124,324 @@ class Dataset(object):
     kwargs['dataset'] = self
     return Transaction(*args, **kwargs)
 
-  def get_entity(self, key):
+  def parallel_scan(self, query, shards, func=None, page_size=None):
+    """Run a query as several shards side by side.
+
+    The query is split into ranges of keys
+    (see :func:`gcloud.datastore.query.Query.split`)
+    and each shard is paged through on its own worker thread.
+
+    With no ``func``, this returns an iterator over every result,
+    in whatever order they arrive from the shards::
+
+      >>> for entity in dataset.parallel_scan(dataset.query('Person'), 16):
+      ...   do_something_with(entity)
+
+    With a ``func``, it is called for each shard
+    with the shard's index and an iterator over its results,
+    and a list of what each call returns is returned::
+
+      >>> dataset.parallel_scan(dataset.query('Person'), 16,
+      ...                       func=lambda i, results: len(list(results)))
+      [6250, 6249, 6251, ...]
+
+    :type query: :class:`gcloud.datastore.query.Query`
+    :param query: The query to run.
+
+    :type shards: integer
+    :param shards: The number of shards to split the query into.
+
+    :type func: callable
+    :param func: An optional function to run over each shard.
+
+    :type page_size: integer
+    :param page_size: The maximum number of results per request.
+
+    :rtype: iterator or list
+    :returns: An iterator over the results of every shard,
+              or a list of the results of ``func`` for each shard.
+    """
+    queries = query.dataset(self).split(shards)
+    pool = WorkerPool(max_workers=len(queries))
+
+    if func is not None:
+      def run(i):
+        return func(i, queries[i].iter(page_size=page_size, prefetch=False))
+
+      try:
+        return pool.map(run, range(len(queries)))
+      finally:
+        pool.close()
+
+    return self._merge_shards(pool, queries, page_size)
+
+  def _merge_shards(self, pool, queries, page_size):
+    """Yield the results of each query as they arrive from worker threads."""
+    results = Queue.Queue(maxsize=len(queries) * 100)
+    stopped = threading.Event()
+    errors = []
+    done = object()
+
+    def put(item):
+      while not stopped.is_set():
+        try:
+          results.put(item, timeout=0.1)
+          return True
+        except Queue.Full:
+          pass
+
+    def scan(shard):
+      try:
+        for result in shard.iter(page_size=page_size, prefetch=False):
+          if not put(result):
+            return
+      except Exception:
+        # Stop the other shards and have the error raised straight away.
+        errors.append(sys.exc_info())
+        stopped.set()
+      finally:
+        put(done)
+
+    for shard in queries:
+      pool.submit(scan, shard)
+    try:
+      finished = 0
+      while finished < len(queries):
+        if errors:
+          exc_type, exc_value, traceback = errors[0]
+          raise exc_type, exc_value, traceback
+        try:
+          result = results.get(timeout=0.1)
+        except Queue.Empty:
+          continue
+        if result is done:
+          finished += 1
+        else:
+          yield result
+    finally:
+      stopped.set()
+      pool.close()
+
+  def get_entity(self, key, lazy=False):
     """
     Retrieves an entity from the dataset, along with all of its attributes.
 
     :type key: :class:`gcloud.datastore.key.Key`
     :param item_name: The name of the item to retrieve.
 
+    :type lazy: bool
+    :param lazy: See :func:`get_entities`.
+
     :rtype: :class:`gcloud.datastore.entity.Entity` or ``None``
     :return: The requested entity, or ``None`` if there was no match found.
     """
-    entities = self.get_entities([key])
+    entities = self.get_entities([key], lazy=lazy)
     if entities:
       return entities[0]
 
-  def get_entities(self, keys):
+  def get_entities(self, keys, include_missing=False, lazy=False):
+    """Retrieves entities from the dataset, along with all of their attributes.
+
+    Any number of keys can be retrieved at once
+    (see :func:`gcloud.datastore.connection.Connection.batch_lookup`)
+    and the entities are returned in the same order as the keys.
+
+    :type keys: list of :class:`gcloud.datastore.key.Key`
+    :param keys: The keys to retrieve.
+
+    :type include_missing: bool
+    :param include_missing: If ``True``, the list returned has an entry
+                            for every key, with ``None`` for any key
+                            which wasn't found.
+
+    :type lazy: bool
+    :param lazy: If ``True``, return
+                 :class:`gcloud.datastore.entity.LazyEntity` objects,
+                 which only decode the properties that are read.
+
+    :rtype: list of :class:`gcloud.datastore.entity.Entity`
+    :returns: The entities which were found
+              (or ``None`` for misses, if ``include_missing`` is set).
+    """
     # This import is here to avoid circular references.
-    from gcloud.datastore.entity import Entity
+    from gcloud.datastore.decoder import EntityDecoder
 
-    entity_pbs = self.connection().lookup(dataset_id=self.id(),
+    entity_pbs = self.connection().batch_lookup(dataset_id=self.id(),
         key_pbs=[k.to_protobuf() for k in keys])
 
-    entities = []
-    for entity_pb in entity_pbs:
-      entities.append(Entity.from_protobuf(entity_pb, dataset=self))
+    if not include_missing:
+      entity_pbs = [entity_pb for entity_pb in entity_pbs
+                    if entity_pb is not None]
+    return EntityDecoder(self, lazy=lazy).decode_entities(entity_pbs)
+
+  def allocate_ids(self, incomplete_key, num_ids):
+    """Reserve IDs for a partial key.
+
+    The Cloud Datastore won't assign these IDs to any other entity,
+    so the keys returned can be saved with an upsert
+    (and batched or cached) like any other complete key::
+
+      >>> keys = dataset.allocate_ids(dataset.entity('Person').key(), 2)
+      >>> [key.id() for key in keys]
+      [5629499534213120, 5066549580791808]
+
+    To hand out IDs one at a time without a request for each,
+    see :class:`gcloud.datastore.id_pool.IdPool`.
+
+    :type incomplete_key: :class:`gcloud.datastore.key.Key`
+    :param incomplete_key: A partial key (with a kind but no ID or name).
+
+    :type num_ids: integer
+    :param num_ids: The number of IDs to reserve.
+
+    :rtype: list of :class:`gcloud.datastore.key.Key`
+    :returns: Complete keys, each with one of the IDs reserved.
+    """
+    if not incomplete_key.is_partial():
+      raise ValueError('Only partial keys can have IDs allocated.')
+
+    key_pbs = self.connection().allocate_ids(
+        self.id(), [incomplete_key.to_protobuf()] * num_ids)
+    return [incomplete_key.id(key_pb.path_element[-1].id)
+            for key_pb in key_pbs]
+
+  def put_entities(self, entities):
+    """Save entities with as few ``commit`` requests as possible.
+
+    Rather than a request per entity (as with
+    :func:`gcloud.datastore.entity.Entity.save`),
+    the entities are saved in a single non-transactional commit::
+
+      >>> dataset.put_entities([person, pet, address])
+
+    Entities with complete keys are upserted,
+    and entities with partial keys have their keys updated
+    with the IDs assigned to them.
+
+    If there are more entities than the API accepts in one commit
+    (see :attr:`gcloud.datastore.connection.Connection.MAX_COMMIT_ENTITIES`
+    and :attr:`gcloud.datastore.connection.Connection.MAX_COMMIT_BYTES`),
+    they are split into several commits,
+    so if one fails, the commits before it will have been applied.
+
+    Inside a transaction, the entities are added to the transaction
+    and saved when it's committed.
+
+    :type entities: list of :class:`gcloud.datastore.entity.Entity`
+    :param entities: The entities to save.
+
+    :rtype: list of :class:`gcloud.datastore.entity.Entity`
+    :returns: The entities saved (with possibly updated keys).
+    """
+    # This import is here to avoid circular references.
+    from gcloud.datastore.key import Key
+
+    entities = list(entities)
+    connection = self.connection()
+    transaction = connection.transaction()
+
+    entity_pbs = [entity.to_protobuf() for entity in entities]
+    items = zip(entities, entity_pbs)
+
+    if transaction:
+      batches = [items]
+    else:
+      batches = _commit_batches(
+          items, [entity_pb.ByteSize() for entity_pb in entity_pbs],
+          connection.MAX_COMMIT_ENTITIES, connection.MAX_COMMIT_BYTES,
+          connection.COMMIT_ENTITY_OVERHEAD)
+
+    for batch in batches:
+      mutation = connection.mutation()
+      auto_id_entities = []
+      for entity, entity_pb in batch:
+        if entity.key().is_partial():
+          mutation.insert_auto_id.add().CopyFrom(entity_pb)
+          auto_id_entities.append(entity)
+        else:
+          mutation.upsert.add().CopyFrom(entity_pb)
+
+      if transaction:
+        for entity in auto_id_entities:
+          transaction.add_auto_id_entity(entity)
+        continue
+
+      result = connection.commit(self.id(), mutation)
+      for entity, key_pb in izip(auto_id_entities, result.insert_auto_id_key):
+        entity.key(entity.key().path(Key.from_protobuf(key_pb).path()))
+
     return entities
+
+  def delete_keys(self, keys):
+    """Delete entities with as few ``commit`` requests as possible.
+
+    Like :func:`put_entities`, this uses a single non-transactional commit
+    (or several, if there are more keys than the API accepts in one),
+    or adds the deletes to the current transaction.
+
+    :type keys: list of :class:`gcloud.datastore.key.Key`
+    :param keys: The keys of the entities to delete.
+    """
+    connection = self.connection()
+    key_pbs = [key.to_protobuf() for key in keys]
+
+    if connection.transaction():
+      batches = [key_pbs]
+    else:
+      batches = _commit_batches(
+          key_pbs, [key_pb.ByteSize() for key_pb in key_pbs],
+          connection.MAX_COMMIT_ENTITIES, connection.MAX_COMMIT_BYTES,
+          connection.COMMIT_ENTITY_OVERHEAD)
+
+    for batch in batches:
+      mutation = connection.mutation()
+      for key_pb in batch:
+        mutation.delete.add().CopyFrom(key_pb)
+
+      if not connection.transaction():
+        connection.commit(self.id(), mutation)
+
+  def get_entities_async(self, keys, include_missing=False, lazy=False):
+    """Like :func:`get_entities` but returns a future.
+
+    The lookup runs concurrently
+    if the dataset's connection is a
+    :class:`gcloud.datastore.connection.AsyncConnection`.
+
+    :type keys: list of :class:`gcloud.datastore.key.Key`
+    :param keys: The keys to retrieve.
+
+    :type include_missing: bool
+    :param include_missing: See :func:`get_entities`.
+
+    :type lazy: bool
+    :param lazy: See :func:`get_entities`.
+
+    :rtype: :class:`gcloud.datastore.workers.Future`
+    :returns: A future resolving to a list of
+              :class:`gcloud.datastore.entity.Entity` objects.
+    """
+    return self.connection().submit(self.get_entities, keys, include_missing,
+                                    lazy)
+
+  def put_entities_async(self, entities):
+    """Like :func:`put_entities` but returns a future.
+
+    :type entities: list of :class:`gcloud.datastore.entity.Entity`
+    :param entities: The entities to save.
+
+    :rtype: :class:`gcloud.datastore.workers.Future`
+    :returns: A future resolving to the entities saved.
+    """
+    return self.connection().submit(self.put_entities, entities)
+
+  def delete_keys_async(self, keys):
+    """Like :func:`delete_keys` but returns a future.
+
+    :type keys: list of :class:`gcloud.datastore.key.Key`
+    :param keys: The keys of the entities to delete.
+
+    :rtype: :class:`gcloud.datastore.workers.Future`
+    :returns: A future which is resolved once the entities are deleted.
+    """
+    return self.connection().submit(self.delete_keys, keys)
@@ -0,0 +1,634 @@
+"""An in-process stand-in for the Cloud Datastore API.
+
+An :class:`Emulator` answers the same protobuf requests as the real API
+(``lookup``, ``runQuery``, ``commit``, ``beginTransaction``, ``rollback``
+and ``allocateIds``) from memory.
+It's a backend (see :func:`gcloud.datastore.connection.Connection.backend`),
+so everything built on a connection
+(datasets, queries, entities and transactions)
+runs against it unchanged,
+without credentials or a network::
+
+  >>> from gcloud.datastore.emulator import Emulator
+  >>> dataset = Emulator().dataset('dataset-id')
+  >>> entity = dataset.entity('Person')
+  >>> entity['name'] = u'Sally'
+  >>> entity.save()
+  >>> dataset.query('Person').filter('name =', u'Sally').fetch()
+  [<Entity[{'kind': u'Person', 'id': 1L}] {u'name': u'Sally'}>]
+
+Entities are kept in sorted indexes
+(one by key for each kind and one per property for each kind),
+which queries scan much as the real API would.
+Each property filter, sort order, ancestor, cursor, offset, limit
+and projection is supported,
+but there are no composite indexes to declare
+(any combination of filters and orders works).
+
+Transactions fail with a ``409`` conflict
+if an entity they read or write
+is changed by another commit before they're committed.
+Conflicts can also be simulated at random (see ``conflict_rate``)
+to exercise retry logic.
+
+This is meant for tests and benchmarks, not as a faithful copy:
+consistency is always strong and there are no quotas or size limits.
+"""
+
+import base64
+import bisect
+import itertools
+import marshal
+import math
+import operator
+import random
+import threading
+import zlib
+
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore.connection import Connection
+from gcloud.datastore.connection import RequestError
+from gcloud.datastore.dataset import Dataset
+
+
+_OPERATORS = {
+    datastore_pb.PropertyFilter.LESS_THAN: operator.lt,
+    datastore_pb.PropertyFilter.LESS_THAN_OR_EQUAL: operator.le,
+    datastore_pb.PropertyFilter.GREATER_THAN: operator.gt,
+    datastore_pb.PropertyFilter.GREATER_THAN_OR_EQUAL: operator.ge,
+    datastore_pb.PropertyFilter.EQUAL: operator.eq,
+    }
+
+# Values of different types sort by type first, in this order.
+_TYPE_RANKS = {
+    'integer_value': 1,
+    'timestamp_microseconds_value': 2,
+    'boolean_value': 3,
+    'blob_value': 4,
+    'string_value': 5,
+    'double_value': 6,
+    'key_value': 7,
+    'blob_key_value': 8,
+    }
+_KEY_RANK = _TYPE_RANKS['key_value']
+
+_CURSOR_PREFIX = 'emulator:'
+
+
+class _Highest(object):
+  """Sorts after everything else (for the end of index ranges)."""
+
+  def __lt__(self, other):
+    return False
+
+  def __le__(self, other):
+    return other is self
+
+  def __gt__(self, other):
+    return other is not self
+
+  def __ge__(self, other):
+    return True
+
+  def __eq__(self, other):
+    return other is self
+
+  def __ne__(self, other):
+    return other is not self
+
+_HIGHEST = _Highest()
+
+
+def _path_key(key_pb):
+  """Get a sortable tuple for a key's path (IDs sort before names)."""
+  path = []
+  for element in key_pb.path_element:
+    if element.HasField('id'):
+      path.append((element.kind, 0, element.id))
+    elif element.HasField('name'):
+      path.append((element.kind, 1, element.name))
+    else:
+      path.append((element.kind, 2, None))
+  return tuple(path)
+
+
+def _value_keys(value_pb):
+  """Get a sortable tuple for each of the values in a Value protobuf."""
+  if len(value_pb.list_value):
+    keys = []
+    for item_pb in value_pb.list_value:
+      keys.extend(_value_keys(item_pb))
+    return keys
+
+  for field, value in value_pb.ListFields():
+    rank = _TYPE_RANKS.get(field.name)
+    if rank == _KEY_RANK:
+      return [(rank, _path_key(value))]
+    elif field.name == 'double_value':
+      # NaN sorts before every other double (and equals itself).
+      return [(rank, (0,) if math.isnan(value) else (1, value))]
+    elif rank is not None:
+      return [(rank, value)]
+  return [(0, None)]  # A null.
+
+
+def _index_rows(entity_pb):
+  """Get the rows an entity has in the property indexes."""
+  rows = set()
+  for property_pb in entity_pb.property:
+    if property_pb.value.indexed:
+      for value_key in _value_keys(property_pb.value):
+        rows.add((property_pb.name, value_key))
+  return rows
+
+
+def _property_filters(filter_pb):
+  """Flatten a Filter protobuf into its property filters."""
+  if filter_pb.HasField('property_filter'):
+    return [filter_pb.property_filter]
+  filters = []
+  for child_pb in filter_pb.composite_filter.filter:
+    filters.extend(_property_filters(child_pb))
+  return filters
+
+
+def _encode_cursor(position):
+  """Serialize a position in a query's results as an opaque cursor."""
+  return _CURSOR_PREFIX + base64.urlsafe_b64encode(marshal.dumps(position))
+
+
+def _decode_cursor(cursor, method):
+  """Parse a cursor made by :func:`_encode_cursor`."""
+  try:
+    if not cursor.startswith(_CURSOR_PREFIX):
+      raise ValueError(cursor)
+    position = marshal.loads(
+        base64.urlsafe_b64decode(cursor[len(_CURSOR_PREFIX):]))
+    values, path = position
+    if not isinstance(values, tuple) or not isinstance(path, tuple):
+      raise ValueError(cursor)
+  except (EOFError, TypeError, ValueError):
+    raise RequestError(method, 400, 'Invalid cursor.')
+  return position
+
+
+class _Store(object):
+  """The entities and indexes of one dataset."""
+
+  def __init__(self):
+    self.entities = {}  # (namespace, path) -> Entity protobuf
+    self.versions = {}  # (namespace, path) -> sequence of the last change
+    self.kinds = {}  # (namespace, kind) -> sorted list of paths
+    self.properties = {}  # (namespace, kind, name) -> sorted (value, path)
+
+  def put(self, namespace, path, entity_pb):
+    """Store an entity, returning the number of index rows changed."""
+    old_pb = self.entities.get((namespace, path))
+    kind = path[-1][0]
+    changed = self._reindex(namespace, kind, path,
+                            _index_rows(old_pb) if old_pb else set(),
+                            _index_rows(entity_pb))
+    if old_pb is None:
+      bisect.insort(self.kinds.setdefault((namespace, kind), []), path)
+      changed += 1
+    self.entities[(namespace, path)] = entity_pb
+    return changed
+
+  def delete(self, namespace, path):
+    """Delete an entity, returning the number of index rows changed."""
+    old_pb = self.entities.pop((namespace, path), None)
+    if old_pb is None:
+      return 0
+    kind = path[-1][0]
+    paths = self.kinds[(namespace, kind)]
+    del paths[bisect.bisect_left(paths, path)]
+    return 1 + self._reindex(namespace, kind, path, _index_rows(old_pb), set())
+
+  def _reindex(self, namespace, kind, path, old_rows, new_rows):
+    for name, value_key in old_rows - new_rows:
+      entries = self.properties[(namespace, kind, name)]
+      del entries[bisect.bisect_left(entries, (value_key, path))]
+    for name, value_key in new_rows - old_rows:
+      entries = self.properties.setdefault((namespace, kind, name), [])
+      bisect.insort(entries, (value_key, path))
+    return len(old_rows ^ new_rows)
+
+
+class _Transaction(object):
+
+  def __init__(self, dataset_id, sequence):
+    self.dataset_id = dataset_id
+    self.sequence = sequence  # Changes after this one are conflicts.
+    self.reads = set()
+
+
+class Emulator(object):
+  """An in-memory Cloud Datastore.
+
+  Emulators are thread-safe
+  (each request is handled under a single lock),
+  and hold any number of datasets.
+
+  :type batch_size: integer
+  :param batch_size: The most results to return for each ``runQuery``
+                     (the rest are fetched with the cursor returned).
+
+  :type conflict_rate: float
+  :param conflict_rate: The probability that committing a transaction
+                        fails with a conflict, even if it doesn't conflict.
+
+  :type seed: integer
+  :param seed: A seed for the random conflicts, to make them repeatable.
+  """
+
+  BATCH_SIZE = 1000
+  """The default number of results to return per ``runQuery``."""
+
+  def __init__(self, batch_size=None, conflict_rate=0.0, seed=None):
+    self._batch_size = batch_size or self.BATCH_SIZE
+    self._conflict_rate = conflict_rate
+    self._random = random.Random(seed)
+    self._lock = threading.Lock()
+    self._stores = {}
+    self._transactions = {}
+    self._sequence = 0
+    self._ids = itertools.count(1)
+    self._transaction_ids = itertools.count(1)
+
+    self._handlers = {
+        'lookup': (datastore_pb.LookupRequest, self._lookup),
+        'runQuery': (datastore_pb.RunQueryRequest, self._run_query),
+        'commit': (datastore_pb.CommitRequest, self._commit),
+        'beginTransaction': (datastore_pb.BeginTransactionRequest,
+                             self._begin_transaction),
+        'rollback': (datastore_pb.RollbackRequest, self._rollback),
+        'allocateIds': (datastore_pb.AllocateIdsRequest, self._allocate_ids),
+        }
+
+  def connection(self, connection_class=Connection, **kwargs):
+    """Create a connection which sends its requests to this emulator.
+
+    :type connection_class: type
+    :param connection_class: The kind of connection to create
+                             (for instance,
+                             :class:`gcloud.datastore.connection.AsyncConnection`).
+
+    :rtype: :class:`gcloud.datastore.connection.Connection`
+    """
+    kwargs['backend'] = self
+    return connection_class(**kwargs)
+
+  def dataset(self, dataset_id, **kwargs):
+    """Create a dataset with a connection to this emulator.
+
+    :type dataset_id: string
+    :param dataset_id: The ID of the dataset.
+
+    :rtype: :class:`gcloud.datastore.dataset.Dataset`
+    """
+    return Dataset(dataset_id, connection=self.connection(**kwargs))
+
+  def entity_count(self, dataset_id):
+    """Get the number of entities stored in a dataset.
+
+    :type dataset_id: string
+    :param dataset_id: The ID of the dataset.
+
+    :rtype: integer
+    """
+    with self._lock:
+      return len(self._store(dataset_id).entities)
+
+  def request(self, dataset_id, method, data):
+    """Handle a request, as the API would.
+
+    :type dataset_id: string
+    :param dataset_id: The ID of the dataset of which to make the request.
+
+    :type method: string
+    :param method: The API method name (``runQuery``, ``lookup``, etc).
+
+    :type data: string
+    :param data: The serialized request protobuf.
+
+    :rtype: string
+    :returns: The serialized response protobuf.
+
+    :raises: :class:`gcloud.datastore.connection.RequestError`
+             if the request is invalid (``400``),
+             conflicts with another transaction (``409``)
+             or is for an unknown method (``404``).
+    """
+    if method not in self._handlers:
+      raise RequestError(method, 404, 'Unknown method: %s' % method)
+
+    request_class, handler = self._handlers[method]
+    request_pb = request_class.FromString(data)
+    if dataset_id.startswith('s~'):
+      dataset_id = dataset_id[2:]
+
+    with self._lock:
+      response_pb = handler(dataset_id, request_pb)
+    return response_pb.SerializeToString()
+
+  def _store(self, dataset_id):
+    store = self._stores.get(dataset_id)
+    if store is None:
+      store = self._stores[dataset_id] = _Store()
+    return store
+
+  def _transaction(self, method, transaction_id):
+    transaction = self._transactions.get(transaction_id)
+    if transaction is None:
+      raise RequestError(method, 400, 'Unknown transaction.')
+    return transaction
+
+  def _response_key(self, dataset_id, key_pb):
+    key_pb.partition_id.dataset_id = 's~' + dataset_id
+
+  def _lookup(self, dataset_id, request_pb):
+    store = self._store(dataset_id)
+    transaction = None
+    if request_pb.read_options.HasField('transaction'):
+      transaction = self._transaction('lookup',
+                                      request_pb.read_options.transaction)
+
+    response_pb = datastore_pb.LookupResponse()
+    for key_pb in request_pb.key:
+      stored = (key_pb.partition_id.namespace, _path_key(key_pb))
+      if transaction is not None:
+        transaction.reads.add(stored)
+
+      entity_pb = store.entities.get(stored)
+      if entity_pb is not None:
+        response_pb.found.add().entity.CopyFrom(entity_pb)
+      else:
+        missing_key = response_pb.missing.add().entity.key
+        missing_key.CopyFrom(key_pb)
+        self._response_key(dataset_id, missing_key)
+    return response_pb
+
+  def _candidates(self, store, namespace, kind, filters, ancestor):
+    """Find the paths which might match a query, using an index."""
+    if kind is None:
+      return [path for stored_namespace, path in store.entities
+              if stored_namespace == namespace]
+
+    # Scan the range of a property index for one filter if we can...
+    property_filters = [(name, op, value_key)
+                        for name, op, value_key in filters
+                        if name != '__key__']
+    property_filters.sort(key=lambda (name, op, value_key): op != operator.eq)
+    if property_filters:
+      name, op, value_key = property_filters[0]
+      entries = store.properties.get((namespace, kind, name), [])
+      low, high = 0, len(entries)
+      if op in (operator.eq, operator.ge):
+        low = bisect.bisect_left(entries, (value_key,))
+      elif op == operator.gt:
+        low = bisect.bisect_left(entries, (value_key, _HIGHEST))
+      if op in (operator.eq, operator.le):
+        high = bisect.bisect_left(entries, (value_key, _HIGHEST))
+      elif op == operator.lt:
+        high = bisect.bisect_left(entries, (value_key,))
+      return set(path for _, path in entries[low:high])
+
+    # ...otherwise scan (part of) the kind.
+    paths = store.kinds.get((namespace, kind), [])
+    if ancestor is not None:
+      low = bisect.bisect_left(paths, ancestor)
+      high = bisect.bisect_left(paths, ancestor + (_HIGHEST,))
+      return paths[low:high]
+    return paths
+
+  def _matches(self, entity_pb, path, filters):
+    for name, op, value_key in filters:
+      if name == '__key__':
+        if not op((_KEY_RANK, path), value_key):
+          return False
+        continue
+
+      for property_pb in entity_pb.property:
+        if property_pb.name == name and property_pb.value.indexed:
+          if any(op(candidate, value_key)
+                 for candidate in _value_keys(property_pb.value)):
+            break
+      else:
+        return False
+    return True
+
+  def _order_value(self, entity_pb, path, name, descending):
+    """Get the value an entity sorts by for an order (or None to skip it)."""
+    if name == '__key__':
+      return (_KEY_RANK, path)
+    elif name == '__scatter__':
+      return (1, zlib.crc32(repr(path)))
+
+    for property_pb in entity_pb.property:
+      if property_pb.name == name and property_pb.value.indexed:
+        value_keys = _value_keys(property_pb.value)
+        return max(value_keys) if descending else min(value_keys)
+    return None
+
+  @staticmethod
+  def _compare(position, other, directions):
+    for value, other_value, descending in zip(position[0], other[0],
+                                              directions):
+      result = cmp(value, other_value)
+      if result:
+        return -result if descending else result
+    return cmp(position[1], other[1])
+
+  def _run_query(self, dataset_id, request_pb):
+    store = self._store(dataset_id)
+    query_pb = request_pb.query
+    namespace = request_pb.partition_id.namespace
+
+    if request_pb.HasField('gql_query'):
+      raise RequestError('runQuery', 400, 'GQL queries are not supported.')
+    if len(query_pb.kind) > 1:
+      raise RequestError('runQuery', 400, 'Only one kind can be queried.')
+    kind = query_pb.kind[0].name if len(query_pb.kind) else None
+
+    transaction = None
+    if request_pb.read_options.HasField('transaction'):
+      transaction = self._transaction('runQuery',
+                                      request_pb.read_options.transaction)
+
+    filters = []
+    ancestor = None
+    if query_pb.HasField('filter'):
+      for filter_pb in _property_filters(query_pb.filter):
+        if filter_pb.operator == datastore_pb.PropertyFilter.HAS_ANCESTOR:
+          ancestor = _path_key(filter_pb.value.key_value)
+        else:
+          filters.append((filter_pb.property.name,
+                          _OPERATORS[filter_pb.operator],
+                          _value_keys(filter_pb.value)[0]))
+
+    orders = [(order_pb.property.name,
+               order_pb.direction == datastore_pb.PropertyOrder.DESCENDING)
+              for order_pb in query_pb.order]
+    directions = [descending for _, descending in orders]
+
+    # Each result's position is its sort values and then its key.
+    results = []
+    for path in self._candidates(store, namespace, kind, filters, ancestor):
+      if ancestor is not None and path[:len(ancestor)] != ancestor:
+        continue
+      entity_pb = store.entities[(namespace, path)]
+      if not self._matches(entity_pb, path, filters):
+        continue
+
+      values = tuple(self._order_value(entity_pb, path, name, descending)
+                     for name, descending in orders)
+      if None not in values:
+        results.append(((values, path), entity_pb))
+
+    results.sort(key=lambda (position, _): position[1])
+    for i in reversed(range(len(orders))):
+      results.sort(key=lambda (position, _): position[0][i],
+                   reverse=directions[i])
+
+    compare = self._compare
+    if query_pb.start_cursor:
+      start = _decode_cursor(query_pb.start_cursor, 'runQuery')
+      results = [result for result in results
+                 if compare(result[0], start, directions) > 0]
+    if query_pb.end_cursor:
+      end = _decode_cursor(query_pb.end_cursor, 'runQuery')
+      results = [result for result in results
+                 if compare(result[0], end, directions) <= 0]
+
+    response_pb = datastore_pb.RunQueryResponse()
+    batch_pb = response_pb.batch
+    batch_pb.skipped_results = min(query_pb.offset, len(results))
+    results = results[query_pb.offset:]
+
+    limited = results
+    if query_pb.HasField('limit'):
+      limited = results[:query_pb.limit]
+    batch = limited[:self._batch_size]
+
+    if len(batch) < len(limited):
+      batch_pb.more_results = datastore_pb.QueryResultBatch.NOT_FINISHED
+    elif len(limited) < len(results):
+      batch_pb.more_results = (
+          datastore_pb.QueryResultBatch.MORE_RESULTS_AFTER_LIMIT)
+    else:
+      batch_pb.more_results = datastore_pb.QueryResultBatch.NO_MORE_RESULTS
+
+    if batch:
+      batch_pb.end_cursor = _encode_cursor(batch[-1][0])
+    elif query_pb.start_cursor:
+      batch_pb.end_cursor = query_pb.start_cursor
+
+    projection = [expression_pb.property.name
+                  for expression_pb in query_pb.projection]
+    if projection == ['__key__']:
+      batch_pb.entity_result_type = datastore_pb.EntityResult.KEY_ONLY
+    elif projection:
+      batch_pb.entity_result_type = datastore_pb.EntityResult.PROJECTION
+    else:
+      batch_pb.entity_result_type = datastore_pb.EntityResult.FULL
+
+    for (_, path), entity_pb in batch:
+      if transaction is not None:
+        transaction.reads.add((namespace, path))
+
+      result_pb = batch_pb.entity_result.add().entity
+      if not projection:
+        result_pb.CopyFrom(entity_pb)
+        continue
+
+      result_pb.key.CopyFrom(entity_pb.key)
+      for property_pb in entity_pb.property:
+        if property_pb.name in projection:
+          result_pb.property.add().CopyFrom(property_pb)
+    return response_pb
+
+  def _complete_key(self, dataset_id, key_pb):
+    key_pb.path_element[-1].id = next(self._ids)
+    self._response_key(dataset_id, key_pb)
+
+  def _commit(self, dataset_id, request_pb):
+    store = self._store(dataset_id)
+    mutation_pb = request_pb.mutation
+    response_pb = datastore_pb.CommitResponse()
+    result_pb = response_pb.mutation_result
+
+    def stored(key_pb):
+      return key_pb.partition_id.namespace, _path_key(key_pb)
+
+    # Check everything before changing anything, so commits are atomic.
+    for entity_pb in mutation_pb.update:
+      if stored(entity_pb.key) not in store.entities:
+        raise RequestError('commit', 400, 'No entity to update.')
+    for entity_pb in mutation_pb.insert:
+      if stored(entity_pb.key) in store.entities:
+        raise RequestError('commit', 400, 'Entity already exists.')
+    for entity_pb in itertools.chain(mutation_pb.upsert, mutation_pb.update,
+                                     mutation_pb.insert):
+      if _path_key(entity_pb.key)[-1][1] == 2:
+        raise RequestError('commit', 400, 'Keys must be complete.')
+
+    if request_pb.mode == datastore_pb.CommitRequest.TRANSACTIONAL:
+      transaction = self._transaction('commit', request_pb.transaction)
+      del self._transactions[request_pb.transaction]
+
+      touched = set(transaction.reads)
+      for entity_pb in itertools.chain(mutation_pb.upsert, mutation_pb.update,
+                                       mutation_pb.insert):
+        touched.add(stored(entity_pb.key))
+      touched.update(stored(key_pb) for key_pb in mutation_pb.delete)
+
+      if (any(store.versions.get(key, 0) > transaction.sequence
+              for key in touched) or
+          self._random.random() < self._conflict_rate):
+        raise RequestError('commit', 409,
+                           'Too much contention on these datastore entities.')
+
+    self._sequence += 1
+    index_updates = 0
+
+    for entity_pb in itertools.chain(mutation_pb.upsert, mutation_pb.update,
+                                     mutation_pb.insert,
+                                     mutation_pb.insert_auto_id):
+      entity_pb = datastore_pb.Entity.FromString(entity_pb.SerializeToString())
+      if _path_key(entity_pb.key)[-1][1] == 2:
+        self._complete_key(dataset_id, entity_pb.key)
+        result_pb.insert_auto_id_key.add().CopyFrom(entity_pb.key)
+      self._response_key(dataset_id, entity_pb.key)
+
+      namespace, path = stored(entity_pb.key)
+      index_updates += store.put(namespace, path, entity_pb)
+      store.versions[(namespace, path)] = self._sequence
+
+    for key_pb in mutation_pb.delete:
+      namespace, path = stored(key_pb)
+      index_updates += store.delete(namespace, path)
+      store.versions[(namespace, path)] = self._sequence
+
+    result_pb.index_updates = index_updates
+    return response_pb
+
+  def _begin_transaction(self, dataset_id, request_pb):
+    transaction_id = 'transaction-%d' % next(self._transaction_ids)
+    self._transactions[transaction_id] = _Transaction(dataset_id,
+                                                      self._sequence)
+    response_pb = datastore_pb.BeginTransactionResponse()
+    response_pb.transaction = transaction_id
+    return response_pb
+
+  def _rollback(self, dataset_id, request_pb):
+    self._transaction('rollback', request_pb.transaction)
+    del self._transactions[request_pb.transaction]
+    return datastore_pb.RollbackResponse()
+
+  def _allocate_ids(self, dataset_id, request_pb):
+    response_pb = datastore_pb.AllocateIdsResponse()
+    for key_pb in request_pb.key:
+      allocated = response_pb.key.add()
+      allocated.CopyFrom(key_pb)
+      self._complete_key(dataset_id, allocated)
+    return response_pb
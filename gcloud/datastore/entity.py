@@ -15,58 +15,20 @@ with extras built in that allow you to
 delete or persist the data stored on the entity.
 """
 
-from datetime import datetime
+from abc import ABCMeta
+from collections import MutableMapping
 
-from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore import helpers
 from gcloud.datastore.key import Key
 
 
-class Entity(dict):
-  """
-  :type dataset: :class:`gcloud.datastore.dataset.Dataset`
-  :param dataset: The dataset in which this entity belongs.
-
-  :type kind: string
-  :param kind: The kind of entity this is, akin to a table name in a
-               relational database.
+class _EntityMethods(object):
+  """What an :class:`Entity` adds to a mapping of its properties.
 
-  Entities are mutable and act like a subclass of a dictionary.
-  This means you could take an existing entity and change the key
-  to duplicate the object.
-
-  This can be used on its own, however it is likely easier to use
-  the shortcut methods provided by :class:`gcloud.datastore.dataset.Dataset`
-  such as:
-
-  - :func:`gcloud.datastore.dataset.Dataset.entity` to create a new entity.
-
-    >>> dataset.entity('MyEntityKind')
-    <Entity[{'kind': 'MyEntityKind'}] {}>
-
-  - :func:`gcloud.datastore.dataset.Dataset.get_entity` to retrive an existing entity.
-
-    >>> dataset.get_entity(key)
-    <Entity[{'kind': 'EntityKind', id: 1234}] {'property': 'value'}>
-
-  You can the set values on the entity just like you would on any other dictionary.
-
-  >>> entity['age'] = 20
-  >>> entity['name'] = 'JJ'
-  >>> entity
-  <Entity[{'kind': 'EntityKind', id: 1234}] {'age': 20, 'name': 'JJ'}>
-
-  And you can cast an entity to a regular Python dictionary with the `dict` builtin:
-
-  >>> dict(entity)
-  {'age': 20, 'name': 'JJ'}
+  These only use the mapping interface,
+  so :class:`LazyEntity` (which can't be a ``dict``) shares them.
   """
 
-  def __init__(self, dataset=None, kind=None):
-    if dataset and kind:
-      self._key = Key(dataset=dataset).kind(kind)
-    else:
-      self._key = None
-
   def dataset(self):
     """Get the :class:`gcloud.datastore.dataset.Dataset` in which this entity belonds.
 
@@ -114,6 +76,40 @@ class Entity(dict):
     if self.key():
       return self.key().kind()
 
+  def exclude_from_indexes(self, *names):
+    """Get or add the names of properties which shouldn't be indexed.
+
+    Properties which aren't indexed can't be filtered or sorted on,
+    but saving them doesn't write any index entries,
+    which makes saves faster and cheaper
+    (especially for long strings or counters which are never queried).
+
+    >>> entity.exclude_from_indexes('body', 'view_count')  # Returns the entity.
+    <Entity[{'kind': 'Article', 'id': 1234}] {...}>
+    >>> entity.exclude_from_indexes()
+    frozenset(['body', 'view_count'])
+
+    Defaults for the entity's kind can be set on the dataset
+    (see :func:`gcloud.datastore.dataset.Dataset.exclude_from_indexes`).
+    Those apply as well, but aren't included here.
+
+    :type names: strings
+    :param names: The names of the properties to exclude.
+
+    :returns: Either the names excluded from indexes or the :class:`Entity`.
+    """
+    if names:
+      self._exclude_from_indexes.update(names)
+      return self
+    return frozenset(self._exclude_from_indexes)
+
+  def _unindexed_names(self):
+    """Get the names of the properties to save without indexing them."""
+    names = self.exclude_from_indexes()
+    if self.dataset() and self.kind():
+      names |= self.dataset().exclude_from_indexes(self.kind())
+    return names
+
   @classmethod
   def from_key(cls, key):
     """Factory method for creating an entity based on the :class:`gcloud.datastore.key.Key`.
@@ -138,15 +134,14 @@ class Entity(dict):
     :returns: The :class:`Entity` derived from the :class:`gcloud.datastore.datastore_v1_pb2.Entity`.
     """
 
-    # This is here to avoid circular imports.
-    from gcloud.datastore import helpers
-
     key = Key.from_protobuf(pb.key, dataset=dataset)
     entity = cls.from_key(key)
 
     for property_pb in pb.property:
       value = helpers.get_value_from_protobuf(property_pb)
       entity[property_pb.name] = value
+      if not property_pb.value.indexed:
+        entity.exclude_from_indexes(property_pb.name)
 
     return entity
 
@@ -171,15 +166,49 @@ class Entity(dict):
       self.update(entity)
     return self
 
+  def _properties_to_save(self):
+    """Get the properties to send when saving the entity.
+
+    :rtype: tuple
+    :returns: A dict of properties to encode,
+              and a list of Property protobufs which are already encoded.
+    """
+    return dict(self), []
+
+  def to_protobuf(self):
+    """Convert the entity into a protobuf.
+
+    :rtype: :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+    :returns: An Entity protobuf with the entity's key and properties.
+    """
+    # This import is here so the protobuf module is only loaded when needed.
+    from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+
+    entity_pb = datastore_pb.Entity()
+    entity_pb.key.CopyFrom(self.key().to_protobuf())
+
+    properties, property_pbs = self._properties_to_save()
+    unindexed = self._unindexed_names()
+    helpers.add_properties(entity_pb, properties, unindexed)
+    for property_pb in property_pbs:
+      added = entity_pb.property.add()
+      added.CopyFrom(property_pb)
+      if property_pb.name in unindexed:
+        added.value.indexed = False
+
+    return entity_pb
+
   def save(self):
     """Save the entity in the Cloud Datastore.
 
     :rtype: :class:`gcloud.datastore.entity.Entity`
     :returns: The entity with a possibly updated Key.
     """
+    properties, property_pbs = self._properties_to_save()
     key_pb = self.dataset().connection().save_entity(
         dataset_id=self.dataset().id(), key_pb=self.key().to_protobuf(),
-        properties=dict(self))
+        properties=properties, property_pbs=property_pbs,
+        exclude_from_indexes=self._unindexed_names())
 
     # If we are in a transaction and the current entity needs an
     # automatically assigned ID, tell the transaction where to put that.
@@ -187,6 +216,9 @@ class Entity(dict):
     if transaction and self.key().is_partial():
       transaction.add_auto_id_entity(self)
 
+    # This import is here so the protobuf module is only loaded when needed.
+    from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+
     if isinstance(key_pb, datastore_pb.Key):
       updated_key = Key.from_protobuf(key_pb)
       # Update the path (which may have been altered).
@@ -195,6 +227,20 @@ class Entity(dict):
 
     return self
 
+  def save_async(self):
+    """Like :func:`save` but returns a future.
+
+    The save runs concurrently
+    if the dataset's connection is a
+    :class:`gcloud.datastore.connection.AsyncConnection`.
+    The entity's key is updated (if needed)
+    before the future is resolved.
+
+    :rtype: :class:`gcloud.datastore.workers.Future`
+    :returns: A future resolving to this entity.
+    """
+    return self.dataset().connection().submit(self.save)
+
   def delete(self):
     """Delete the entity in the Cloud Datastore.
 
@@ -206,10 +252,213 @@ class Entity(dict):
     self.dataset().connection().delete_entity(
         dataset_id=self.dataset().id(), key_pb=self.key().to_protobuf())
 
+  def delete_async(self):
+    """Like :func:`delete` but returns a future.
+
+    :rtype: :class:`gcloud.datastore.workers.Future`
+    :returns: A future which is resolved once the entity is deleted.
+    """
+    return self.dataset().connection().submit(self.delete)
+
   def __repr__(self):
     # TODO: Make sure that this makes sense.
     # An entity should have a key all the time (even if it's partial).
     if self.key():
-      return '<Entity%s %s>' % (self.key().path(), super(Entity, self).__repr__())
+      return '<Entity%s %r>' % (self.key().path(), dict(self))
     else:
-      return '<Entity %s>' % (super(Entity, self).__repr__())
+      return '<Entity %r>' % (dict(self),)
+
+
+class Entity(_EntityMethods, dict):
+  """
+  :type dataset: :class:`gcloud.datastore.dataset.Dataset`
+  :param dataset: The dataset in which this entity belongs.
+
+  :type kind: string
+  :param kind: The kind of entity this is, akin to a table name in a
+               relational database.
+
+  Entities are mutable and act like a subclass of a dictionary.
+  This means you could take an existing entity and change the key
+  to duplicate the object.
+
+  This can be used on its own, however it is likely easier to use
+  the shortcut methods provided by :class:`gcloud.datastore.dataset.Dataset`
+  such as:
+
+  - :func:`gcloud.datastore.dataset.Dataset.entity` to create a new entity.
+
+    >>> dataset.entity('MyEntityKind')
+    <Entity[{'kind': 'MyEntityKind'}] {}>
+
+  - :func:`gcloud.datastore.dataset.Dataset.get_entity` to retrive an existing entity.
+
+    >>> dataset.get_entity(key)
+    <Entity[{'kind': 'EntityKind', id: 1234}] {'property': 'value'}>
+
+  You can the set values on the entity just like you would on any other dictionary.
+
+  >>> entity['age'] = 20
+  >>> entity['name'] = 'JJ'
+  >>> entity
+  <Entity[{'kind': 'EntityKind', id: 1234}] {'age': 20, 'name': 'JJ'}>
+
+  And you can cast an entity to a regular Python dictionary with the `dict` builtin:
+
+  >>> dict(entity)
+  {'age': 20, 'name': 'JJ'}
+  """
+
+  __metaclass__ = ABCMeta
+
+  def __init__(self, dataset=None, kind=None):
+    if dataset and kind:
+      self._key = Key(dataset=dataset).kind(kind)
+    else:
+      self._key = None
+    self._exclude_from_indexes = set()
+
+
+class LazyEntity(_EntityMethods, MutableMapping):
+  """An entity which decodes its properties only when they're used.
+
+  Decoding every property of a wide entity
+  is wasteful when only a few of them are read.
+  A :class:`LazyEntity` holds on to the Entity protobuf it came from
+  and decodes each property the first time it's accessed.
+
+  When saved, only the properties which were set or deleted
+  are encoded again;
+  the rest are copied over from the original protobuf.
+
+  You'll get these by asking for them when fetching entities
+  (for instance, ``query.fetch(lazy=True)``
+  or ``dataset.get_entities(keys, lazy=True)``)
+  rather than by creating them yourself.
+  Otherwise, they act exactly like an :class:`Entity`
+  (and ``isinstance(entity, Entity)`` holds).
+
+  .. note::
+    A :class:`LazyEntity` is a mapping but not a ``dict``,
+    since ``dict(...)`` and ``dict.update`` copy another dict's storage
+    directly and would miss properties which haven't been decoded.
+    Converting it with ``dict(entity)`` decodes everything as usual.
+
+  :type key: :class:`gcloud.datastore.key.Key`
+  :param key: The entity's key.
+
+  :type pb: :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+  :param pb: The protobuf to decode properties from.
+
+  :type decode_value: callable
+  :param decode_value: A function converting a Value protobuf
+                       into a Python value (for instance,
+                       :func:`gcloud.datastore.decoder.EntityDecoder.decode_value`).
+  """
+
+  def __init__(self, key, pb, decode_value):
+    self._key = key
+    self._exclude_from_indexes = set()
+    self._pb = pb
+    self._decode_value = decode_value
+    self._values = {}  # The properties decoded or set so far.
+    self._indexes = None
+    self._deleted = set()
+    self._modified = set()
+
+  def _property_indexes(self):
+    """Get a map of property names to their position in the protobuf."""
+    if self._indexes is None:
+      indexes = {}
+      for i, property_pb in enumerate(self._pb.property):
+        indexes[property_pb.name] = i
+        if not property_pb.value.indexed:
+          self._exclude_from_indexes.add(property_pb.name)
+      self._indexes = indexes
+    return self._indexes
+
+  def exclude_from_indexes(self, *names):
+    # Properties stored unindexed stay that way.
+    self._property_indexes()
+    return super(LazyEntity, self).exclude_from_indexes(*names)
+
+  def _is_pending(self, name):
+    """Check whether a property exists but hasn't been decoded yet."""
+    return (name in self._property_indexes() and
+            name not in self._values and name not in self._deleted)
+
+  def _pending_names(self):
+    return [name for name in self._property_indexes()
+            if self._is_pending(name)]
+
+  def _decode(self, name):
+    property_pb = self._pb.property[self._property_indexes()[name]]
+    value = self._decode_value(property_pb.value)
+    self._values[name] = value
+    return value
+
+  def materialize(self):
+    """Decode every property which hasn't been decoded yet.
+
+    :rtype: :class:`LazyEntity`
+    :returns: The entity.
+    """
+    for name in self._pending_names():
+      self._decode(name)
+    return self
+
+  def __getitem__(self, name):
+    if self._is_pending(name):
+      return self._decode(name)
+    return self._values[name]
+
+  def __contains__(self, name):
+    return name in self._values or self._is_pending(name)
+
+  has_key = __contains__
+
+  def __setitem__(self, name, value):
+    self._deleted.discard(name)
+    self._modified.add(name)
+    self._values[name] = value
+
+  def __delitem__(self, name):
+    if name not in self:
+      raise KeyError(name)
+    self._values.pop(name, None)
+    self._deleted.add(name)
+    self._modified.discard(name)
+
+  def keys(self):
+    return self._values.keys() + self._pending_names()
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def __len__(self):
+    return len(self._values) + len(self._pending_names())
+
+  def copy(self):
+    return dict(self)
+
+  def _properties_to_save(self):
+    """Get the properties to send when saving the entity.
+
+    Properties which were set since the entity was loaded are encoded again,
+    and the rest are copied from the original protobuf.
+    """
+    properties = {}
+    property_pbs = []
+    indexes = self._property_indexes()
+
+    for name in self.keys():
+      if name in self._modified or name not in indexes:
+        properties[name] = self[name]
+      else:
+        property_pbs.append(self._pb.property[indexes[name]])
+
+    return properties, property_pbs
+
+
+# Lazy entities aren't dicts, but are entities in every other way.
+Entity.register(LazyEntity)
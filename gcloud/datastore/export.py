@@ -0,0 +1,463 @@
+"""Exporting entities from the Cloud Datastore to files.
+
+An :class:`Exporter` pages through a query with cursors
+and writes every entity to a file,
+while a pool of processes does the decoding, encoding and compressing::
+
+  >>> from gcloud.datastore.export import Exporter
+  >>> exporter = Exporter(dataset.query('Person'), 'people.json.gz')
+  >>> exporter.run()
+  {'rows': 1200000, 'bytes': 84011223, 'seconds': 412.5, ...}
+
+Two formats are supported:
+
+- ``json``: one JSON object per line,
+  with the entity's ``key`` and ``properties``.
+  Values JSON can't represent directly are tagged
+  (``{"$timestamp": "2014-01-01T00:00:00.000000Z"}``,
+  ``{"$key": {...}}``, ``{"$blob": "<base64>"}`` and so on).
+  This is meant for other tools to read.
+- ``protobuf``: each entity as a serialized
+  :class:`gcloud.datastore.datastore_v1_pb2.Entity`,
+  prefixed with its length as a varint
+  (the same framing as the protobuf library's ``writeDelimitedTo``).
+  This is lossless, so it's the one to use for backups.
+  Read the records back with :func:`gcloud.datastore.helpers.read_records`.
+
+Files are gzipped by default,
+as a series of gzip members (which any gzip reader handles).
+
+After every page is written,
+the cursor and file size are recorded in a checkpoint file
+(``<path>.checkpoint`` by default).
+If an export is interrupted,
+running it again picks up from the last checkpoint
+rather than starting over.
+The checkpoint is removed once the export finishes.
+
+Exports can also be run from the command line::
+
+  $ python -m gcloud.datastore.export --email=... --key-path=... \\
+      dataset-id Person people.json.gz
+"""
+
+import base64
+import gzip
+import json
+import multiprocessing
+import optparse
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from cStringIO import StringIO
+from itertools import chain
+
+import gcloud.datastore
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore import helpers
+from gcloud.datastore.helpers import encode_varint
+from gcloud.datastore.helpers import read_records  # Still importable from here.
+from gcloud.datastore.query import QueryIterator
+
+
+JSON = 'json'
+PROTOBUF = 'protobuf'
+FORMATS = (JSON, PROTOBUF)
+
+TIMESTAMP_FORMAT = '%04d-%02d-%02dT%02d:%02d:%02d.%06dZ'
+_TIMESTAMP_PARSE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def _as_is(value):
+  return value
+
+
+def _key_to_json(key_pb):
+  path = []
+  for element in key_pb.path_element:
+    item = {'kind': element.kind}
+    if element.HasField('id'):
+      item['id'] = element.id
+    elif element.HasField('name'):
+      item['name'] = element.name
+    path.append(item)
+
+  result = {'path': path}
+  if key_pb.partition_id.namespace:
+    result['namespace'] = key_pb.partition_id.namespace
+  return result
+
+
+def _timestamp_to_json(microseconds):
+  value = helpers.get_datetime_from_microseconds(microseconds)
+  return {'$timestamp': TIMESTAMP_FORMAT % (
+      value.year, value.month, value.day, value.hour, value.minute,
+      value.second, value.microsecond)}
+
+
+def _properties_to_json(entity_pb):
+  return dict((property_pb.name, _value_to_json(property_pb.value))
+              for property_pb in entity_pb.property)
+
+
+_JSON_ENCODERS = {
+    'boolean_value': _as_is,
+    'integer_value': _as_is,
+    'double_value': _as_is,
+    'string_value': _as_is,
+    'timestamp_microseconds_value': _timestamp_to_json,
+    'key_value': lambda key_pb: {'$key': _key_to_json(key_pb)},
+    'blob_value': lambda blob: {'$blob': base64.b64encode(blob)},
+    'blob_key_value': lambda blob_key: {'$blobKey': blob_key},
+    'entity_value': lambda entity_pb: {
+        '$entity': _properties_to_json(entity_pb)},
+    'list_value': lambda value_pbs: [_value_to_json(value_pb)
+                                     for value_pb in value_pbs],
+    }
+
+
+def _value_to_json(value_pb):
+  for field, value in value_pb.ListFields():
+    encoder = _JSON_ENCODERS.get(field.name)
+    if encoder is not None:
+      return encoder(value)
+
+
+def entity_to_json(entity_pb):
+  """Convert an Entity protobuf into a JSON-friendly dictionary.
+
+  :type entity_pb: :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+  :param entity_pb: The entity.
+
+  :rtype: dict
+  :returns: The entity's ``key`` and ``properties``,
+            as written to ``json`` exports.
+  """
+  return {'key': _key_to_json(entity_pb.key),
+          'properties': _properties_to_json(entity_pb)}
+
+
+def _key_from_json(key_pb, data):
+  if data.get('namespace'):
+    key_pb.partition_id.namespace = data['namespace']
+
+  for item in data['path']:
+    element = key_pb.path_element.add()
+    element.kind = item['kind']
+    if item.get('id') is not None:
+      element.id = item['id']
+    elif item.get('name') is not None:
+      element.name = item['name']
+
+
+def _timestamp_from_json(value_pb, text):
+  value = datetime.strptime(text, _TIMESTAMP_PARSE_FORMAT)
+  value_pb.timestamp_microseconds_value = (
+      helpers.get_microseconds_from_datetime(value))
+
+
+def _blob_from_json(value_pb, text):
+  value_pb.blob_value = base64.b64decode(text)
+
+
+def _blob_key_from_json(value_pb, text):
+  value_pb.blob_key_value = text
+
+
+def _properties_from_json(entity_pb, properties):
+  for name, data in properties.iteritems():
+    property_pb = entity_pb.property.add()
+    property_pb.name = name
+    _value_from_json(property_pb.value, data)
+
+
+_JSON_DECODERS = {
+    '$timestamp': _timestamp_from_json,
+    '$key': lambda value_pb, data: _key_from_json(value_pb.key_value, data),
+    '$blob': _blob_from_json,
+    '$blobKey': _blob_key_from_json,
+    '$entity': lambda value_pb, data: _properties_from_json(
+        value_pb.entity_value, data),
+    }
+
+
+def _value_from_json(value_pb, data):
+  if data is None:
+    return
+
+  if isinstance(data, list):
+    for item in data:
+      _value_from_json(value_pb.list_value.add(), item)
+  elif isinstance(data, dict):
+    if len(data) == 1 and data.keys()[0] in _JSON_DECODERS:
+      tag, tagged = data.items()[0]
+      _JSON_DECODERS[tag](value_pb, tagged)
+    else:
+      # Any other object is stored as an embedded entity.
+      _properties_from_json(value_pb.entity_value, data)
+  else:
+    helpers.set_protobuf_value(value_pb, data)
+
+
+def entity_from_json(data):
+  """Convert a dictionary, as written to ``json`` exports, into an Entity.
+
+  This is the reverse of :func:`entity_to_json`.
+  Untagged values are converted by type
+  (and plain objects become embedded entities).
+
+  :type data: dict
+  :param data: The entity's ``key`` and ``properties``.
+
+  :rtype: :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+  """
+  entity_pb = datastore_pb.Entity()
+  _key_from_json(entity_pb.key, data['key'])
+  _properties_from_json(entity_pb, data.get('properties', {}))
+  return entity_pb
+
+
+def _encode_batch(format, compress, batch_data):
+  """Encode a serialized QueryResultBatch as part of an export file.
+
+  This runs in a worker process, so only deals in strings.
+  """
+  batch = datastore_pb.QueryResultBatch.FromString(batch_data)
+  output = StringIO()
+  stream = output
+  if compress:
+    stream = gzip.GzipFile(fileobj=output, mode='wb', mtime=0)
+
+  if format == JSON:
+    for result in batch.entity_result:
+      stream.write(json.dumps(entity_to_json(result.entity), sort_keys=True,
+                              separators=(',', ':')))
+      stream.write('\n')
+  else:
+    for result in batch.entity_result:
+      data = result.entity.SerializeToString()
+      stream.write(encode_varint(len(data)))
+      stream.write(data)
+
+  if compress:
+    stream.close()
+  return output.getvalue()
+
+
+class Exporter(object):
+  """Exports the results of a query to a file.
+
+  :type query: :class:`gcloud.datastore.query.Query`
+  :param query: The query to export the results of
+                (usually every entity of a kind).
+
+  :type path: string
+  :param path: The file to write to.
+
+  :type format: string
+  :param format: Either ``'json'`` or ``'protobuf'``.
+
+  :type compress: bool
+  :param compress: Whether to gzip the file.
+
+  :type page_size: integer
+  :param page_size: The number of entities to request at once.
+                    A checkpoint is recorded after each page.
+
+  :type processes: integer
+  :param processes: The number of processes encoding entities.
+                    If ``None``, one per CPU.
+                    If ``0``, entities are encoded in this process.
+
+  :type checkpoint_path: string
+  :param checkpoint_path: Where to record checkpoints.
+                          Defaults to ``path`` plus ``.checkpoint``.
+  """
+
+  def __init__(self, query, path, format=JSON, compress=True, page_size=1000,
+               processes=None, checkpoint_path=None):
+    if format not in FORMATS:
+      raise ValueError('Unknown export format: %r (expected one of %s).' % (
+          format, ', '.join(FORMATS)))
+
+    if processes is None:
+      processes = multiprocessing.cpu_count()
+
+    self._query = query
+    self._path = path
+    self._format = format
+    self._compress = compress
+    self._page_size = page_size
+    self._processes = processes
+    self._checkpoint_path = checkpoint_path or path + '.checkpoint'
+
+  def checkpoint(self):
+    """Get the checkpoint left by an interrupted export, if any.
+
+    :rtype: dict or None
+    :returns: The ``cursor`` to resume from,
+              the ``offset`` in the file it corresponds to,
+              and the number of ``rows`` written before it.
+    """
+    if not os.path.exists(self._checkpoint_path):
+      return None
+
+    with open(self._checkpoint_path) as checkpoint_file:
+      checkpoint = json.load(checkpoint_file)
+
+    if (checkpoint['format'] != self._format or
+        checkpoint['compress'] != self._compress):
+      raise ValueError('The checkpoint at %s is for a different format.' %
+                       self._checkpoint_path)
+
+    checkpoint['cursor'] = base64.b64decode(checkpoint['cursor'])
+    return checkpoint
+
+  def _save_checkpoint(self, cursor, offset, rows):
+    checkpoint = {'cursor': base64.b64encode(cursor), 'offset': offset,
+                  'rows': rows, 'format': self._format,
+                  'compress': self._compress}
+
+    # Write then rename, so a crash never leaves a partial checkpoint.
+    temporary_path = self._checkpoint_path + '.tmp'
+    with open(temporary_path, 'w') as checkpoint_file:
+      json.dump(checkpoint, checkpoint_file)
+    os.rename(temporary_path, self._checkpoint_path)
+
+  def run(self, progress=None):
+    """Run (or resume) the export.
+
+    :type progress: callable
+    :param progress: Called with the statistics so far
+                     (see the return value) after each page is written.
+
+    :rtype: dict
+    :returns: The number of ``rows`` and ``bytes`` in the file,
+              the ``seconds`` this run took,
+              and the ``rows_per_second`` and ``bytes_per_second``
+              written during this run.
+    """
+    query = self._query
+    batches = None
+    checkpoint = self.checkpoint()
+    if checkpoint:
+      query = query.start_cursor(checkpoint['cursor'])
+      if query.limit():
+        if query.limit() > checkpoint['rows']:
+          query = query.limit(query.limit() - checkpoint['rows'])
+        else:
+          batches = []
+      output = open(self._path, 'r+b')
+      output.truncate(checkpoint['offset'])
+      output.seek(checkpoint['offset'])
+      rows = start_rows = checkpoint['rows']
+    else:
+      output = open(self._path, 'wb')
+      rows = start_rows = 0
+
+    start_offset = output.tell()
+    start = time.time()
+
+    def stats():
+      seconds = time.time() - start
+      elapsed = max(seconds, 1e-6)
+      return {'rows': rows, 'bytes': output.tell(), 'seconds': seconds,
+              'rows_per_second': (rows - start_rows) / elapsed,
+              'bytes_per_second': (output.tell() - start_offset) / elapsed}
+
+    # Start the pool before any threads, since it forks.
+    pool = None
+    if self._processes:
+      pool = multiprocessing.Pool(self._processes)
+
+    try:
+      if batches is None:
+        batches = QueryIterator(query, page_size=self._page_size).batches()
+      pending = deque()
+
+      # The trailing None flushes whatever is still pending.
+      for batch in chain(batches, [None]):
+        if batch is not None and batch.entity_result:
+          args = (self._format, self._compress, batch.SerializeToString())
+          if pool:
+            chunk = pool.apply_async(_encode_batch, args)
+          else:
+            chunk = _encode_batch(*args)
+          pending.append((chunk, batch.end_cursor, len(batch.entity_result)))
+
+        # Write out pages in order, keeping a bounded number in flight.
+        while pending and (batch is None or pool is None or
+                           len(pending) > self._processes * 2 or
+                           pending[0][0].ready()):
+          chunk, cursor, count = pending.popleft()
+          rows += count
+          self._write_chunk(output, chunk.get() if pool else chunk, cursor,
+                            rows)
+          if progress:
+            progress(stats())
+
+      result = stats()
+    finally:
+      output.close()
+      if pool:
+        pool.terminate()
+        pool.join()
+
+    if os.path.exists(self._checkpoint_path):
+      os.remove(self._checkpoint_path)
+    return result
+
+  def _write_chunk(self, output, data, cursor, rows):
+    output.write(data)
+    output.flush()
+    os.fsync(output.fileno())
+    self._save_checkpoint(cursor, output.tell(), rows)
+
+
+def main(argv=None):
+  """Run an export from the command line."""
+  parser = optparse.OptionParser(
+      usage='python -m gcloud.datastore.export [options] DATASET_ID KIND PATH')
+  parser.add_option('--email', help='The service account e-mail address.')
+  parser.add_option('--key-path', help='The service account private key.')
+  parser.add_option('--format', choices=FORMATS, default=JSON,
+                    help='json (the default) or protobuf.')
+  parser.add_option('--no-compress', action='store_false', dest='compress',
+                    default=True, help="Don't gzip the file.")
+  parser.add_option('--page-size', type='int', default=1000)
+  parser.add_option('--processes', type='int',
+                    help='Encoding processes (one per CPU by default).')
+  parser.add_option('--checkpoint', help='Where to record checkpoints.')
+  options, args = parser.parse_args(argv)
+
+  if len(args) != 3:
+    parser.error('Expected a dataset ID, a kind and a path.')
+  if not options.email or not options.key_path:
+    parser.error('--email and --key-path are required.')
+
+  dataset_id, kind, path = args
+  dataset = gcloud.datastore.get_dataset(dataset_id, options.email,
+                                         options.key_path)
+  exporter = Exporter(dataset.query(kind), path, format=options.format,
+                      compress=options.compress, page_size=options.page_size,
+                      processes=options.processes,
+                      checkpoint_path=options.checkpoint)
+
+  checkpoint = exporter.checkpoint()
+  if checkpoint:
+    print >> sys.stderr, 'Resuming after %d rows.' % checkpoint['rows']
+
+  def progress(stats):
+    print >> sys.stderr, '\r%(rows)d rows, %(rows_per_second).0f rows/s,' \
+        ' %(bytes_per_second).0f bytes/s' % stats,
+
+  stats = exporter.run(progress=progress)
+  print >> sys.stderr
+  print >> sys.stderr, ('Exported %(rows)d rows (%(bytes)d bytes) in '
+                        '%(seconds).1f s.' % stats)
+
+
+if __name__ == '__main__':
+  main()
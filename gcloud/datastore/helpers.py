@@ -1,11 +1,17 @@
 """Helper methods for dealing with Cloud Datastore's Protobuf API."""
 from datetime import datetime
-
-import pytz
+from datetime import timedelta
 
 from gcloud.datastore.key import Key
 
 
+EPOCH = datetime(1970, 1, 1)
+"""The moment timestamps in the Protobuf API are counted from (in UTC)."""
+
+# EPOCH with a UTC timezone, set once pytz is loaded.
+_utc_epoch = None
+
+
 def get_protobuf_attribute_and_value(val):
   """Given a value, return the protobuf attribute name and proper value.
 
@@ -29,26 +35,94 @@ def get_protobuf_attribute_and_value(val):
   ('string_value', 'my_string')
 
   :type val: `datetime.datetime`, :class:`gcloud.datastore.key.Key`,
-             bool, float, integer, string
+             bool, float, integer, string,
+             or any type registered with :func:`register_type`
   :param val: The value to be scrutinized.
 
-  :returns: A tuple of the attribute name and proper value type.
+  :returns: A tuple of the attribute name and proper value type
+            (or ``(None, None)`` for ``None``).
+
+  :raises: ValueError if there's no codec for the value's type.
+  """
+  # This import is here so the protobuf module is only loaded when needed.
+  from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+
+  value_pb = datastore_pb.Value()
+  CODECS.encode(value_pb, val)
+  # Skip the fields which aren't values (like ``meaning`` and ``indexed``).
+  value_fields = CODECS.field_decoders()
+  for field, value in value_pb.ListFields():
+    if field in value_fields:
+      return field.name, value
+  return None, None
+
+
+def set_protobuf_value(value_pb, val):
+  """Set the proper attribute on a Value protobuf for a Python value.
+
+  :type value_pb: :class:`gcloud.datastore.datastore_v1_pb2.Value`
+  :param value_pb: The Value protobuf to set.
+
+  :type val: `datetime.datetime`, :class:`gcloud.datastore.key.Key`,
+             bool, float, integer, string,
+             or any type registered with :func:`register_type`
+  :param val: The value to store on the protobuf.
+              ``None`` leaves the protobuf empty (a null).
+
+  :raises: ValueError if there's no codec for the value's type.
   """
+  CODECS.encode(value_pb, val)
 
-  if isinstance(val, datetime):
-    name, value = 'timestamp_microseconds', time.mktime(val.timetuple())
-  elif isinstance(val, Key):
-    name, value = 'key', val.to_protobuf()
-  elif isinstance(val, bool):
-    name, value = 'boolean', val
-  elif isinstance(val, float):
-    name, value = 'double', val
-  elif isinstance(val, (int, long)):
-    name, value = 'integer', val
-  elif isinstance(val, basestring):
-    name, value = 'string', val
 
-  return name + '_value', value
+def add_properties(entity_pb, properties, exclude_from_indexes=()):
+  """Add properties to an Entity protobuf.
+
+  >>> add_properties(entity_pb, {'name': u'Sally', 'age': 31})
+
+  :type entity_pb: :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+  :param entity_pb: The Entity protobuf to add the properties to.
+
+  :type properties: dict
+  :param properties: The names and (Python) values of the properties.
+
+  :type exclude_from_indexes: set of strings
+  :param exclude_from_indexes: The names of properties
+                               to mark as not indexed.
+  """
+  encode = CODECS.encode
+  for name, value in properties.iteritems():
+    property_pb = entity_pb.property.add()
+    property_pb.name = name
+    encode(property_pb.value, value)
+    if name in exclude_from_indexes:
+      property_pb.value.indexed = False
+
+
+def get_key_path(key_pb):
+  """Get a hashable identifier for a Key protobuf.
+
+  Two Key protobufs pointing at the same entity
+  have the same path,
+  even if one of them is missing the ``s~`` prefix on the dataset ID
+  (which the API adds to keys it returns).
+
+  >>> key = dataset.entity('Person').key().id(1234)
+  >>> get_key_path(key.to_protobuf())
+  (u'', ((u'Person', 1234, None),))
+
+  :type key_pb: :class:`gcloud.datastore.datastore_v1_pb2.Key`
+  :param key_pb: The Key protobuf.
+
+  :rtype: tuple
+  :returns: The namespace of the key and a tuple of
+            ``(kind, id, name)`` tuples for each element in the path.
+  """
+  path = []
+  for element in key_pb.path_element:
+    path.append((element.kind,
+                 element.id if element.HasField('id') else None,
+                 element.name if element.HasField('name') else None))
+  return key_pb.partition_id.namespace, tuple(path)
 
 
 def get_value_from_protobuf(pb):
@@ -64,28 +138,314 @@ def get_value_from_protobuf(pb):
   :type pb: :class:`gcloud.datastore.datastore_v1_pb2.Property`
   :param pb: The Property Protobuf.
 
-  :returns: The value provided by the Protobuf.
+  :returns: The value provided by the Protobuf
+            (converted by :data:`CODECS`).
+  """
+
+  return CODECS.decode(pb.value)
+
+
+def get_datetime_from_microseconds(microseconds):
+  """Convert a timestamp from the Protobuf API into a datetime.
+
+  :type microseconds: integer
+  :param microseconds: The number of microseconds since the epoch.
+
+  :rtype: `datetime.datetime`
+  :returns: The (UTC) datetime for the timestamp.
+  """
+  global _utc_epoch
+  if _utc_epoch is None:
+    # This import is here so pytz is only loaded when it's needed.
+    import pytz
+    _utc_epoch = EPOCH.replace(tzinfo=pytz.utc)
+  return _utc_epoch + timedelta(microseconds=microseconds)
+
+
+def get_microseconds_from_datetime(value):
+  """Convert a datetime into a timestamp for the Protobuf API.
+
+  :type value: `datetime.datetime`
+  :param value: The datetime to convert.
+                If it has no timezone, it's taken to be in UTC.
+
+  :rtype: integer
+  :returns: The number of microseconds since the epoch.
+  """
+  offset = value.utcoffset()
+  if offset is not None:
+    value = value.replace(tzinfo=None) - offset
+  delta = value - EPOCH
+  return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def encode_varint(value):
+  """Encode a length as a varint, to prefix a record with.
+
+  :type value: integer
+  :param value: The (non-negative) number to encode.
+
+  :rtype: string
+  """
+  data = []
+  while value > 0x7f:
+    data.append(chr(0x80 | (value & 0x7f)))
+    value >>= 7
+  data.append(chr(value))
+  return ''.join(data)
+
+
+def read_records(fileobj):
+  """Read length-prefixed records, as in ``protobuf`` exports and recordings.
+
+  Each record is prefixed with its length as a varint
+  (see :func:`encode_varint`)::
+
+    >>> with gzip.open('people.pb.gz') as fileobj:
+    ...   for data in read_records(fileobj):
+    ...     entity_pb = datastore_pb.Entity.FromString(data)
+
+  :type fileobj: file
+  :param fileobj: The file to read from.
+
+  :rtype: iterator of strings
+  :returns: Each serialized record.
+
+  :raises: ValueError if the file ends part way through a record.
+  """
+  while True:
+    length = shift = 0
+    while True:
+      byte = fileobj.read(1)
+      if not byte:
+        if shift:
+          raise ValueError('The file ends in the middle of a record.')
+        return
+      length |= (ord(byte) & 0x7f) << shift
+      shift += 7
+      if not ord(byte) & 0x80:
+        break
+
+    data = fileobj.read(length)
+    if len(data) != length:
+      raise ValueError('The file ends in the middle of a record.')
+    yield data
+
+
+def _encode_none(value_pb, value):
+  pass
+
+
+def _encode_boolean(value_pb, value):
+  value_pb.boolean_value = value
+
+
+def _encode_integer(value_pb, value):
+  value_pb.integer_value = value
+
+
+def _encode_double(value_pb, value):
+  value_pb.double_value = value
+
+
+def _encode_string(value_pb, value):
+  value_pb.string_value = value
+
+
+def _encode_timestamp(value_pb, value):
+  value_pb.timestamp_microseconds_value = get_microseconds_from_datetime(value)
+
+
+def _encode_key(value_pb, value):
+  value_pb.key_value.CopyFrom(value.to_protobuf())
+
+
+def _as_is(value):
+  return value
+
+
+class CodecRegistry(object):
+  """Converts Python values to and from Value protobufs.
+
+  The builtin types
+  (``None``, bool, integers, floats, strings,
+  `datetime.datetime` and :class:`gcloud.datastore.key.Key`)
+  are stored in their own fields.
+  Any other type can be registered with a function
+  converting it to one of those
+  (and optionally, a function converting it back)::
+
+    >>> registry.register(decimal.Decimal, str, decimal.Decimal, meaning=101)
+    >>> value_pb = datastore_pb.Value()
+    >>> registry.encode(value_pb, decimal.Decimal('1.10'))
+    >>> value_pb.string_value, value_pb.meaning
+    (u'1.10', 101)
+    >>> registry.decode(value_pb)
+    Decimal('1.10')
+
+  Values are matched on their exact type first,
+  then on the closest registered base class
+  (which is remembered for next time).
+
+  :data:`CODECS` is the registry used when saving entities,
+  building queries and decoding results.
   """
 
-  if pb.value.HasField('timestamp_microseconds_value'):
-    timestamp = pb.value.timestamp_microseconds_value / 1e6
-    return datetime.fromtimestamp(timestamp).replace(tzinfo=pytz.utc)
+  def __init__(self):
+    # Encoders are functions setting a Value protobuf to a Python value.
+    self._registered = {}
+    self._encoders = {}
+
+    # Decoders are keyed on field descriptors, for the results of ListFields,
+    # but those aren't looked up until the first value is decoded.
+    self._decoders_by_name = {}
+    self._field_decoders = None
+    self._meaning_decoders = {}
+
+    self._add_builtin(type(None), _encode_none)
+    self._add_builtin(bool, _encode_boolean, 'boolean_value')
+    self._add_builtin(int, _encode_integer, 'integer_value')
+    self._add_builtin(long, _encode_integer)
+    self._add_builtin(float, _encode_double, 'double_value')
+    self._add_builtin(basestring, _encode_string, 'string_value')
+    self._add_builtin(datetime, _encode_timestamp,
+                      'timestamp_microseconds_value',
+                      get_datetime_from_microseconds)
+    self._add_builtin(Key, _encode_key, 'key_value', Key.from_protobuf)
 
-  elif pb.value.HasField('key_value'):
-    return Key.from_protobuf(pb.value.key_value)
+  def _add_builtin(self, cls, encode, field=None, decode=_as_is):
+    self._registered[cls] = self._encoders[cls] = encode
+    if field is not None:
+      self._decoders_by_name[field] = decode
 
-  elif pb.value.HasField('boolean_value'):
-    return pb.value.boolean_value
+  def _load_field_decoders(self):
+    # This import is here so the protobuf module is only loaded when needed.
+    from gcloud.datastore import datastore_v1_pb2 as datastore_pb
 
-  elif pb.value.HasField('double_value'):
-    return pb.value.double_value
+    fields = datastore_pb.Value.DESCRIPTOR.fields_by_name
+    self._field_decoders = dict(
+        (fields[name], decode)
+        for name, decode in self._decoders_by_name.iteritems())
+    return self._field_decoders
 
-  elif pb.value.HasField('integer_value'):
-    return pb.value.integer_value
+  def register(self, cls, encode, decode=None, meaning=None):
+    """Register a codec for a type.
 
-  elif pb.value.HasField('string_value'):
-    return pb.value.string_value
+    :type cls: type
+    :param cls: The type (including its subclasses).
 
-  else:
-    # TODO(jjg): Should we raise a ValueError here?
-    return None
+    :type encode: callable
+    :param encode: A function converting a value of the type
+                   into a value of a type which can already be stored
+                   (for instance, a string or an integer).
+
+    :type decode: callable
+    :param decode: A function converting the stored value back.
+                   Only used for values with the given ``meaning``.
+
+    :type meaning: integer
+    :param meaning: A number to store in each Value protobuf's ``meaning``
+                    so the type can be recognised when decoding.
+                    Pick one well clear of the numbers
+                    the Cloud Datastore itself uses (say, above 100).
+    """
+    if decode is not None and not meaning:
+      raise ValueError('A meaning is needed to recognise values to decode.')
+
+    encode_value = self.encode
+    if meaning:
+      def encoder(value_pb, value):
+        encode_value(value_pb, encode(value))
+        value_pb.meaning = meaning
+    else:
+      def encoder(value_pb, value):
+        encode_value(value_pb, encode(value))
+
+    self._registered[cls] = encoder
+    if decode is not None:
+      self._meaning_decoders[meaning] = decode
+    # Subclasses may have been matched to a different base class.
+    self._encoders = dict(self._registered)
+
+  def _encoder_for(self, cls):
+    for base in cls.__mro__:
+      encoder = self._registered.get(base)
+      if encoder is not None:
+        self._encoders[cls] = encoder
+        return encoder
+
+    raise ValueError(
+        "Can't store %s values in the Cloud Datastore "
+        '(register a codec with gcloud.datastore.helpers.register_type).' %
+        cls.__name__)
+
+  def encode(self, value_pb, value):
+    """Set a Value protobuf to a Python value.
+
+    :type value_pb: :class:`gcloud.datastore.datastore_v1_pb2.Value`
+    :param value_pb: The Value protobuf to set.
+
+    :param value: The value to store on the protobuf.
+
+    :raises: ValueError if there's no codec for the value's type.
+    """
+    encoder = self._encoders.get(value.__class__)
+    if encoder is None:
+      encoder = self._encoder_for(type(value))
+    encoder(value_pb, value)
+
+  def decode(self, value_pb):
+    """Convert a Value protobuf into a Python value.
+
+    :type value_pb: :class:`gcloud.datastore.datastore_v1_pb2.Value`
+    :param value_pb: The Value protobuf.
+
+    :returns: The value, or ``None`` if it is unset (or of a type
+              that isn't supported yet).
+    """
+    value = None
+    decoders = self._field_decoders or self._load_field_decoders()
+    for field, raw_value in value_pb.ListFields():
+      decoder = decoders.get(field)
+      if decoder is not None:
+        value = decoder(raw_value)
+        break
+
+    if self._meaning_decoders:
+      decoder = self._meaning_decoders.get(value_pb.meaning)
+      if decoder is not None:
+        value = decoder(value)
+    return value
+
+  def field_decoders(self):
+    """Get the decoders for each field of a Value protobuf.
+
+    :rtype: dict
+    :returns: A map of field descriptors to functions
+              converting the field's value.
+    """
+    return dict(self._field_decoders or self._load_field_decoders())
+
+  def meaning_decoders(self):
+    """Get the decoders for registered types.
+
+    :rtype: dict
+    :returns: A map of ``meaning`` numbers to functions converting
+              an already decoded value into the registered type.
+    """
+    return dict(self._meaning_decoders)
+
+
+CODECS = CodecRegistry()
+"""The registry used for all conversions of property values."""
+
+
+def register_type(cls, encode, decode=None, meaning=None):
+  """Register a codec for a type with :data:`CODECS`.
+
+  >>> register_type(uuid.UUID, str, uuid.UUID, meaning=102)
+  >>> entity['token'] = uuid.uuid4()
+
+  See :func:`CodecRegistry.register`.
+  """
+  CODECS.register(cls, encode, decode, meaning)
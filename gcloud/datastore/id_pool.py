@@ -0,0 +1,179 @@
+"""A client-side pool of IDs reserved ahead of time.
+
+Saving an entity with a partial key means an ``insert_auto_id``,
+and the key isn't known until the commit returns.
+An :class:`IdPool` reserves IDs in blocks
+(see :func:`gcloud.datastore.dataset.Dataset.allocate_ids`)
+and hands them out locally,
+so new entities get complete keys straight away::
+
+  >>> from gcloud.datastore.id_pool import IdPool
+  >>> pool = IdPool(dataset, block_size=500)
+  >>> key = pool.next_key(dataset.entity('Person').key())
+  >>> key.id()
+  5629499534213120
+
+Each partial key (that is, each kind under each parent) has its own IDs.
+When a key's IDs run low,
+the next block is reserved on a background thread,
+so callers rarely wait on a request.
+
+Pools are thread-safe.
+"""
+
+import threading
+from collections import deque
+
+from gcloud.datastore.workers import Future
+from gcloud.datastore.workers import run_in_thread
+
+
+class _Reserve(object):
+  """The IDs reserved for one partial key."""
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.ids = deque()
+    self.refill = None
+
+
+class IdPool(object):
+  """Hands out IDs reserved in blocks.
+
+  :type dataset: :class:`gcloud.datastore.dataset.Dataset`
+  :param dataset: The dataset to reserve IDs in.
+
+  :type block_size: integer
+  :param block_size: The number of IDs to reserve at once.
+
+  :type low_water: integer
+  :param low_water: Reserve the next block once this few IDs are left.
+                    Defaults to a quarter of the block size.
+
+  :type prefetch: bool
+  :param prefetch: Whether to reserve the next block in the background
+                   (rather than when the IDs run out).
+  """
+
+  def __init__(self, dataset, block_size=100, low_water=None, prefetch=True):
+    if block_size < 1:
+      raise ValueError('The block size must be at least 1.')
+
+    self._dataset = dataset
+    self._block_size = block_size
+    self._low_water = block_size // 4 if low_water is None else low_water
+    self._prefetch = prefetch
+    self._reserves = {}
+    self._lock = threading.Lock()
+
+  def _reserve_for(self, key):
+    with self._lock:
+      reserve = self._reserves.get(key)
+      if reserve is None:
+        reserve = self._reserves[key] = _Reserve()
+      return reserve
+
+  def _allocate(self, key, count):
+    return [allocated.id()
+            for allocated in self._dataset.allocate_ids(key, count)]
+
+  def _start_refill(self, key, count, background):
+    if background:
+      return run_in_thread(self._allocate, key, count)
+    return Future.from_call(self._allocate, key, count)
+
+  @staticmethod
+  def _collect(reserve):
+    """Add the IDs from a finished background refill (with the lock held)."""
+    if reserve.refill is not None and reserve.refill.ready():
+      try:
+        ids = reserve.refill.get()
+      except Exception:
+        return  # Raised again when the IDs are needed.
+      reserve.ids.extend(ids)
+      reserve.refill = None
+
+  def next_keys(self, key, count):
+    """Complete a partial key with several reserved IDs.
+
+    :type key: :class:`gcloud.datastore.key.Key`
+    :param key: A partial key (with a kind but no ID or name).
+
+    :type count: integer
+    :param count: The number of keys wanted.
+
+    :rtype: list of :class:`gcloud.datastore.key.Key`
+    :returns: Complete keys, each with a different ID.
+    """
+    if not key.is_partial():
+      raise ValueError('Only partial keys can be given IDs.')
+
+    reserve = self._reserve_for(key)
+    ids = []
+    with reserve.lock:
+      self._collect(reserve)
+      while len(ids) < count:
+        if not reserve.ids:
+          if reserve.refill is None:
+            wanted = max(self._block_size, count - len(ids))
+            reserve.refill = self._start_refill(key, wanted, False)
+          refill, reserve.refill = reserve.refill, None
+          reserve.ids.extend(refill.get())
+
+        while reserve.ids and len(ids) < count:
+          ids.append(reserve.ids.popleft())
+
+      if (self._prefetch and reserve.refill is None and
+          len(reserve.ids) <= self._low_water):
+        reserve.refill = self._start_refill(key, self._block_size, True)
+
+    return [key.id(id) for id in ids]
+
+  def next_key(self, key):
+    """Complete a partial key with a reserved ID.
+
+    :type key: :class:`gcloud.datastore.key.Key`
+    :param key: A partial key (with a kind but no ID or name).
+
+    :rtype: :class:`gcloud.datastore.key.Key`
+    :returns: A complete key.
+    """
+    return self.next_keys(key, 1)[0]
+
+  def complete(self, entities):
+    """Give every entity with a partial key a complete one.
+
+    >>> people = [dataset.entity('Person') for i in range(100)]
+    >>> dataset.put_entities(pool.complete(people))  # All upserts.
+
+    :type entities: list of :class:`gcloud.datastore.entity.Entity`
+    :param entities: The entities to complete the keys of.
+                     Entities with complete keys are left alone.
+
+    :rtype: list of :class:`gcloud.datastore.entity.Entity`
+    :returns: The entities.
+    """
+    entities = list(entities)
+    by_key = {}
+    for entity in entities:
+      if entity.key().is_partial():
+        by_key.setdefault(entity.key(), []).append(entity)
+
+    for key, partial_entities in by_key.iteritems():
+      keys = self.next_keys(key, len(partial_entities))
+      for entity, complete_key in zip(partial_entities, keys):
+        entity.key(complete_key)
+    return entities
+
+  def available(self, key):
+    """Get the number of IDs reserved for a partial key and not yet used.
+
+    :type key: :class:`gcloud.datastore.key.Key`
+    :param key: A partial key.
+
+    :rtype: integer
+    """
+    reserve = self._reserve_for(key)
+    with reserve.lock:
+      self._collect(reserve)
+      return len(reserve.ids)
@@ -1,142 +1,200 @@
-import copy
 from itertools import izip
 
-from gcloud.datastore import datastore_v1_pb2 as datastore_pb
 from gcloud.datastore.dataset import Dataset
 
 
 class Key(object):
-  # TODO: Determine if this really should be immutable.
   """
   An immutable representation of a datastore Key.
+
+  Every "setter" returns a new Key,
+  leaving the original untouched.
+  Keys are hashable and compare equal
+  when they point at the same entity,
+  so they can be used in sets and as dictionary keys::
+
+    >>> key = Key.from_path('Person', 1234, dataset=dataset)
+    >>> key == Key.from_path('Person', 1234, dataset=dataset)
+    True
+    >>> entities_by_key = {key: entity}
+
+  The protobuf (and its serialized form)
+  is built the first time it's asked for
+  and reused after that.
   """
 
+  __slots__ = ('_dataset', '_namespace', '_path', '_pb', '_serialized',
+               '_hash')
+
+  _EMPTY_PATH = (('', None, None),)
+
   def __init__(self, dataset=None, namespace=None, path=None):
     self._dataset = dataset
     self._namespace = namespace
-    self._path = path or [{'kind': ''}]
+    self._path = self._freeze_path(path) if path else self._EMPTY_PATH
+    self._pb = None
+    self._serialized = None
+    self._hash = None
+
+  @staticmethod
+  def _freeze_path(path):
+    """Convert a path (a list of dicts) into a tuple of tuples.
 
-  def _clone(self):
-    """Duplicates the Key.
+    Each element of the path becomes a ``(kind, id, name)`` tuple.
+    """
+    return tuple((element.get('kind', ''), element.get('id'),
+                  element.get('name')) for element in path)
 
-    We make a shallow copy of the :class:`gcloud.datastore.dataset.Dataset`
-    because it holds a reference an authenticated connection,
+  def _clone(self, **changes):
+    """Duplicates the Key, with some attributes changed.
+
+    Nothing is copied but references,
+    since the Key's path is immutable
+    and the :class:`gcloud.datastore.dataset.Dataset`
+    holds a reference to an authenticated connection,
     which we don't want to lose.
     """
-    clone = copy.deepcopy(self)
-    clone._dataset = self._dataset  # Make a shallow copy of the Dataset.
+    clone = Key.__new__(Key)
+    clone._dataset = changes.get('dataset', self._dataset)
+    clone._namespace = changes.get('namespace', self._namespace)
+    clone._path = changes.get('path', self._path)
+    clone._pb = None
+    clone._serialized = None
+    clone._hash = None
     return clone
 
+  def _replace_last(self, **values):
+    """Get a copy of our path with parts of the last element replaced."""
+    kind, id, name = self._path[-1]
+    last = (values.get('kind', kind), values.get('id', id),
+            values.get('name', name))
+    return self._path[:-1] + (last,)
+
   @classmethod
   def from_protobuf(cls, pb, dataset=None):
     path = []
     for element in pb.path_element:
-      element_dict = {'kind': element.kind}
-
-      if element.HasField('id'):
-        element_dict['id'] = element.id
-
-      elif element.HasField('name'):
-        element_dict['name'] = element.name
-
-      path.append(element_dict)
+      path.append((element.kind,
+                   element.id if element.HasField('id') else None,
+                   element.name if element.HasField('name') else None))
 
     if not dataset:
       dataset = Dataset(id=pb.partition_id.dataset_id)
 
-    return cls(path=path, dataset=dataset)
+    key = cls(dataset=dataset, namespace=pb.partition_id.namespace or None)
+    key._path = tuple(path)
+    return key
 
   def to_protobuf(self):
+    """Get the protobuf representing this key.
+
+    The protobuf is built the first time this is called
+    and the same protobuf is returned on every later call,
+    so it shouldn't be modified.
+
+    :rtype: :class:`gcloud.datastore.datastore_v1_pb2.Key`
+    :returns: A Key protobuf that can be sent to the protobuf API.
+    """
+    if self._pb is not None:
+      return self._pb
+
+    # This import is here so the protobuf module is only loaded when needed.
+    from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+
     key = datastore_pb.Key()
 
     # Apparently 's~' is a prefix for High-Replication and is necessary here.
-    dataset_id = self.dataset().id()
+    dataset_id = self._dataset_id()
     if dataset_id:
-      if not dataset_id.startswith('s~'):
-        dataset_id = 's~' + dataset_id
-
-      key.partition_id.dataset_id = dataset_id
+      key.partition_id.dataset_id = 's~' + dataset_id
 
     if self._namespace:
       key.partition_id.namespace = self._namespace
 
-    for item in self.path():
+    for kind, id, name in self._path:
       element = key.path_element.add()
-      if 'kind' in item:
-        element.kind = item['kind']
-      if 'id' in item:
-        element.id = item['id']
-      if 'name' in item:
-        element.name = item['name']
+      element.kind = kind
+      if id is not None:
+        element.id = id
+      if name is not None:
+        element.name = name
 
+    self._pb = key
     return key
 
+  def serialized(self):
+    """Get the serialized protobuf representing this key.
+
+    Like the protobuf, this is only computed once.
+
+    :rtype: string
+    :returns: The key protobuf, serialized.
+    """
+    if self._serialized is None:
+      self._serialized = self.to_protobuf().SerializeToString()
+    return self._serialized
+
   @classmethod
   def from_path(cls, *args, **kwargs):
     path = []
     items = iter(args)
 
     for kind, id_or_name in izip(items, items):
-      entry = {'kind': kind}
       if isinstance(id_or_name, basestring):
-        entry['name'] = id_or_name
+        path.append((kind, None, id_or_name))
       else:
-        entry['id'] = id_or_name
-      path.append(entry)
+        path.append((kind, id_or_name, None))
 
-    kwargs['path'] = path
-    return cls(**kwargs)
+    key = cls(**kwargs)
+    key._path = tuple(path)
+    return key
 
   def is_partial(self):
     return (self.id_or_name() is None)
 
   def dataset(self, dataset=None):
     if dataset:
-      clone = self._clone()
-      clone._dataset = dataset
-      return clone
+      return self._clone(dataset=dataset)
     else:
       return self._dataset
 
   def namespace(self, namespace=None):
     if namespace:
-      clone = self._clone()
-      clone._namespace = namespace
-      return clone
+      return self._clone(namespace=namespace)
     else:
       return self._namespace
 
   def path(self, path=None):
     if path:
-      clone = self._clone()
-      clone._path = path
-      return clone
+      return self._clone(path=self._freeze_path(path))
     else:
-      return self._path
+      elements = []
+      for kind, id, name in self._path:
+        element = {'kind': kind}
+        if id is not None:
+          element['id'] = id
+        if name is not None:
+          element['name'] = name
+        elements.append(element)
+      return elements
 
   def kind(self, kind=None):
     if kind:
-      clone = self._clone()
-      clone._path[-1]['kind'] = kind
-      return clone
-    elif self.path():
-      return self._path[-1]['kind']
+      return self._clone(path=self._replace_last(kind=kind))
+    elif self._path:
+      return self._path[-1][0]
 
   def id(self, id=None):
     if id:
-      clone = self._clone()
-      clone._path[-1]['id'] = id
-      return clone
-    elif self.path():
-      return self._path[-1].get('id')
+      return self._clone(path=self._replace_last(id=id))
+    elif self._path:
+      return self._path[-1][1]
 
   def name(self, name=None):
     if name:
-      clone = self._clone()
-      clone._path[-1]['name'] = name
-      return clone
-    elif self.path():
-      return self._path[-1].get('name')
+      return self._clone(path=self._replace_last(name=name))
+    elif self._path:
+      return self._path[-1][2]
 
   def id_or_name(self):
     return self.id() or self.name()
@@ -144,5 +202,28 @@ class Key(object):
   def parent(self):
     raise NotImplementedError
 
+  def _dataset_id(self):
+    """Get our dataset's ID without any 's~' prefix."""
+    dataset_id = self._dataset.id() if self._dataset else None
+    if dataset_id and dataset_id.startswith('s~'):
+      dataset_id = dataset_id[2:]
+    return dataset_id
+
+  def __eq__(self, other):
+    if not isinstance(other, Key):
+      return NotImplemented
+    return (self._path == other._path and
+            self._namespace == other._namespace and
+            self._dataset_id() == other._dataset_id())
+
+  def __ne__(self, other):
+    equal = self.__eq__(other)
+    return equal if equal is NotImplemented else not equal
+
+  def __hash__(self):
+    if self._hash is None:
+      self._hash = hash((self._dataset_id(), self._namespace, self._path))
+    return self._hash
+
   def __repr__(self):
     return '<Key%s>' % self.path()
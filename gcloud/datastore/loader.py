@@ -0,0 +1,415 @@
+"""Loading entities into the Cloud Datastore in bulk.
+
+Saving entities one at a time costs a ``commit`` request each.
+A :class:`Loader` reads records straight into Entity protobufs,
+packs them into as few commits as the API allows
+(bounded by entity count and request size)
+and sends several commits at once::
+
+  >>> from gcloud.datastore import loader
+  >>> with open('people.csv') as csv_file:
+  ...   entity_pbs = loader.read_csv(csv_file, 'Person', key_column='id',
+  ...                                types={'age': int})
+  ...   stats = loader.Loader(dataset).load(entity_pbs)
+  >>> stats['rows'], stats['rows_per_second']
+  (1000000, 8240.5)
+
+Records can come from CSV files (:func:`read_csv`),
+JSON lines files (:func:`read_jsonl`)
+or length-prefixed protobuf files (:func:`read_protobuf`),
+including those written by :mod:`gcloud.datastore.export`.
+Files are read as a stream,
+and only a few batches are held in memory at a time.
+
+Entities with complete keys are upserted;
+entities with partial keys are given IDs automatically.
+
+A batch which fails doesn't stop the load.
+Failed batches are returned (with their errors),
+so they can be retried with :func:`Loader.retry`.
+
+Loads can also be run from the command line::
+
+  $ python -m gcloud.datastore.loader --email=... --key-path=... \\
+      --kind=Person --key-column=id dataset-id people.csv
+"""
+
+import csv
+import gzip
+import json
+import optparse
+import os
+import sys
+import time
+from collections import deque
+
+import gcloud.datastore
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore import helpers
+from gcloud.datastore.connection import Connection
+from gcloud.datastore.export import entity_from_json
+from gcloud.datastore.helpers import read_records
+from gcloud.datastore.workers import WorkerPool
+
+
+FORMATS = ('csv', 'jsonl', 'protobuf')
+
+_EXTENSIONS = {'.csv': 'csv', '.json': 'jsonl', '.jsonl': 'jsonl',
+               '.pb': 'protobuf', '.protobuf': 'protobuf'}
+
+
+def _path_element(kind, id_or_name):
+  element = {'kind': kind}
+  if isinstance(id_or_name, basestring) and id_or_name.isdigit():
+    id_or_name = int(id_or_name)
+
+  if isinstance(id_or_name, (int, long)):
+    element['id'] = id_or_name
+  elif id_or_name:
+    element['name'] = id_or_name
+  return element
+
+
+def _update_rates(stats, start):
+  stats['seconds'] = time.time() - start
+  elapsed = max(stats['seconds'], 1e-6)
+  stats['rows_per_second'] = stats['rows'] / elapsed
+  stats['bytes_per_second'] = stats['bytes'] / elapsed
+
+
+def read_csv(fileobj, kind, key_column=None, types=None):
+  """Read entities from a CSV file with a header row.
+
+  Every column becomes a (string) property,
+  except for empty cells, which are left out.
+
+  :type fileobj: file
+  :param fileobj: The file to read.
+
+  :type kind: string
+  :param kind: The kind of the entities.
+
+  :type key_column: string
+  :param key_column: The column holding the ID (if it's all digits)
+                     or name of each entity.
+                     If ``None``, every entity gets an automatic ID.
+
+  :type types: dict
+  :param types: Functions converting the text in particular columns
+                (for instance, ``{'age': int}``).
+
+  :rtype: iterator of :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+  """
+  types = types or {}
+
+  for row in csv.DictReader(fileobj):
+    entity_pb = datastore_pb.Entity()
+    id_or_name = row.pop(key_column, None) if key_column else None
+    entity_pb.key.path_element.add(**_path_element(kind, id_or_name))
+
+    for name, value in row.iteritems():
+      # Extra cells (beyond the header) are keyed on None.
+      if name is None or value == '':
+        continue
+      value = value.decode('utf-8')
+      if name in types:
+        value = types[name](value)
+
+      property_pb = entity_pb.property.add()
+      property_pb.name = name
+      helpers.set_protobuf_value(property_pb.value, value)
+
+    yield entity_pb
+
+
+def read_jsonl(fileobj, kind=None, key_property=None):
+  """Read entities from a file with a JSON object on each line.
+
+  By default, each line is expected to be in the format
+  written by :mod:`gcloud.datastore.export`
+  (see :func:`gcloud.datastore.export.entity_from_json`).
+  If a ``kind`` is given,
+  each object is instead taken to be the entity's properties.
+
+  :type fileobj: file
+  :param fileobj: The file to read.
+
+  :type kind: string
+  :param kind: The kind of the entities,
+               if each line holds only properties.
+
+  :type key_property: string
+  :param key_property: With ``kind``, the property holding
+                       the ID or name of each entity
+                       (which isn't stored as a property).
+
+  :rtype: iterator of :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+  """
+  for line in fileobj:
+    if not line.strip():
+      continue
+
+    data = json.loads(line)
+    if kind is not None:
+      id_or_name = data.pop(key_property, None) if key_property else None
+      data = {'key': {'path': [_path_element(kind, id_or_name)]},
+              'properties': data}
+    yield entity_from_json(data)
+
+
+def read_protobuf(fileobj):
+  """Read entities from a file of length-prefixed Entity protobufs.
+
+  See :func:`gcloud.datastore.helpers.read_records`.
+
+  :type fileobj: file
+  :param fileobj: The file to read.
+
+  :rtype: iterator of :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+  """
+  for data in read_records(fileobj):
+    yield datastore_pb.Entity.FromString(data)
+
+
+class Batch(object):
+  """A group of entities committed together.
+
+  Besides its ``first_row``, a batch has
+  the number of entities it holds (``count``),
+  their approximate size in bytes (``size``),
+  the ``mutation`` to commit,
+  and the exception raised committing it (``error``), if it failed.
+
+  :type first_row: integer
+  :param first_row: The position of the batch's first entity in the input.
+  """
+
+  def __init__(self, first_row):
+    self.first_row = first_row
+    self.count = 0
+    self.size = 0
+    self.mutation = datastore_pb.Mutation()
+    self.error = None
+
+  def add(self, entity_pb, size):
+    """Add an Entity protobuf to the batch's mutation."""
+    path = entity_pb.key.path_element[-1]
+    if path.HasField('id') or path.HasField('name'):
+      self.mutation.upsert.add().CopyFrom(entity_pb)
+    else:
+      self.mutation.insert_auto_id.add().CopyFrom(entity_pb)
+    self.count += 1
+    self.size += size
+
+  def __repr__(self):
+    return '<Batch rows %d-%d%s>' % (
+        self.first_row, self.first_row + self.count - 1,
+        ' failed: %s' % self.error if self.error else '')
+
+
+class Loader(object):
+  """Commits entities to a dataset in concurrent batches.
+
+  :type dataset: :class:`gcloud.datastore.dataset.Dataset`
+  :param dataset: The dataset to load the entities into.
+
+  :type max_entities: integer
+  :param max_entities: The maximum number of entities in a commit.
+
+  :type max_bytes: integer
+  :param max_bytes: The maximum (approximate) size of a commit.
+
+  :type concurrency: integer
+  :param concurrency: The number of commits to send at once.
+  """
+
+  ENTITY_OVERHEAD = Connection.COMMIT_ENTITY_OVERHEAD
+  """Bytes added to each entity's size for its framing in the request."""
+
+  def __init__(self, dataset, max_entities=Connection.MAX_COMMIT_ENTITIES,
+               max_bytes=Connection.MAX_COMMIT_BYTES, concurrency=4):
+    self._dataset = dataset
+    self._max_entities = max_entities
+    self._max_bytes = max_bytes
+    self._concurrency = concurrency
+
+  def batches(self, entity_pbs):
+    """Pack Entity protobufs into batches.
+
+    A batch is full once adding another entity would take it over
+    either ``max_entities`` or ``max_bytes``.
+    (An entity bigger than ``max_bytes`` gets a batch of its own.)
+    Properties which the dataset excludes from indexes
+    (see :func:`gcloud.datastore.dataset.Dataset.exclude_from_indexes`)
+    are marked as not indexed.
+
+    :type entity_pbs: iterable of
+                      :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+    :param entity_pbs: The entities to pack.
+
+    :rtype: iterator of :class:`Batch`
+    """
+    batch = Batch(first_row=0)
+    for row, entity_pb in enumerate(entity_pbs):
+      # Keys from an export of another dataset refer to that dataset,
+      # so leave it to the request to say which one they belong to.
+      entity_pb.key.partition_id.ClearField('dataset_id')
+
+      unindexed = self._dataset.exclude_from_indexes(
+          entity_pb.key.path_element[-1].kind)
+      if unindexed:
+        for property_pb in entity_pb.property:
+          if property_pb.name in unindexed:
+            property_pb.value.indexed = False
+
+      size = entity_pb.ByteSize() + self.ENTITY_OVERHEAD
+
+      if batch.count and (batch.count >= self._max_entities or
+                          batch.size + size > self._max_bytes):
+        yield batch
+        batch = Batch(first_row=row)
+      batch.add(entity_pb, size)
+
+    if batch.count:
+      yield batch
+
+  def _commit(self, batch):
+    connection = self._dataset.connection()
+    connection.commit(self._dataset.id(), batch.mutation)
+
+  def load(self, entity_pbs, progress=None):
+    """Commit entities to the dataset.
+
+    :type entity_pbs: iterable of
+                      :class:`gcloud.datastore.datastore_v1_pb2.Entity`
+    :param entity_pbs: The entities to commit
+                       (for instance, from :func:`read_csv`).
+
+    :type progress: callable
+    :param progress: Called with the statistics so far
+                     (see the return value) after each batch finishes.
+
+    :rtype: dict
+    :returns: The number of ``rows``, ``batches`` and ``bytes`` committed,
+              the ``seconds`` taken,
+              ``rows_per_second`` and ``bytes_per_second``,
+              and a list of the batches which ``failed``
+              (see :func:`retry`).
+    """
+    return self._run(self.batches(entity_pbs), progress)
+
+  def retry(self, batches, progress=None):
+    """Commit batches which failed in an earlier load again.
+
+    :type batches: list of :class:`Batch`
+    :param batches: The batches to commit.
+
+    :type progress: callable
+    :param progress: See :func:`load`.
+
+    :rtype: dict
+    :returns: See :func:`load`.
+    """
+    for batch in batches:
+      batch.error = None
+    return self._run(batches, progress)
+
+  def _run(self, batches, progress):
+    stats = {'rows': 0, 'batches': 0, 'bytes': 0, 'failed': []}
+    start = time.time()
+
+    def finish(batch, future):
+      try:
+        future.get()
+      except Exception, e:
+        batch.error = e
+        stats['failed'].append(batch)
+      else:
+        stats['rows'] += batch.count
+        stats['batches'] += 1
+        stats['bytes'] += batch.size
+
+      _update_rates(stats, start)
+      if progress:
+        progress(stats)
+
+    pool = WorkerPool(max_workers=self._concurrency)
+    pending = deque()
+    try:
+      for batch in batches:
+        pending.append((batch, pool.submit(self._commit, batch)))
+        # Wait for the oldest commit, to keep memory bounded.
+        if len(pending) >= self._concurrency:
+          finish(*pending.popleft())
+
+      while pending:
+        finish(*pending.popleft())
+    finally:
+      pool.close()
+
+    _update_rates(stats, start)
+    return stats
+
+
+def main(argv=None):
+  """Run a load from the command line."""
+  parser = optparse.OptionParser(
+      usage='python -m gcloud.datastore.loader [options] DATASET_ID PATH')
+  parser.add_option('--email', help='The service account e-mail address.')
+  parser.add_option('--key-path', help='The service account private key.')
+  parser.add_option('--format', choices=FORMATS,
+                    help='csv, jsonl or protobuf (guessed from the path).')
+  parser.add_option('--kind', help='The kind of entity (for CSV and JSON).')
+  parser.add_option('--key-column',
+                    help='The column or property holding IDs or names.')
+  parser.add_option('--batch-size', type='int',
+                    default=Connection.MAX_COMMIT_ENTITIES)
+  parser.add_option('--concurrency', type='int', default=4)
+  options, args = parser.parse_args(argv)
+
+  if len(args) != 2:
+    parser.error('Expected a dataset ID and a path.')
+  if not options.email or not options.key_path:
+    parser.error('--email and --key-path are required.')
+
+  dataset_id, path = args
+  format = options.format
+  if not format:
+    extension = os.path.splitext(path[:-3] if path.endswith('.gz') else path)[1]
+    format = _EXTENSIONS.get(extension)
+  if not format:
+    parser.error('Use --format to say what kind of file %s is.' % path)
+  if format == 'csv' and not options.kind:
+    parser.error('--kind is required for CSV files.')
+
+  input_file = gzip.open(path) if path.endswith('.gz') else open(path, 'rb')
+  if format == 'csv':
+    entity_pbs = read_csv(input_file, options.kind, options.key_column)
+  elif format == 'jsonl':
+    entity_pbs = read_jsonl(input_file, options.kind, options.key_column)
+  else:
+    entity_pbs = read_protobuf(input_file)
+
+  dataset = gcloud.datastore.get_dataset(dataset_id, options.email,
+                                         options.key_path)
+  loader = Loader(dataset, max_entities=options.batch_size,
+                  concurrency=options.concurrency)
+
+  def progress(stats):
+    print >> sys.stderr, '\r%(rows)d rows, %(rows_per_second).0f rows/s,' \
+        ' %(bytes_per_second).0f bytes/s' % stats,
+
+  with input_file:
+    stats = loader.load(entity_pbs, progress=progress)
+
+  print >> sys.stderr
+  print >> sys.stderr, ('Loaded %(rows)d rows (%(bytes)d bytes) in '
+                        '%(seconds).1f s.' % stats)
+  for batch in stats['failed']:
+    print >> sys.stderr, batch
+  if stats['failed']:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,265 @@
+"""Latency histograms and counters for the RPCs a connection makes.
+
+A :class:`Metrics` object is a listener
+(see :func:`gcloud.datastore.connection.Connection.add_listener`)
+which keeps running totals for each API method::
+
+  >>> metrics = Metrics()
+  >>> connection.add_listener(metrics)
+  >>> # Make some requests...
+  >>> metrics.histogram('lookup', 'wire').percentile(99)
+  0.25
+  >>> print metrics.prometheus()
+  # HELP datastore_rpc_duration_seconds Time spent on each phase of an RPC.
+  # TYPE datastore_rpc_duration_seconds histogram
+  datastore_rpc_duration_seconds_bucket{method="lookup",phase="wire",le="0.005"} 0
+  ...
+
+The output of :func:`Metrics.prometheus`
+is in the `Prometheus <http://prometheus.io/>`_ text format,
+so it can be served as is to a Prometheus server
+(or just read).
+"""
+
+import bisect
+import threading
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1, 2.5, 5, 10)
+"""The upper bounds (in seconds) of the buckets for latencies."""
+
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+"""The upper bounds of the buckets for the number of entities per RPC."""
+
+PHASES = ('serialize', 'wire', 'parse', 'total')
+"""The parts of an RPC which are timed separately."""
+
+
+class Histogram(object):
+  """Counts observed values into buckets.
+
+  :type buckets: sequence of numbers
+  :param buckets: The (sorted) upper bounds of the buckets.
+                  Values above the last bound are counted too.
+  """
+
+  def __init__(self, buckets):
+    self._bounds = tuple(buckets)
+    self._counts = [0] * (len(self._bounds) + 1)
+    self._sum = 0
+    self._count = 0
+
+  def observe(self, value):
+    """Count a value.
+
+    :type value: number
+    :param value: The value observed.
+    """
+    self._counts[bisect.bisect_left(self._bounds, value)] += 1
+    self._sum += value
+    self._count += 1
+
+  def count(self):
+    """Get the number of values observed.
+
+    :rtype: integer
+    """
+    return self._count
+
+  def sum(self):
+    """Get the sum of the values observed.
+
+    :rtype: number
+    """
+    return self._sum
+
+  def buckets(self):
+    """Get the cumulative count for each bucket.
+
+    :rtype: list of tuples
+    :returns: ``(upper bound, count)`` pairs,
+              the last of which has a bound of ``float('inf')``.
+    """
+    buckets = []
+    total = 0
+    for bound, count in zip(self._bounds + (float('inf'),), self._counts):
+      total += count
+      buckets.append((bound, total))
+    return buckets
+
+  def percentile(self, percent):
+    """Estimate a percentile of the values observed.
+
+    :type percent: number
+    :param percent: The percentile wanted (for instance, 99).
+
+    :rtype: number
+    :returns: The upper bound of the bucket the percentile falls in,
+              or ``None`` if nothing has been observed.
+    """
+    if not self._count:
+      return None
+    wanted = self._count * percent / 100.0
+    for bound, total in self.buckets():
+      if total >= wanted:
+        return bound
+
+
+class Metrics(object):
+  """Keeps histograms and counters of RPCs, by API method.
+
+  Add it to a connection with
+  :func:`gcloud.datastore.connection.Connection.add_listener`.
+  It's safe to share between connections and threads.
+
+  :type latency_buckets: sequence of numbers
+  :param latency_buckets: The upper bounds of the latency buckets (seconds).
+
+  :type count_buckets: sequence of numbers
+  :param count_buckets: The upper bounds of the entity count buckets.
+  """
+
+  def __init__(self, latency_buckets=LATENCY_BUCKETS,
+               count_buckets=COUNT_BUCKETS):
+    self._latency_buckets = latency_buckets
+    self._count_buckets = count_buckets
+    self._lock = threading.Lock()
+    self._latencies = {}  # (method, phase) -> Histogram
+    self._entities = {}  # method -> Histogram
+    self._requests = {}  # (method, status) -> count
+    self._request_bytes = {}  # method -> count
+    self._response_bytes = {}  # method -> count
+
+  def __call__(self, stats):
+    """Record an RPC.
+
+    :type stats: :class:`gcloud.datastore.connection.RpcStats`
+    :param stats: What happened during the RPC.
+    """
+    method = stats.method
+    seconds = (stats.serialize_seconds, stats.wire_seconds,
+               stats.parse_seconds, stats.total_seconds())
+    status = 'error' if stats.status is None else str(stats.status)
+
+    with self._lock:
+      for phase, value in zip(PHASES, seconds):
+        self._histogram(self._latencies, (method, phase),
+                        self._latency_buckets).observe(value)
+      self._histogram(self._entities, method,
+                      self._count_buckets).observe(stats.entities)
+
+      key = (method, status)
+      self._requests[key] = self._requests.get(key, 0) + 1
+      self._request_bytes[method] = (
+          self._request_bytes.get(method, 0) + stats.request_bytes)
+      self._response_bytes[method] = (
+          self._response_bytes.get(method, 0) + stats.response_bytes)
+
+  @staticmethod
+  def _histogram(histograms, key, buckets):
+    histogram = histograms.get(key)
+    if histogram is None:
+      histogram = histograms[key] = Histogram(buckets)
+    return histogram
+
+  def histogram(self, method, phase='total'):
+    """Get the latencies of one phase of an API method's RPCs.
+
+    :type method: string
+    :param method: The API method (``lookup``, ``commit`` and so on).
+
+    :type phase: string
+    :param phase: One of :data:`PHASES`.
+
+    :rtype: :class:`Histogram` or ``None``
+    :returns: The histogram, if there have been any RPCs to the method.
+    """
+    if phase not in PHASES:
+      raise ValueError('Unknown phase %r (expected one of %s).' %
+                       (phase, ', '.join(PHASES)))
+    return self._latencies.get((method, phase))
+
+  def entities(self, method):
+    """Get the number of entities handled by each of an API method's RPCs.
+
+    :type method: string
+    :param method: The API method.
+
+    :rtype: :class:`Histogram` or ``None``
+    """
+    return self._entities.get(method)
+
+  def requests(self):
+    """Get the number of RPCs made, by method and status.
+
+    :rtype: dict
+    :returns: A map of ``(method, status)`` to a count,
+              where the status is the HTTP status as a string
+              (or ``'error'`` if there was no response).
+    """
+    with self._lock:
+      return dict(self._requests)
+
+  def prometheus(self):
+    """Dump the metrics in the Prometheus text format.
+
+    :rtype: string
+    """
+    lines = []
+    with self._lock:
+      lines.extend(_histogram_lines(
+          'datastore_rpc_duration_seconds',
+          'Time spent on each phase of an RPC.',
+          [({'method': method, 'phase': phase}, histogram)
+           for (method, phase), histogram in sorted(self._latencies.items())]))
+      lines.extend(_histogram_lines(
+          'datastore_rpc_entities',
+          'Entities (or keys) handled by each RPC.',
+          [({'method': method}, histogram)
+           for method, histogram in sorted(self._entities.items())]))
+      lines.extend(_counter_lines(
+          'datastore_rpcs_total', 'RPCs made.',
+          [({'method': method, 'status': status}, count)
+           for (method, status), count in sorted(self._requests.items())]))
+      lines.extend(_counter_lines(
+          'datastore_rpc_request_bytes_total', 'Bytes sent in requests.',
+          [({'method': method}, count)
+           for method, count in sorted(self._request_bytes.items())]))
+      lines.extend(_counter_lines(
+          'datastore_rpc_response_bytes_total', 'Bytes received in responses.',
+          [({'method': method}, count)
+           for method, count in sorted(self._response_bytes.items())]))
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+  return '{%s}' % ','.join('%s="%s"' % (name, labels[name])
+                           for name in sorted(labels))
+
+
+def _format_number(value):
+  if value == float('inf'):
+    return '+Inf'
+  return repr(value)
+
+
+def _histogram_lines(name, help, series):
+  lines = ['# HELP %s %s' % (name, help), '# TYPE %s histogram' % name]
+  for labels, histogram in series:
+    for bound, total in histogram.buckets():
+      bucket_labels = dict(labels, le=_format_number(bound))
+      lines.append('%s_bucket%s %d' % (name, _format_labels(bucket_labels),
+                                       total))
+    lines.append('%s_sum%s %s' % (name, _format_labels(labels),
+                                  _format_number(histogram.sum())))
+    lines.append('%s_count%s %d' % (name, _format_labels(labels),
+                                    histogram.count()))
+  return lines
+
+
+def _counter_lines(name, help, series):
+  lines = ['# HELP %s %s' % (name, help), '# TYPE %s counter' % name]
+  for labels, value in series:
+    lines.append('%s%s %d' % (name, _format_labels(labels), value))
+  return lines
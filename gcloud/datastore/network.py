@@ -0,0 +1,302 @@
+"""Simulating network conditions between the client and a backend.
+
+A :class:`NetworkBackend` wraps another backend
+(usually an :class:`gcloud.datastore.emulator.Emulator`)
+and makes each request take as long as it would over a real network:
+round-trip latency (which can differ by API method),
+jitter, limited bandwidth, the cost of setting up connections,
+and the odd failed request::
+
+  >>> from gcloud.datastore import network
+  >>> from gcloud.datastore.emulator import Emulator
+  >>> backend = network.NetworkBackend(
+  ...     Emulator(),
+  ...     latency={'*': network.lognormal(0.04, 0.3),
+  ...              'runQuery': network.lognormal(0.08, 0.5)},
+  ...     jitter=0.005, bandwidth=2 * 1024 * 1024,
+  ...     connection_setup=0.12, error_rate={'commit': 0.01})
+  >>> dataset = Connection(backend=backend).dataset('dataset-id')
+
+so batch sizes, connection pooling and prefetching
+can be compared under WAN conditions on a single machine.
+
+Latencies can be a number of seconds,
+or a distribution: a function of a :class:`random.Random`
+returning seconds (such as those made by :func:`normal`,
+:func:`lognormal` and :func:`uniform`).
+Latencies and error rates can also be a dict from API method name
+to a latency or rate, with ``'*'`` for methods not listed.
+"""
+
+import random
+import threading
+import time
+
+from gcloud.datastore.connection import RequestError
+
+
+def constant(seconds):
+  """A latency which never varies.
+
+  :type seconds: float
+  :param seconds: The latency.
+
+  :rtype: callable
+  """
+  return lambda rng: seconds
+
+
+def uniform(low, high):
+  """A latency distributed evenly between two bounds.
+
+  :type low: float
+  :param low: The shortest latency (in seconds).
+
+  :type high: float
+  :param high: The longest latency (in seconds).
+
+  :rtype: callable
+  """
+  return lambda rng: rng.uniform(low, high)
+
+
+def normal(mean, stddev):
+  """A normally distributed latency (never less than zero).
+
+  :type mean: float
+  :param mean: The mean latency (in seconds).
+
+  :type stddev: float
+  :param stddev: The standard deviation (in seconds).
+
+  :rtype: callable
+  """
+  return lambda rng: max(rng.normalvariate(mean, stddev), 0)
+
+
+def lognormal(median, sigma):
+  """A log-normally distributed latency, with a long tail of slow requests.
+
+  :type median: float
+  :param median: The median latency (in seconds).
+
+  :type sigma: float
+  :param sigma: The standard deviation of the latency's logarithm
+                (larger means a longer tail).
+
+  :rtype: callable
+  """
+  return lambda rng: median * rng.lognormvariate(0, sigma)
+
+
+def _for_method(setting, method):
+  if isinstance(setting, dict):
+    return setting.get(method, setting.get('*', 0))
+  return setting
+
+
+class _Link(object):
+  """One direction of a link, shared by every request using it."""
+
+  def __init__(self, bytes_per_second):
+    self.bytes_per_second = bytes_per_second
+    self.free_at = 0
+
+  def reserve(self, size, now):
+    """Queue up a transfer and get how long until it's finished."""
+    if not self.bytes_per_second:
+      return 0
+    start = max(now, self.free_at)
+    self.free_at = start + float(size) / self.bytes_per_second
+    return self.free_at - now
+
+
+class NetworkBackend(object):
+  """Wraps a backend in a simulated network.
+
+  Each request:
+
+  - sets up a new connection (if no idle one is left open),
+    or waits for one to be free if ``max_connections`` are all in use,
+  - uploads the request (queued behind other requests' uploads,
+    if the bandwidth is limited),
+  - may fail (with a :class:`gcloud.datastore.connection.RequestError`),
+  - waits out the round-trip latency and jitter,
+  - and downloads the response (queued like uploads).
+
+  Network backends are thread-safe if the backend they wrap is.
+
+  :type backend: object
+  :param backend: The backend to send requests to
+                  (such as a :class:`gcloud.datastore.emulator.Emulator`).
+
+  :type latency: float, callable or dict
+  :param latency: The round-trip time of each request, in seconds.
+
+  :type jitter: float
+  :param jitter: The most extra latency (spread evenly from zero)
+                 to add to each request.
+
+  :type bandwidth: integer
+  :param bandwidth: The bytes per second that can be sent and received
+                    (each way, shared by all requests).
+                    Unlimited by default.
+
+  :type upload_bandwidth: integer
+  :param upload_bandwidth: The bytes per second that can be sent,
+                           if different from ``bandwidth``.
+
+  :type connection_setup: float
+  :param connection_setup: The seconds taken to open a connection
+                           (for the TCP and TLS handshakes).
+
+  :type idle_timeout: float
+  :param idle_timeout: How long an unused connection is kept open
+                       for another request, in seconds.
+
+  :type max_connections: integer
+  :param max_connections: The most connections open at once
+                          (like :class:`gcloud.datastore.pool.HttpPool`).
+                          Unlimited by default.
+
+  :type error_rate: float or dict
+  :param error_rate: The probability that a request fails.
+
+  :type error_status: integer
+  :param error_status: The HTTP status of failed requests.
+
+  :type seed: integer
+  :param seed: A seed for the random latencies and errors,
+               to make them repeatable.
+  """
+
+  def __init__(self, backend, latency=0, jitter=0, bandwidth=None,
+               upload_bandwidth=None, connection_setup=0, idle_timeout=60,
+               max_connections=None, error_rate=0, error_status=503,
+               seed=None):
+    if max_connections is not None and max_connections < 1:
+      raise ValueError('A network needs at least one connection.')
+
+    self._backend = backend
+    self._latency = latency
+    self._jitter = jitter
+    self._connection_setup = connection_setup
+    self._idle_timeout = idle_timeout
+    self._max_connections = max_connections
+    self._error_rate = error_rate
+    self._error_status = error_status
+
+    if upload_bandwidth is None:
+      upload_bandwidth = bandwidth
+    self._upload = _Link(upload_bandwidth)
+    self._download = _Link(bandwidth)
+
+    self._lock = threading.Condition()
+    self._random = random.Random(seed)
+    self._idle = []  # When each idle connection was last used.
+    self._size = 0  # The number of connections open (idle or in use).
+    self._setups = 0
+    self._errors = 0
+    self._delay = 0
+
+  def setup_count(self):
+    """Get the number of connections opened.
+
+    :rtype: integer
+    """
+    return self._setups
+
+  def error_count(self):
+    """Get the number of requests failed on purpose.
+
+    :rtype: integer
+    """
+    return self._errors
+
+  def delay_seconds(self):
+    """Get the total time requests have been delayed by the network.
+
+    :rtype: float
+    """
+    return self._delay
+
+  def _sample_latency(self, method):
+    latency = _for_method(self._latency, method)
+    if callable(latency):
+      latency = latency(self._random)
+    if self._jitter:
+      latency += self._random.uniform(0, self._jitter)
+    return latency
+
+  def _wait(self, seconds):
+    if seconds > 0:
+      with self._lock:
+        self._delay += seconds
+      time.sleep(seconds)
+
+  def _open(self):
+    """Take an idle connection, or get the time to open one.
+
+    Blocks while ``max_connections`` connections are in use.
+    """
+    with self._lock:
+      while True:
+        now = time.time()
+        while self._idle:
+          if now - self._idle.pop() <= self._idle_timeout:
+            return 0
+          self._size -= 1
+
+        if (self._max_connections is None or
+            self._size < self._max_connections):
+          self._size += 1
+          self._setups += 1
+          return self._connection_setup
+        self._lock.wait()
+
+  def _release(self):
+    with self._lock:
+      self._idle.append(time.time())
+      self._lock.notify()
+
+  def _close(self):
+    with self._lock:
+      self._size -= 1
+      self._lock.notify()
+
+  def request(self, dataset_id, method, data):
+    """Send a request to the wrapped backend, over the simulated network.
+
+    See :func:`gcloud.datastore.connection.HttpBackend.request`.
+    """
+    setup = self._open()
+    with self._lock:
+      latency = self._sample_latency(method)
+      failed = self._random.random() < _for_method(self._error_rate, method)
+      upload = self._upload.reserve(len(data), time.time() + setup)
+
+    self._wait(setup + upload + latency / 2)
+    if failed:
+      with self._lock:
+        self._errors += 1
+      # The connection isn't reused after an error.
+      self._close()
+      raise RequestError(method, self._error_status,
+                         'Simulated network error.')
+
+    try:
+      response = self._backend.request(dataset_id, method, data)
+    except RequestError:
+      self._wait(latency / 2)
+      self._release()
+      raise
+    except:
+      self._close()
+      raise
+
+    with self._lock:
+      download = self._download.reserve(len(response),
+                                        time.time() + latency / 2)
+    self._wait(latency / 2 + download)
+    self._release()
+    return response
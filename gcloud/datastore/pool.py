@@ -0,0 +1,173 @@
+"""A thread-safe pool of HTTP transports.
+
+A single :class:`httplib2.Http` object isn't safe to share between threads,
+so rather than serializing every request through one socket
+(or building a new authorized transport per thread),
+a :class:`gcloud.datastore.connection.Connection`
+hands out transports from an :class:`HttpPool`.
+
+Each transport in the pool keeps its socket alive between requests,
+and transports that have been idle for too long
+are closed and dropped from the pool.
+"""
+
+import threading
+import time
+
+
+class HttpPool(object):
+  """A bounded pool of HTTP transport objects.
+
+  The pool quacks like an :class:`httplib2.Http` object
+  (that is, it has a ``request`` method with the same signature),
+  so it can be used anywhere a single transport would be::
+
+    >>> pool = HttpPool(httplib2.Http, max_connections=20)
+    >>> headers, content = pool.request(uri, method='POST', body=data)
+
+  Under the hood each call to ``request`` checks a transport out of the pool,
+  makes the request, and returns the transport to the pool.
+  If all transports are busy and the pool is full,
+  the caller blocks until one is returned.
+
+  :type factory: callable
+  :param factory: A callable that builds a new transport
+                  (typically an authorized :class:`httplib2.Http` object).
+
+  :type max_connections: integer
+  :param max_connections: The maximum number of transports
+                          (and therefore open sockets) in the pool.
+
+  :type idle_timeout: integer or float
+  :param idle_timeout: The number of seconds a transport can sit unused
+                       before it is closed and dropped from the pool.
+  """
+
+  def __init__(self, factory, max_connections=10, idle_timeout=60):
+    if max_connections < 1:
+      raise ValueError('A pool needs at least one connection.')
+
+    self._factory = factory
+    self._max_connections = max_connections
+    self._idle_timeout = idle_timeout
+    self._condition = threading.Condition()
+    self._idle = []  # A stack of (transport, last_used) tuples.
+    self._size = 0
+
+  def max_connections(self):
+    """Get the maximum number of transports in the pool.
+
+    :rtype: integer
+    """
+    return self._max_connections
+
+  def size(self):
+    """Get the number of transports currently open (idle or in use).
+
+    :rtype: integer
+    """
+    return self._size
+
+  def idle_count(self):
+    """Get the number of transports currently waiting to be used.
+
+    :rtype: integer
+    """
+    return len(self._idle)
+
+  def acquire(self):
+    """Check a transport out of the pool.
+
+    The most recently used idle transport is preferred
+    (its socket is the most likely to still be open).
+    If there is none and the pool isn't full, a new one is built.
+    Otherwise this blocks until another thread releases a transport.
+
+    Every transport acquired must be given back
+    with :func:`release`.
+    """
+    with self._condition:
+      self._reap()
+
+      while not self._idle and self._size >= self._max_connections:
+        self._condition.wait()
+
+      if self._idle:
+        transport, _ = self._idle.pop()
+        return transport
+
+      # Reserve our spot while building the transport outside of the lock.
+      self._size += 1
+
+    try:
+      return self._factory()
+    except:
+      with self._condition:
+        self._size -= 1
+        self._condition.notify()
+      raise
+
+  def release(self, transport):
+    """Return a transport to the pool.
+
+    :param transport: A transport previously returned by :func:`acquire`.
+    """
+    with self._condition:
+      self._idle.append((transport, time.time()))
+      self._condition.notify()
+
+  def request(self, *args, **kwargs):
+    """Make a request using a transport from the pool.
+
+    All arguments are passed along to the transport's ``request`` method.
+
+    :returns: Whatever the transport returns
+              (for :class:`httplib2.Http` a ``(headers, content)`` tuple).
+    """
+    transport = self.acquire()
+    try:
+      return transport.request(*args, **kwargs)
+    finally:
+      self.release(transport)
+
+  def close(self):
+    """Close all idle transports in the pool.
+
+    Transports which are currently checked out are left alone
+    and will be pooled again when released.
+    """
+    with self._condition:
+      idle, self._idle = self._idle, []
+      self._size -= len(idle)
+
+    for transport, _ in idle:
+      self._close_transport(transport)
+
+  def _reap(self):
+    """Close any transports which have been idle for too long.
+
+    This must be called with the lock held.
+    The stack is ordered by last use, so expired transports are at the bottom.
+    """
+    if self._idle_timeout is None:
+      return
+
+    cutoff = time.time() - self._idle_timeout
+    expired = 0
+    while expired < len(self._idle) and self._idle[expired][1] < cutoff:
+      expired += 1
+
+    if expired:
+      for transport, _ in self._idle[:expired]:
+        self._close_transport(transport)
+      del self._idle[:expired]
+      self._size -= expired
+
+  @staticmethod
+  def _close_transport(transport):
+    # httplib2.Http keeps its sockets in a dictionary keyed by scheme and host.
+    for connection in getattr(transport, 'connections', {}).values():
+      try:
+        connection.close()
+      except Exception:
+        pass
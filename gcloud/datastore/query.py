@@ -2,11 +2,48 @@ import copy
 
 from gcloud.datastore import datastore_v1_pb2 as datastore_pb
 from gcloud.datastore import helpers
-from gcloud.datastore.entity import Entity
+from gcloud.datastore.decoder import EntityDecoder
+from gcloud.datastore.workers import Future
+from gcloud.datastore.workers import run_in_thread
 
 
 # TODO: Figure out how to properly handle namespaces.
 
+def _results_from_batch(batch, dataset=None, lazy=False):
+  """Convert a batch of query results into Keys or Entities.
+
+  :type batch: :class:`gcloud.datastore.datastore_v1_pb2.QueryResultBatch`
+  :param batch: The batch returned by the API.
+
+  :type dataset: :class:`gcloud.datastore.dataset.Dataset`
+  :param dataset: The dataset the query was run against.
+
+  :type lazy: bool
+  :param lazy: Whether to return lazily decoded entities.
+
+  :rtype: list of :class:`gcloud.datastore.key.Key` or
+          :class:`gcloud.datastore.entity.Entity`
+  :returns: Keys for a keys-only query,
+            otherwise (possibly partial) entities.
+  """
+  return EntityDecoder(dataset, lazy=lazy).decode_batch(batch)
+
+
+def _key_sort_order(key):
+  """Get a value which sorts keys the way the Cloud Datastore does.
+
+  Path elements are compared by kind,
+  then elements with IDs come before elements with names.
+  """
+  order = []
+  for element in key.path():
+    if 'id' in element:
+      order.append((element['kind'], 0, element['id']))
+    else:
+      order.append((element['kind'], 1, element.get('name')))
+  return order
+
+
 class Query(object):
   """A Query against the Cloud Datastore.
 
@@ -24,6 +61,15 @@ class Query(object):
     >>> limited_query.limit() == 10
     True
 
+  A query holds its kinds, filters, orders and projection in tuples
+  which clones share with the query they came from,
+  so building up a query is cheap.
+  The protobuf is only built when it's first needed
+  (usually when the query is run)
+  and then reused for every later run,
+  so a single query object can be run over and over
+  (from as many threads as you like).
+
   You typically won't construct a :class:`Query`
   by initializing it like ``Query('MyKind', dataset=...)``
   but instead use the helper
@@ -51,27 +97,83 @@ class Query(object):
       }
   """Mapping of operator strings and their protobuf equivalents."""
 
+  SCATTER_OVERSAMPLING = 32
+  """The number of keys to sample per shard when splitting a query."""
+
   def __init__(self, kind=None, dataset=None):
     self._dataset = dataset
-    self._pb = datastore_pb.Query()
-
-    if kind:
-      self._pb.kind.add().name = kind
+    self._kinds = (kind,) if kind else ()
+    self._filters = ()  # Tuples of (property name, operator, value).
+    self._orders = ()
+    self._projection = ()
+    self._limit = None
+    self._start_cursor = None
+    self._pb = None
 
   def _clone(self):
-    # TODO(jjg): Double check that this makes sense...
-    clone = copy.deepcopy(self)
-    clone._dataset = self._dataset  # Shallow copy the dataset.
+    """Duplicates the Query.
+
+    All of the query's parts are immutable,
+    so a shallow copy is enough.
+    The protobuf isn't copied; the clone builds its own when needed.
+    """
+    clone = copy.copy(self)
+    clone._pb = None
     return clone
 
   def to_protobuf(self):
     """Convert the :class:`Query` instance to a :class:`gcloud.datastore.datastore_v1_pb2.Query`.
 
+    The protobuf is built the first time this is called
+    and the same protobuf is returned on every later call,
+    so it shouldn't be modified.
+    (Copy it first if you need a modified version.)
+
     :rtype: :class:`gclouddatstore.datastore_v1_pb2.Query`
     :returns: A Query protobuf that can be sent to the protobuf API.
     """
+    if self._pb is None:
+      self._pb = self._build_protobuf()
     return self._pb
 
+  def _build_protobuf(self):
+    pb = datastore_pb.Query()
+
+    for kind in self._kinds:
+      pb.kind.add().name = kind
+
+    for name in self._projection:
+      pb.projection.add().property.name = name
+
+    if self._filters:
+      # Build a composite filter AND'd together.
+      composite_filter = pb.filter.composite_filter
+      composite_filter.operator = datastore_pb.CompositeFilter.AND
+
+      for property_name, operator, value in self._filters:
+        property_filter = composite_filter.filter.add().property_filter
+        property_filter.property.name = property_name
+        property_filter.operator = operator
+        # Set the value to filter on based on the type.
+        helpers.set_protobuf_value(property_filter.value, value)
+
+    for name in self._orders:
+      property_order = pb.order.add()
+      if name.startswith('-'):
+        property_order.property.name = name[1:]
+        property_order.direction = datastore_pb.PropertyOrder.DESCENDING
+      else:
+        property_order.property.name = name
+        property_order.direction = datastore_pb.PropertyOrder.ASCENDING
+
+    if self._limit:
+      pb.limit = self._limit
+
+    if self._start_cursor:
+      pb.start_cursor = self._start_cursor
+
+    return pb
+
   def filter(self, expression, value):
     """Filter the query based on an expression and a value.
 
@@ -104,32 +206,22 @@ class Query(object):
     :rtype: :class:`Query`
     :returns: A Query filtered by the expression and value provided.
     """
-    clone = self._clone()
-
     # Take an expression like 'property >=', and parse it into useful pieces.
     property_name, operator = None, None
     expression = expression.strip()
 
-    for operator_string in self.OPERATORS:
+    # Check longer operators first, so '<=' isn't mistaken for '='.
+    for operator_string in sorted(self.OPERATORS, key=len, reverse=True):
       if expression.endswith(operator_string):
         operator = self.OPERATORS[operator_string]
         property_name = expression[0:-len(operator_string)].strip()
+        break
 
     if not operator or not property_name:
       raise ValueError('Invalid expression: "%s"' % expression)
 
-    # Build a composite filter AND'd together.
-    composite_filter = clone._pb.filter.composite_filter
-    composite_filter.operator = datastore_pb.CompositeFilter.AND
-
-    # Add the specific filter
-    property_filter = composite_filter.filter.add().property_filter
-    property_filter.property.name = property_name
-    property_filter.operator = operator
-
-    # Set the value to filter on based on the type.
-    attr_name, pb_value = helpers.get_protobuf_attribute_and_value(value)
-    setattr(property_filter.value, attr_name, pb_value)
+    clone = self._clone()
+    clone._filters = self._filters + ((property_name, operator, value),)
     return clone
 
   def kind(self, *kinds):
@@ -145,19 +237,19 @@ class Query(object):
     :param kinds: The entity kinds for which to query.
 
     :rtype: string or :class:`Query`
-    :returns: If no arguments, returns the kind.
+    :returns: If no arguments, returns the kind
+              (as the ``kind`` field of the protobuf).
               If a kind is provided, returns a clone of the :class:`Query`
               with those kinds set.
     """
     # TODO: Do we want this to be additive?
-    #       If not, clear the _pb.kind attribute.
+    #       If not, clear the _kinds attribute.
     if kinds:
       clone = self._clone()
-      for kind in kinds:
-        clone._pb.kind.add().name = kind
+      clone._kinds = self._kinds + kinds
       return clone
     else:
-      return self._pb.kind
+      return self.to_protobuf().kind
 
   def limit(self, limit=None):
     """Get or set the limit of the Query.
@@ -178,10 +270,112 @@ class Query(object):
     """
     if limit:
       clone = self._clone()
-      clone._pb.limit = limit
+      clone._limit = limit
+      return clone
+    else:
+      return self._limit
+
+  def order(self, *properties):
+    """Get or set the order of the Query's results.
+
+    Prefix a property name with ``-`` to sort in descending order::
+
+      >>> query = Query('Person').order('-age', 'name')
+      >>> query.order()
+      ['-age', 'name']
+
+    .. note::
+      Like :func:`kind`, this is an **additive** operation.
+
+    :type properties: string
+    :param properties: The names of the properties to order by.
+
+    :rtype: list of strings or :class:`Query`
+    :returns: If no arguments, returns the current ordering.
+              If properties are provided, returns a clone of the :class:`Query`
+              with those orderings added.
+    """
+    if properties:
+      clone = self._clone()
+      clone._orders = self._orders + properties
+      return clone
+    else:
+      return list(self._orders)
+
+  def projection(self, *names):
+    """Get or set the properties to return for each matching entity.
+
+    Projection queries return partial entities
+    holding only the properties named,
+    which is much cheaper than returning whole entities
+    when you only need a few of their properties::
+
+      >>> query = Query('Person').projection('name', 'age')
+      >>> query.fetch()
+      [<Entity[{'kind': 'Person', 'id': 1234}] {'name': 'Sally', 'age': 34}>,
+       ...]
+
+    .. note::
+      Unlike :func:`kind`, this is **not** an additive operation.
+      Setting a projection replaces any previous projection.
+
+    :type names: string
+    :param names: The names of the properties to return.
+                  Use ``'__key__'`` to return only keys
+                  (or see :func:`keys_only`).
+
+    :rtype: list of strings or :class:`Query`
+    :returns: If no arguments, returns the names of the projected properties.
+              If names are provided, returns a clone of the :class:`Query`
+              with that projection set.
+    """
+    if names:
+      clone = self._clone()
+      clone._projection = names
+      return clone
+    else:
+      return list(self._projection)
+
+  def keys_only(self):
+    """Get a clone of the Query which returns only the keys of the results.
+
+    Running a keys-only query returns
+    :class:`gcloud.datastore.key.Key` objects
+    rather than entities::
+
+      >>> Query('Person').keys_only().fetch()
+      [<Key[{'kind': 'Person', 'id': 1234}]>, ...]
+
+    :rtype: :class:`Query`
+    :returns: A clone of the :class:`Query` with a ``__key__`` projection.
+    """
+    return self.projection('__key__')
+
+  def start_cursor(self, cursor=None):
+    """Get or set the cursor at which the Query starts.
+
+    Cursors come from the end of a batch of results
+    (see :func:`QueryIterator.cursor`)
+    and let a later query pick up where an earlier one left off::
+
+      >>> iterator = query.iter(page_size=100)
+      >>> # Work through some of the results...
+      >>> resumed = query.start_cursor(iterator.cursor())
+
+    :type cursor: string
+    :param cursor: The (opaque) cursor to start from.
+
+    :rtype: string, None, or :class:`Query`
+    :returns: If no arguments, returns the current start cursor.
+              If a cursor is provided, returns a clone of the :class:`Query`
+              with that cursor set.
+    """
+    if cursor:
+      clone = self._clone()
+      clone._start_cursor = cursor
       return clone
     else:
-      return self._pb.limit
+      return self._start_cursor
 
   def dataset(self, dataset=None):
     """Get or set the :class:`gcloud.datastore.dataset.Dataset` for this Query.
@@ -207,7 +401,7 @@ class Query(object):
     else:
       return self._dataset
 
-  def fetch(self, limit=None):
+  def fetch(self, limit=None, lazy=False):
     """Executes the Query and returns all matching entities.
 
     This makes an API call to the Cloud Datastore,
@@ -233,15 +427,322 @@ class Query(object):
                   but the limit will be applied to the query
                   before it is executed.
 
+    :type lazy: bool
+    :param lazy: If ``True``, return
+                 :class:`gcloud.datastore.entity.LazyEntity` objects,
+                 which only decode the properties that are read.
+
     :rtype: list of :class:`gcloud.datastore.entity.Entity`'s
-    :returns: The list of entities matching this query's criteria.
+    :returns: The list of entities matching this query's criteria
+              (or the list of keys, for a :func:`keys_only` query).
     """
     clone = self
 
     if limit:
       clone = self.limit(limit)
 
-    entity_pbs = self.dataset().connection().run_query(
+    batch = self.dataset().connection().run_query_batch(
         query_pb=clone.to_protobuf(), dataset_id=self.dataset().id())
 
-    return [Entity.from_protobuf(entity) for entity in entity_pbs]
+    return _results_from_batch(batch, dataset=self.dataset(), lazy=lazy)
+
+  def iter(self, page_size=None, prefetch=True, lazy=False):
+    """Iterate over the entities matching this query, a page at a time.
+
+    Unlike :func:`fetch`, which loads every result into one list,
+    this sends a ``runQuery`` request per page
+    (using the cursor at the end of each page to start the next one),
+    so a query over millions of entities runs in constant memory::
+
+      >>> for entity in query.iter(page_size=500):
+      ...   do_something_with(entity)
+
+    While the caller works through one page,
+    the next page is fetched on a background thread.
+
+    Any :func:`limit` set on the query applies to the iteration as a whole.
+
+    :type page_size: integer
+    :param page_size: The maximum number of entities to request at once.
+                      If ``None``, the API decides how many to return.
+
+    :type prefetch: bool
+    :param prefetch: Whether to fetch the next page in the background.
+
+    :type lazy: bool
+    :param lazy: If ``True``, return
+                 :class:`gcloud.datastore.entity.LazyEntity` objects,
+                 which only decode the properties that are read.
+
+    :rtype: :class:`QueryIterator`
+    :returns: An iterator over :class:`gcloud.datastore.entity.Entity` objects
+              (or :class:`gcloud.datastore.key.Key` objects,
+              for a :func:`keys_only` query).
+    """
+    return QueryIterator(self, page_size=page_size, prefetch=prefetch,
+                         lazy=lazy)
+
+  def fetch_columns(self, page_size=None, dataframe=False):
+    """Executes the Query and returns the results as columns.
+
+    Rather than an :class:`gcloud.datastore.entity.Entity` per result,
+    this returns an array per property
+    (see :mod:`gcloud.datastore.columns`),
+    which is much cheaper for analytic reads over many entities::
+
+      >>> columns = query.projection('age', 'score').fetch_columns()
+      >>> columns['score'].mean()
+      71.5
+
+    Every page of results is fetched,
+    up to any :func:`limit` set on the query.
+
+    :type page_size: integer
+    :param page_size: The maximum number of entities to request at once.
+                      If ``None``, the API decides how many to return.
+
+    :type dataframe: bool
+    :param dataframe: If ``True``, return a :class:`pandas.DataFrame`
+                      rather than a dictionary of columns.
+
+    :rtype: dict or :class:`pandas.DataFrame`
+    :returns: A column for each property,
+              plus a ``__key__`` column holding the keys.
+    """
+    # This import is here so NumPy is only loaded when it's needed.
+    from gcloud.datastore import columns
+
+    iterator = QueryIterator(self, page_size=page_size)
+    result = columns.columns_from_batches(iterator.batches(),
+                                          dataset=self.dataset())
+    if dataframe:
+      return columns.to_dataframe(result)
+    return result
+
+  def iter_columns(self, page_size=None, prefetch=True, dataframe=False):
+    """Iterate over the results of the Query as columns, a page at a time.
+
+    This is the streaming form of :func:`fetch_columns`,
+    yielding the columns for each page of results
+    so that memory use depends on the page size
+    rather than the number of results::
+
+      >>> total = 0
+      >>> for columns in query.iter_columns(page_size=10000):
+      ...   total += columns['score'].sum()
+
+    :type page_size: integer
+    :param page_size: The maximum number of entities to request at once.
+
+    :type prefetch: bool
+    :param prefetch: Whether to fetch the next page in the background.
+
+    :type dataframe: bool
+    :param dataframe: If ``True``, yield a :class:`pandas.DataFrame`
+                      for each page rather than a dictionary of columns.
+
+    :rtype: iterator of dict or :class:`pandas.DataFrame`
+    """
+    # This import is here so NumPy is only loaded when it's needed.
+    from gcloud.datastore import columns
+
+    iterator = QueryIterator(self, page_size=page_size, prefetch=prefetch)
+    for batch in iterator.batches():
+      result = columns.columns_from_batches([batch], dataset=self.dataset())
+      yield columns.to_dataframe(result) if dataframe else result
+
+  def split(self, shards):
+    """Split the Query into queries over non-overlapping ranges of keys.
+
+    Together, the queries returned match the same entities as this one,
+    so they can be run side by side to scan a kind in parallel
+    (see :func:`gcloud.datastore.dataset.Dataset.parallel_scan`)::
+
+      >>> for shard in Query('Person', dataset).split(8):
+      ...   pool.submit(process, shard.iter())
+
+    Split points are chosen by sampling the keys matching
+    the query's equality filters in ``__scatter__`` order
+    (a pseudo-random order maintained by the Cloud Datastore),
+    so each range holds roughly the same number of results.
+
+    .. note::
+      Each shard adds ``__key__`` inequality filters,
+      so this won't work for queries which already have
+      inequality filters or sort orders on other properties.
+
+    :type shards: integer
+    :param shards: The number of queries to split into.
+                   Fewer may be returned for small kinds.
+
+    :rtype: list of :class:`Query`
+    :returns: Queries over consecutive ranges of keys.
+
+    :raises: ValueError if the query has a limit
+             (which each shard would apply separately).
+    """
+    if self._limit:
+      raise ValueError('A query with a limit cannot be split.')
+    if shards < 2 or len(self._kinds) != 1:
+      return [self]
+
+    sample = Query(self._kinds[0], dataset=self.dataset())
+    sample._filters = tuple(
+        (property_name, operator, value)
+        for property_name, operator, value in self._filters
+        if operator == self.OPERATORS['='])
+    sample = sample.keys_only().order('__scatter__').limit(
+        shards * self.SCATTER_OVERSAMPLING).fetch()
+    sample.sort(key=_key_sort_order)
+
+    split_keys = []
+    for i in range(1, shards):
+      key = sample[len(sample) * i // shards] if sample else None
+      if key and (not split_keys or
+                  _key_sort_order(key) != _key_sort_order(split_keys[-1])):
+        split_keys.append(key)
+
+    queries = []
+    for i in range(len(split_keys) + 1):
+      query = self
+      if i > 0:
+        query = query.filter('__key__ >=', split_keys[i - 1])
+      if i < len(split_keys):
+        query = query.filter('__key__ <', split_keys[i])
+      queries.append(query)
+    return queries
+
+  def fetch_async(self, limit=None, lazy=False):
+    """Like :func:`fetch` but returns a future.
+
+    The query runs concurrently
+    if the dataset's connection is a
+    :class:`gcloud.datastore.connection.AsyncConnection`::
+
+      >>> futures = [query.filter('name =', name).fetch_async()
+      ...            for name in ('Sally', 'Bob')]
+      >>> [future.get() for future in futures]
+      [[<Entity object>, ...], [<Entity object>, ...]]
+
+    :type limit: integer
+    :param limit: An optional limit to apply temporarily to this query.
+
+    :type lazy: bool
+    :param lazy: See :func:`fetch`.
+
+    :rtype: :class:`gcloud.datastore.workers.Future`
+    :returns: A future resolving to the list of matching entities.
+    """
+    return self.dataset().connection().submit(self.fetch, limit, lazy)
+
+
+class QueryIterator(object):
+  """An iterator over the results of a :class:`Query`, a page at a time.
+
+  You typically get one of these from :func:`Query.iter`.
+
+  :type query: :class:`Query`
+  :param query: The query to run.
+
+  :type page_size: integer
+  :param page_size: The maximum number of entities to request at once.
+
+  :type prefetch: bool
+  :param prefetch: Whether to fetch the next page in the background.
+
+  :type lazy: bool
+  :param lazy: Whether to return lazily decoded entities.
+  """
+
+  def __init__(self, query, page_size=None, prefetch=True, lazy=False):
+    self._query = query
+    self._page_size = page_size
+    self._prefetch = prefetch
+    self._lazy = lazy
+    self._cursor = query.start_cursor()
+
+  def cursor(self):
+    """Get the cursor after the last page which was completely iterated.
+
+    Pass this to :func:`Query.start_cursor` to resume iteration later.
+    If you stop part way through a page,
+    resuming starts again from the beginning of that page.
+
+    :rtype: string or None
+    :returns: The cursor, or ``None`` if no page has been finished yet
+              (and the query had no start cursor).
+    """
+    return self._cursor
+
+  def _fetch_page(self, cursor, limit):
+    query_pb = datastore_pb.Query()
+    query_pb.CopyFrom(self._query.to_protobuf())
+
+    if cursor:
+      query_pb.start_cursor = cursor
+    if limit:
+      query_pb.limit = limit
+
+    dataset = self._query.dataset()
+    return dataset.connection().run_query_batch(
+        dataset_id=dataset.id(), query_pb=query_pb)
+
+  def _request_page(self, cursor, remaining):
+    """Start fetching a page, in the background if prefetching."""
+    limit = self._page_size
+    if remaining is not None and (not limit or remaining < limit):
+      limit = remaining
+
+    if not self._prefetch:
+      return Future.from_call(self._fetch_page, cursor, limit)
+
+    transaction = self._query.dataset().connection().transaction()
+    if transaction is None:
+      return run_in_thread(self._fetch_page, cursor, limit)
+    return run_in_thread(self._fetch_page_in, transaction, cursor, limit)
+
+  def _fetch_page_in(self, transaction, cursor, limit):
+    """Fetch a page on another thread, in the caller's transaction."""
+    connection = self._query.dataset().connection()
+    connection.transaction(transaction)
+    try:
+      return self._fetch_page(cursor, limit)
+    finally:
+      connection.transaction(None)
+
+  def batches(self):
+    """Iterate over the raw result batches, one per page.
+
+    This is what iterating over the :class:`QueryIterator` is built on,
+    for callers which want to decode the results themselves
+    (see :func:`Query.iter_columns`).
+
+    :rtype: iterator of
+            :class:`gcloud.datastore.datastore_v1_pb2.QueryResultBatch`
+    """
+    remaining = self._query.limit() or None
+    page = self._request_page(self._cursor, remaining)
+
+    while page is not None:
+      batch = page.get()
+      count = len(batch.entity_result)
+      if remaining is not None:
+        remaining -= count
+
+      done = (not count or remaining == 0 or
+              batch.more_results ==
+              datastore_pb.QueryResultBatch.NO_MORE_RESULTS)
+
+      # Ask for the next page before handing out this one.
+      page = None if done else self._request_page(batch.end_cursor, remaining)
+
+      yield batch
+
+      self._cursor = batch.end_cursor or self._cursor
+
+  def __iter__(self):
+    dataset = self._query.dataset()
+    for batch in self.batches():
+      for result in _results_from_batch(batch, dataset=dataset,
+                                        lazy=self._lazy):
+        yield result
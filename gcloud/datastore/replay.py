@@ -0,0 +1,302 @@
+"""Recording API traffic and replaying it without a network.
+
+A :class:`RecordingBackend` wraps a connection's backend
+(see :func:`gcloud.datastore.connection.Connection.backend`)
+and appends every request it sends,
+the response it gets back and how long it took
+to a recording file::
+
+  >>> from gcloud.datastore.replay import RecordingBackend, ReplayBackend
+  >>> recorder = RecordingBackend(connection.backend(), 'traffic.rec')
+  >>> connection.backend(recorder)
+  >>> # Make some requests...
+  >>> recorder.close()
+
+A :class:`ReplayBackend` then answers the same requests
+with the recorded responses,
+matching each request by its fingerprint
+(a hash of the dataset, method and serialized request).
+It can also wait as long as each request originally took,
+sped up or slowed down by a factor,
+so client-side changes (encoding, decoding, concurrency)
+can be measured against real payloads and real latencies::
+
+  >>> connection = Connection(backend=ReplayBackend('traffic.rec', speed=2))
+
+Recordings are a series of length-prefixed records
+(as read by :func:`gcloud.datastore.helpers.read_records`),
+one per request,
+so a recording that was cut off part way through a request
+can still be replayed up to that point.
+"""
+
+import hashlib
+import threading
+import time
+from cStringIO import StringIO
+
+from gcloud.datastore.connection import RequestError
+from gcloud.datastore.helpers import encode_varint
+from gcloud.datastore.helpers import read_records
+
+
+MAGIC = 'gcloud-datastore-recording:1'
+"""The first record of every recording file."""
+
+
+def fingerprint(dataset_id, method, data):
+  """Get the fingerprint by which a request is matched when replaying.
+
+  :type dataset_id: string
+  :param dataset_id: The ID of the dataset the request was made of.
+
+  :type method: string
+  :param method: The API method name.
+
+  :type data: string
+  :param data: The serialized request protobuf.
+
+  :rtype: string
+  """
+  digest = hashlib.sha1()
+  for part in (dataset_id, method, data):
+    digest.update(encode_varint(len(part)))
+    digest.update(part)
+  return digest.hexdigest()
+
+
+class RecordedCall(object):
+  """A request and its response, as recorded.
+
+  :type dataset_id: string
+  :param dataset_id: The ID of the dataset the request was made of.
+
+  :type method: string
+  :param method: The API method name.
+
+  :type request: string
+  :param request: The serialized request protobuf.
+
+  :type status: integer
+  :param status: The HTTP status of the response.
+
+  :type response: string
+  :param response: The serialized response protobuf
+                   (or the content of the error, if the status isn't 200).
+
+  :type seconds: float
+  :param seconds: How long the request took.
+  """
+
+  def __init__(self, dataset_id, method, request, status, response, seconds):
+    self.dataset_id = dataset_id
+    self.method = method
+    self.request = request
+    self.status = status
+    self.response = response
+    self.seconds = seconds
+
+  def fingerprint(self):
+    """Get the fingerprint of the request (see :func:`fingerprint`).
+
+    :rtype: string
+    """
+    return fingerprint(self.dataset_id, self.method, self.request)
+
+  def to_record(self):
+    """Serialize the call as a single record.
+
+    :rtype: string
+    """
+    fields = (self.dataset_id, self.method, self.request, str(self.status),
+              self.response, str(int(round(self.seconds * 1e6))))
+    return ''.join(encode_varint(len(field)) + field for field in fields)
+
+  @classmethod
+  def from_record(cls, record):
+    """Parse a call serialized with :func:`to_record`.
+
+    :type record: string
+    :param record: The serialized call.
+
+    :rtype: :class:`RecordedCall`
+    """
+    fields = list(read_records(StringIO(record)))
+    if len(fields) != 6:
+      raise ValueError('Expected 6 fields in a recorded call, not %d.' %
+                       len(fields))
+    dataset_id, method, request, status, response, microseconds = fields
+    return cls(dataset_id, method, request, int(status), response,
+               int(microseconds) / 1e6)
+
+
+def read_recording(fileobj):
+  """Read the calls from a recording.
+
+  :type fileobj: file
+  :param fileobj: The recording file.
+
+  :rtype: iterator of :class:`RecordedCall`
+  :raises: ValueError if the file isn't a recording.
+  """
+  records = read_records(fileobj)
+  if next(records, None) != MAGIC:
+    raise ValueError('Not a recording file.')
+  try:
+    for record in records:
+      yield RecordedCall.from_record(record)
+  except ValueError:
+    return  # The recording was cut off part way through a call.
+
+
+class RecordingBackend(object):
+  """Passes requests on to another backend and records them.
+
+  Each request is written (and flushed) as soon as it's answered,
+  and recording to an existing file adds to the end of it.
+  Requests which fail without a response
+  (because of a network error, say) aren't recorded.
+
+  Recording backends are thread-safe if the backend they wrap is.
+
+  :type backend: object
+  :param backend: The backend to record
+                  (such as a :class:`gcloud.datastore.connection.HttpBackend`).
+
+  :type path: string
+  :param path: The file to record to.
+  """
+
+  def __init__(self, backend, path):
+    self._backend = backend
+    self._lock = threading.Lock()
+    self._file = open(path, 'ab')
+    self._calls = 0
+
+    with self._lock:
+      if self._file.tell() == 0:
+        self._write(MAGIC)
+
+  def _write(self, record):
+    self._file.write(encode_varint(len(record)) + record)
+    self._file.flush()
+
+  def call_count(self):
+    """Get the number of requests recorded.
+
+    :rtype: integer
+    """
+    return self._calls
+
+  def request(self, dataset_id, method, data):
+    """Make a request through the wrapped backend, and record it.
+
+    See :func:`gcloud.datastore.connection.HttpBackend.request`.
+    """
+    start = time.time()
+    try:
+      response = self._backend.request(dataset_id, method, data)
+      status = 200
+    except RequestError, e:
+      response = e.content
+      status = e.status
+      error = e
+    else:
+      error = None
+    seconds = time.time() - start
+
+    call = RecordedCall(dataset_id, method, data, status, response or '',
+                        seconds)
+    with self._lock:
+      self._write(call.to_record())
+      self._calls += 1
+
+    if error is not None:
+      raise error
+    return response
+
+  def close(self):
+    """Stop recording and close the file."""
+    with self._lock:
+      self._file.close()
+
+
+class ReplayBackend(object):
+  """Answers requests with the responses from a recording.
+
+  A request made more than once during recording
+  gets its responses back in the order they were recorded
+  (and the last one again, once they run out).
+
+  Replay backends are thread-safe.
+
+  :type path: string
+  :param path: The recording to replay.
+
+  :type speed: float
+  :param speed: If given, wait for as long as each request took
+                when it was recorded, divided by this
+                (so ``2`` replays twice as fast and ``0.5`` half as fast).
+                By default, responses are returned straight away.
+
+  :type fallback: object
+  :param fallback: A backend to pass requests that weren't recorded on to.
+                   Without one, they fail with a ``404``
+                   :class:`gcloud.datastore.connection.RequestError`.
+  """
+
+  def __init__(self, path, speed=None, fallback=None):
+    if speed is not None and speed <= 0:
+      raise ValueError('The speed must be positive.')
+
+    self._speed = speed
+    self._fallback = fallback
+    self._lock = threading.Lock()
+    self._calls = {}  # fingerprint -> list of RecordedCall
+    self._replayed = {}  # fingerprint -> number replayed
+    self._misses = 0
+
+    with open(path, 'rb') as recording:
+      for call in read_recording(recording):
+        self._calls.setdefault(call.fingerprint(), []).append(call)
+
+  def call_count(self):
+    """Get the number of requests in the recording.
+
+    :rtype: integer
+    """
+    return sum(len(calls) for calls in self._calls.itervalues())
+
+  def miss_count(self):
+    """Get the number of requests made which weren't in the recording.
+
+    :rtype: integer
+    """
+    return self._misses
+
+  def request(self, dataset_id, method, data):
+    """Answer a request with its recorded response.
+
+    See :func:`gcloud.datastore.connection.HttpBackend.request`.
+    """
+    key = fingerprint(dataset_id, method, data)
+    with self._lock:
+      calls = self._calls.get(key)
+      if calls is None:
+        self._misses += 1
+      else:
+        replayed = self._replayed.get(key, 0)
+        self._replayed[key] = replayed + 1
+        call = calls[min(replayed, len(calls) - 1)]
+
+    if calls is None:
+      if self._fallback is not None:
+        return self._fallback.request(dataset_id, method, data)
+      raise RequestError(method, 404, 'No response was recorded for this '
+                         'request.')
+
+    if self._speed is not None:
+      time.sleep(call.seconds / self._speed)
+    if call.status != 200:
+      raise RequestError(method, call.status, call.response)
+    return call.response
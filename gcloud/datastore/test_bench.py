@@ -0,0 +1,40 @@
+import unittest2
+
+from gcloud.datastore import bench
+from gcloud.datastore.emulator import Emulator
+
+
+class TestWorkload(unittest2.TestCase):
+
+  def test_run_reports_each_operation(self):
+    dataset = Emulator().dataset('bench')
+    workload = bench.Workload(dataset, key_count=50, seed=1)
+    workload.populate(batch_size=20)
+    self.assertEqual(50, len(dataset.query('BenchEntity').fetch()))
+
+    report = workload.run(operations=200, concurrency=2)
+    self.assertEqual(200, report['operations'])
+    self.assertEqual(sorted(bench.OPERATIONS), sorted(report['by_operation']))
+    self.assertEqual(200 - report['errors'], sum(
+        stats['count'] for stats in report['by_operation'].values()))
+    latency = report['latency_ms']
+    self.assertTrue(latency['p50'] <= latency['p95'] <= latency['p99'])
+    self.assertTrue(report['throughput'] > 0)
+    self.assertEqual(2, report['config']['concurrency'])
+
+  def test_mix(self):
+    dataset = Emulator().dataset('bench')
+    workload = bench.Workload(dataset, mix=bench.parse_mix('get:1'),
+                              key_count=10, distribution='zipf')
+    workload.populate()
+    report = workload.run(operations=20)
+    self.assertEqual(['get'], report['by_operation'].keys())
+    self.assertEqual(20, report['by_operation']['get']['count'])
+
+  def test_bad_config(self):
+    dataset = Emulator().dataset('bench')
+    self.assertRaises(ValueError, bench.parse_mix, 'get:1,fly:2')
+    self.assertRaises(ValueError, bench.parse_mix, 'get:lots')
+    self.assertRaises(ValueError, bench.Workload, dataset, mix={'get': 0})
+    self.assertRaises(ValueError, bench.Workload, dataset,
+                      distribution='normal')
@@ -0,0 +1,112 @@
+import time
+
+import unittest2
+
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore.cache import EntityCache
+
+
+def _entity_pb(id):
+  entity_pb = datastore_pb.Entity()
+  entity_pb.key.partition_id.dataset_id = 's~dataset-id'
+  entity_pb.key.path_element.add(kind='Thing', id=id)
+  return entity_pb
+
+
+class TestEntityCache(unittest2.TestCase):
+
+  def test_get_and_put(self):
+    cache = EntityCache()
+    entity_pb = _entity_pb(1)
+    self.assertEqual(None, cache.get('dataset-id', entity_pb.key))
+    cache.put('dataset-id', entity_pb)
+    self.assertIs(entity_pb, cache.get('dataset-id', entity_pb.key))
+    self.assertIs(entity_pb, cache.get('s~dataset-id', entity_pb.key))
+    self.assertEqual(None, cache.get('other-dataset', entity_pb.key))
+    self.assertEqual({'size': 1, 'hits': 2, 'misses': 2, 'evictions': 0},
+                     cache.stats())
+
+  def test_evicts_least_recently_used(self):
+    cache = EntityCache(max_size=2)
+    for id in (1, 2):
+      cache.put('dataset-id', _entity_pb(id))
+    cache.get('dataset-id', _entity_pb(1).key)
+    cache.put('dataset-id', _entity_pb(3))
+    self.assertEqual(2, len(cache))
+    self.assertEqual(None, cache.get('dataset-id', _entity_pb(2).key))
+    self.assertTrue(cache.get('dataset-id', _entity_pb(1).key))
+    self.assertEqual(1, cache.stats()['evictions'])
+
+  def test_ttl(self):
+    cache = EntityCache(ttl=0.01)
+    cache.put('dataset-id', _entity_pb(1))
+    time.sleep(0.02)
+    self.assertEqual(None, cache.get('dataset-id', _entity_pb(1).key))
+    self.assertEqual(0, len(cache))
+
+  def test_invalidate_mutation(self):
+    cache = EntityCache()
+    for id in (1, 2, 3):
+      cache.put('dataset-id', _entity_pb(id))
+
+    mutation_pb = datastore_pb.Mutation()
+    mutation_pb.upsert.add().CopyFrom(_entity_pb(1))
+    mutation_pb.delete.add().CopyFrom(_entity_pb(2).key)
+    cache.invalidate_mutation('dataset-id', mutation_pb)
+    self.assertEqual(1, len(cache))
+    self.assertTrue(cache.get('dataset-id', _entity_pb(3).key))
+
+  def test_put_after_invalidate_is_dropped(self):
+    cache = EntityCache()
+    generation = cache.generation()
+    # A commit invalidates the entity while the read is in flight.
+    cache.invalidate('dataset-id', _entity_pb(1).key)
+    cache.put('dataset-id', _entity_pb(1), generation)
+    cache.put('dataset-id', _entity_pb(2), generation)
+    self.assertEqual(None, cache.get('dataset-id', _entity_pb(1).key))
+    self.assertTrue(cache.get('dataset-id', _entity_pb(2).key))
+
+    cache.put('dataset-id', _entity_pb(1), cache.generation())
+    self.assertTrue(cache.get('dataset-id', _entity_pb(1).key))
+
+  def test_put_older_than_forgotten_invalidations_is_dropped(self):
+    cache = EntityCache(max_size=1)
+    generation = cache.generation()
+    cache.invalidate('dataset-id', _entity_pb(1).key)
+    cache.invalidate('dataset-id', _entity_pb(2).key)
+    cache.put('dataset-id', _entity_pb(1), generation)
+    cache.put('dataset-id', _entity_pb(3), generation)
+    self.assertEqual(0, len(cache))
+
+  def test_put_after_clear_is_dropped(self):
+    cache = EntityCache()
+    generation = cache.generation()
+    cache.clear()
+    cache.put('dataset-id', _entity_pb(1), generation)
+    self.assertEqual(0, len(cache))
+
+
+class TestConnectionCache(unittest2.TestCase):
+
+  def _dataset(self):
+    from gcloud.datastore.emulator import Emulator
+    emulator = Emulator(batch_size=2)
+    cache = EntityCache()
+    dataset = emulator.connection(cache=cache).dataset('dataset-id')
+    for id in range(1, 6):
+      entity = dataset.entity('Thing')
+      entity['id'] = id
+      entity.save()
+    return dataset, cache
+
+  def test_query_fills_cache(self):
+    dataset, cache = self._dataset()
+    self.assertEqual(5, len(list(dataset.query('Thing').iter())))
+    self.assertEqual(5, len(cache))
+
+  def test_prefetch_in_transaction_skips_cache(self):
+    dataset, cache = self._dataset()
+    with dataset.transaction():
+      iterator = dataset.query('Thing').iter(page_size=2, prefetch=True)
+      self.assertEqual(5, len(list(iterator)))
+    self.assertEqual(0, len(cache))
@@ -0,0 +1,67 @@
+import datetime
+
+import pytz
+import unittest2
+
+from gcloud.datastore import columns
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+
+
+def _batch():
+  batch = datastore_pb.QueryResultBatch()
+  batch.entity_result_type = datastore_pb.EntityResult.FULL
+  for id in (1, 2, 3):
+    entity_pb = batch.entity_result.add().entity
+    entity_pb.key.path_element.add(kind='Thing', id=id)
+    entity_pb.property.add(name='name').value.string_value = u'thing-%d' % id
+    if id != 2:
+      entity_pb.property.add(name='count').value.integer_value = id
+    entity_pb.property.add(name='time').value.timestamp_microseconds_value = (
+        id * 1000000)
+    mixed = entity_pb.property.add(name='mixed').value
+    if id == 1:
+      mixed.double_value = 0.5
+    else:
+      mixed.integer_value = id
+    entity_pb.property.add(name='null').value.indexed = False
+  return batch
+
+
+class TestColumnBuilder(unittest2.TestCase):
+
+  def test_fallback_lists(self):
+    numpy, columns.numpy = columns.numpy, None
+    try:
+      result = columns.columns_from_batches([_batch()])
+    finally:
+      columns.numpy = numpy
+
+    self.assertEqual([1, 2, 3], [key.id() for key in result['__key__']])
+    self.assertEqual([u'thing-1', u'thing-2', u'thing-3'], result['name'])
+    self.assertEqual([1, None, 3], result['count'])
+    self.assertEqual([0.5, 2, 3], result['mixed'])
+    self.assertEqual(datetime.datetime(1970, 1, 1, 0, 0, 2, tzinfo=pytz.utc),
+                     result['time'][1])
+    self.assertNotIn('null', result)
+
+  @unittest2.skipIf(columns.numpy is None, 'NumPy is not installed')
+  def test_numpy_arrays(self):
+    result = columns.columns_from_batches([_batch()])
+    self.assertEqual('int64', result['count'].dtype)
+    self.assertEqual([1, None, 3], result['count'].tolist())
+    self.assertEqual('float64', result['mixed'].dtype)
+    self.assertEqual('datetime64[us]', result['time'].dtype)
+    self.assertEqual(object, result['name'].dtype)
+    self.assertEqual(3, result['__key__'][2].id())
+
+  @unittest2.skipIf(columns.numpy is None, 'NumPy is not installed')
+  def test_to_dataframe(self):
+    try:
+      import pandas
+    except ImportError:
+      self.skipTest('pandas is not installed')
+
+    frame = columns.to_dataframe(columns.columns_from_batches([_batch()]))
+    self.assertEqual(['__key__', 'count', 'mixed', 'name', 'time'],
+                     list(frame.columns))
+    self.assertTrue(pandas.isnull(frame['count'][1]))
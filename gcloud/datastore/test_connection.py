@@ -0,0 +1,293 @@
+import threading
+
+import unittest2
+
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore.connection import AsyncConnection
+from gcloud.datastore.connection import Connection
+from gcloud.datastore.connection import RequestError
+from gcloud.datastore.emulator import Emulator
+
+
+def _key_pb(id):
+  key_pb = datastore_pb.Key()
+  key_pb.partition_id.dataset_id = 's~dataset-id'
+  key_pb.path_element.add(kind='Thing', id=id)
+  return key_pb
+
+
+class _LookupConnection(Connection):
+  """Answers lookups from a dict, deferring keys once (or always) if asked to."""
+
+  LOOKUP_RETRY_DELAY = 0
+
+  def __init__(self, stored, defer=False):
+    super(_LookupConnection, self).__init__()
+    self.stored = stored
+    self.defer = defer
+    self.requests = []
+
+  def _rpc(self, dataset_id, method, request_pb, response_pb_cls):
+    self.requests.append([key_pb.path_element[0].id
+                          for key_pb in request_pb.key])
+    response = response_pb_cls()
+    for key_pb in request_pb.key:
+      id = key_pb.path_element[0].id
+      if self.defer == 'always' or (self.defer and len(self.requests) == 1):
+        response.deferred.add().CopyFrom(key_pb)
+      elif id in self.stored:
+        entity_pb = response.found.add().entity
+        entity_pb.key.CopyFrom(key_pb)
+        entity_pb.property.add(name='id').value.integer_value = id
+      else:
+        response.missing.add().entity.key.CopyFrom(key_pb)
+    return response
+
+
+class _RequestConnection(Connection):
+  """Answers every request with the same status and content."""
+
+  def __init__(self, status, content):
+    super(_RequestConnection, self).__init__()
+    self.status = status
+    self.content = content
+
+  def _request(self, dataset_id, method, data):
+    if self.status != 200:
+      raise RequestError(method, self.status, self.content)
+    return self.content
+
+
+class _CapturingBackend(object):
+  """Keeps the requests sent to an emulator."""
+
+  REQUESTS = {'lookup': datastore_pb.LookupRequest,
+              'commit': datastore_pb.CommitRequest}
+
+  def __init__(self):
+    self.emulator = Emulator()
+    self.requests = []
+
+  def request(self, dataset_id, method, data):
+    if method in self.REQUESTS:
+      self.requests.append(
+          (method, self.REQUESTS[method].FromString(data),
+           threading.current_thread()))
+    return self.emulator.request(dataset_id, method, data)
+
+
+class TestConnection(unittest2.TestCase):
+
+  def test_transactions_are_per_thread(self):
+    backend = _CapturingBackend()
+    connection = Connection(backend=backend)
+    dataset = connection.dataset('dataset-id')
+    entity = dataset.entity('Thing')
+    entity['name'] = u'shared'
+    entity.save()
+
+    began = threading.Event()
+    done = threading.Event()
+    seen = {}
+
+    def in_transaction():
+      transaction = dataset.transaction()
+      transaction.begin()
+      seen['transaction'] = transaction.id()
+      began.set()
+      done.wait(5)
+      transaction.rollback()
+
+    def outside_transaction():
+      seen['current'] = connection.transaction()
+      dataset.get_entity(entity.key())
+      dataset.entity('Thing').save()
+
+    thread_a = threading.Thread(target=in_transaction)
+    thread_a.start()
+    began.wait(5)
+    thread_b = threading.Thread(target=outside_transaction)
+    thread_b.start()
+    thread_b.join()
+    done.set()
+    thread_a.join()
+
+    self.assertTrue(seen['transaction'])
+    self.assertEqual(None, seen['current'])
+    requests = [(method, request_pb) for method, request_pb, thread
+                in backend.requests if thread is thread_b]
+    self.assertEqual(['lookup', 'commit'],
+                     [method for method, _ in requests])
+    lookup_pb, commit_pb = [request_pb for _, request_pb in requests]
+    self.assertFalse(lookup_pb.read_options.HasField('transaction'))
+    self.assertFalse(commit_pb.HasField('transaction'))
+    self.assertEqual(datastore_pb.CommitRequest.NON_TRANSACTIONAL,
+                     commit_pb.mode)
+
+  def test_listeners_get_rpc_stats(self):
+    response = datastore_pb.LookupResponse()
+    response.found.add().entity.key.CopyFrom(_key_pb(1))
+    connection = _RequestConnection(200, response.SerializeToString())
+    events = []
+    connection.add_listener(events.append)
+
+    connection.lookup('dataset-id', [_key_pb(1), _key_pb(2)])
+    stats = events[0]
+    self.assertEqual(('dataset-id', 'lookup', 200, 1),
+                     (stats.dataset_id, stats.method, stats.status,
+                      stats.entities))
+    self.assertGreater(stats.request_bytes, 0)
+    self.assertEqual(response.ByteSize(), stats.response_bytes)
+    self.assertGreaterEqual(stats.total_seconds(), stats.wire_seconds)
+
+    connection.remove_listener(events.append)
+    connection.lookup('dataset-id', [_key_pb(1)])
+    self.assertEqual(1, len(events))
+
+  def test_failed_request(self):
+    connection = _RequestConnection(409, 'Too much contention.')
+    events = []
+    connection.add_listener(events.append)
+    with self.assertRaises(RequestError) as raised:
+      connection.lookup('dataset-id', [_key_pb(1)])
+    self.assertEqual(409, raised.exception.status)
+    self.assertEqual('lookup', raised.exception.method)
+    self.assertEqual(409, events[0].status)
+    self.assertIs(raised.exception, events[0].error)
+
+  def test_batch_lookup_aligns_results(self):
+    connection = _LookupConnection(stored=set([1, 3]))
+    results = connection.batch_lookup('dataset-id',
+                                      [_key_pb(3), _key_pb(2), _key_pb(1)])
+    self.assertEqual(3, results[0].property[0].value.integer_value)
+    self.assertEqual(None, results[1])
+    self.assertEqual(1, results[2].property[0].value.integer_value)
+
+  def test_batch_lookup_deduplicates_and_chunks(self):
+    connection = _LookupConnection(stored=set(range(5)))
+    key_pbs = [_key_pb(i) for i in [0, 1, 2, 3, 4, 0, 1]]
+    results = connection.batch_lookup('dataset-id', key_pbs, max_keys=2)
+    self.assertEqual([0, 1, 2, 3, 4, 0, 1],
+                     [r.property[0].value.integer_value for r in results])
+    self.assertEqual([[0, 1], [2, 3], [4]], sorted(connection.requests))
+
+  def test_batch_lookup_retries_deferred(self):
+    connection = _LookupConnection(stored=set([1, 2]), defer=True)
+    results = connection.batch_lookup('dataset-id', [_key_pb(1), _key_pb(2)])
+    self.assertEqual(2, len(connection.requests))
+    self.assertEqual([1, 2],
+                     [r.property[0].value.integer_value for r in results])
+
+  def test_batch_lookup_gives_up_on_deferred(self):
+    connection = _LookupConnection(stored=set([1]), defer='always')
+    with self.assertRaises(RequestError) as raised:
+      connection.batch_lookup('dataset-id', [_key_pb(1)])
+    self.assertEqual(503, raised.exception.status)
+    self.assertEqual(Connection.MAX_LOOKUP_ROUNDS, len(connection.requests))
+
+  def test_lookup_single_key(self):
+    connection = _LookupConnection(stored=set([1]))
+    self.assertEqual(1, connection.lookup('dataset-id', _key_pb(1)).key
+                     .path_element[0].id)
+    self.assertEqual(None, connection.lookup('dataset-id', _key_pb(2)))
+
+  def test_lookup_skips_missing(self):
+    connection = _LookupConnection(stored=set([2]))
+    results = connection.lookup('dataset-id', [_key_pb(1), _key_pb(2)])
+    self.assertEqual([2], [r.key.path_element[0].id for r in results])
+
+  def test_batch_lookup_uses_cache(self):
+    from gcloud.datastore.cache import EntityCache
+    connection = _LookupConnection(stored=set([1, 2]))
+    connection._cache = EntityCache()
+    connection.batch_lookup('dataset-id', [_key_pb(1)])
+    results = connection.batch_lookup('dataset-id', [_key_pb(1), _key_pb(2)])
+    self.assertEqual([[1], [2]], connection.requests)
+    self.assertEqual([1, 2], [r.key.path_element[0].id for r in results])
+
+
+class TestAsyncConnection(unittest2.TestCase):
+
+  def setUp(self):
+    self.emulator = Emulator()
+    self.connection = self.emulator.connection(AsyncConnection, max_workers=4)
+    self.dataset = self.connection.dataset('dataset-id')
+
+  def tearDown(self):
+    self.connection.close()
+
+  def _people(self, count):
+    people = []
+    for i in range(count):
+      person = self.dataset.entity('Person')
+      person['name'] = u'person-%d' % i
+      people.append(person)
+    return people
+
+  def test_futures_match_sync_calls(self):
+    futures = [person.save_async() for person in self._people(3)]
+    people = [future.get(5) for future in futures]
+    keys = [person.key() for person in people]
+    self.assertTrue(all(not key.is_partial() for key in keys))
+
+    found = self.dataset.get_entities_async(keys).get(5)
+    self.assertEqual([dict(person) for person in
+                      self.dataset.get_entities(keys)],
+                     [dict(person) for person in found])
+
+    query = self.dataset.query('Person').order('name')
+    self.assertEqual([dict(person) for person in query.fetch()],
+                     [dict(person) for person in query.fetch_async().get(5)])
+
+    people[0].delete_async().get(5)
+    self.assertEqual(2, self.emulator.entity_count('dataset-id'))
+
+  def test_errors_propagate(self):
+    mutation_pb = datastore_pb.Mutation()
+    mutation_pb.update.add().key.CopyFrom(_key_pb(1))
+    future = self.connection.commit_async('dataset-id', mutation_pb)
+    with self.assertRaises(RequestError) as raised:
+      future.get(5)
+    self.assertEqual(400, raised.exception.status)
+
+  def test_calls_in_transaction_run_inline(self):
+    transaction = self.dataset.transaction()
+    transaction.begin()
+    future = self._people(1)[0].save_async()
+    # Writes in a transaction only add to its mutation, in the calling thread.
+    self.assertTrue(future.ready())
+    self.assertEqual(1, len(transaction.mutation().insert_auto_id))
+    transaction.rollback()
+
+  def test_commit_async_hands_off_transaction(self):
+    transaction = self.dataset.transaction()
+    transaction.begin()
+    for person in self._people(2):
+      person.save()
+
+    future = transaction.commit_async()
+    self.assertEqual(None, self.connection.transaction())
+    future.get(5)
+    self.assertEqual(None, transaction.id())
+    self.assertEqual(2, self.emulator.entity_count('dataset-id'))
+
+    # The thread is free to start another transaction.
+    transaction = self.dataset.transaction()
+    transaction.begin()
+    transaction.rollback_async().get(5)
+    self.assertEqual(None, self.connection.transaction())
+
+  def test_failed_commit_async(self):
+    emulator = Emulator(conflict_rate=1.0)
+    connection = emulator.connection(AsyncConnection, max_workers=2)
+    dataset = connection.dataset('dataset-id')
+    try:
+      transaction = dataset.transaction()
+      transaction.begin()
+      dataset.entity('Person').save()
+      future = transaction.commit_async()
+      self.assertRaises(RequestError, future.get, 5)
+      self.assertEqual(None, connection.transaction())
+      self.assertEqual(0, emulator.entity_count('dataset-id'))
+    finally:
+      connection.close()
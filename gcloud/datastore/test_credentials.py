@@ -0,0 +1,15 @@
+import sys
+
+import unittest2
+
+from gcloud.datastore.credentials import Credentials
+
+
+class TestCredentials(unittest2.TestCase):
+
+  def test_get_for_service_account_is_deferred(self):
+    # Neither the key file nor oauth2client are needed until first use.
+    credentials = Credentials.get_for_service_account(
+        'someone@example.com', '/nonexistent/private.key')
+    self.assertNotIn('oauth2client.client', sys.modules)
+    self.assertRaises(AttributeError, getattr, credentials, '_missing')
@@ -1,10 +1,42 @@
 import unittest2
 
+from gcloud.datastore.connection import Connection
 from gcloud.datastore.dataset import Dataset
 from gcloud.datastore.entity import Entity
+from gcloud.datastore.key import Key
 from gcloud.datastore.query import Query
 
 
+class _CommitConnection(Connection):
+  """Records commits, assigning IDs from 100 up to insert_auto_id entities.
+
+  Each indexed property counts as one index update.
+  """
+
+  MAX_COMMIT_ENTITIES = 2
+
+  def __init__(self):
+    super(_CommitConnection, self).__init__()
+    self.mutations = []
+    self.next_id = 100
+
+  def _rpc(self, dataset_id, method, request_pb, response_pb_cls):
+    self.mutations.append(request_pb.mutation)
+    response = response_pb_cls()
+    for entity_pb in request_pb.mutation.insert_auto_id:
+      key_pb = response.mutation_result.insert_auto_id_key.add()
+      key_pb.CopyFrom(entity_pb.key)
+      key_pb.path_element[-1].id = self.next_id
+      self.next_id += 1
+
+    for entity_pb in (list(request_pb.mutation.insert_auto_id) +
+                      list(request_pb.mutation.upsert)):
+      response.mutation_result.index_updates += len(
+          [property_pb for property_pb in entity_pb.property
+           if property_pb.value.indexed])
+    return response
+
+
 class TestDataset(unittest2.TestCase):
 
   def test_init_id_required(self):
@@ -26,3 +58,69 @@ class TestDataset(unittest2.TestCase):
     entity = dataset.entity('TestKind')
     self.assertIsInstance(entity, Entity)
     self.assertEqual('TestKind', entity.kind())
+
+  def test_put_entities(self):
+    connection = _CommitConnection()
+    dataset = Dataset('dataset-id', connection)
+    entities = [dataset.entity('Thing'), dataset.entity('Thing'),
+                Entity.from_key(Key.from_path('Thing', 'named',
+                                              dataset=dataset))]
+    for i, entity in enumerate(entities):
+      entity['number'] = i
+
+    self.assertEqual(entities, dataset.put_entities(entities))
+    self.assertEqual([100, 101], [entity.key().id() for entity in entities[:2]])
+    self.assertEqual([2, 0], [len(mutation.insert_auto_id)
+                              for mutation in connection.mutations])
+    self.assertEqual('named', connection.mutations[1].upsert[0].key.
+                     path_element[0].name)
+
+  def test_put_entities_in_transaction(self):
+    connection = _CommitConnection()
+    dataset = Dataset('dataset-id', connection)
+    transaction = dataset.transaction()
+    connection.transaction(transaction)
+    entities = [dataset.entity('Thing') for i in range(3)]
+
+    dataset.put_entities(entities)
+    self.assertEqual([], connection.mutations)
+    self.assertEqual(3, len(transaction.mutation().insert_auto_id))
+    self.assertEqual(entities, transaction._auto_id_entities)
+
+  def test_put_entities_excludes_from_indexes(self):
+    connection = _CommitConnection()
+    dataset = Dataset('dataset-id', connection)
+    dataset.exclude_from_indexes('Article', 'body')
+    self.assertEqual(frozenset(['body']), dataset.exclude_from_indexes('Article'))
+
+    entity = dataset.entity('Article').exclude_from_indexes('views')
+    entity.update({'title': u'Hi', 'body': u'...', 'views': 3})
+    dataset.put_entities([entity])
+
+    indexed = dict((property_pb.name, property_pb.value.indexed)
+                   for property_pb in connection.mutations[0].insert_auto_id[0].
+                   property)
+    self.assertEqual({'title': True, 'body': False, 'views': False}, indexed)
+    self.assertEqual(1, connection.index_updates())
+
+  def test_delete_keys(self):
+    connection = _CommitConnection()
+    dataset = Dataset('dataset-id', connection)
+    dataset.delete_keys([Key.from_path('Thing', id, dataset=dataset)
+                         for id in (1, 2, 3)])
+    self.assertEqual([[1, 2], [3]],
+                     [[key_pb.path_element[0].id for key_pb in mutation.delete]
+                      for mutation in connection.mutations])
+
+  def test_put_entities_counts_framing_overhead(self):
+    connection = _CommitConnection()
+    connection.MAX_COMMIT_ENTITIES = 10
+    dataset = Dataset('dataset-id', connection)
+    entities = [Entity.from_key(Key.from_path('Thing', id, dataset=dataset))
+                for id in (1, 2)]
+    size = entities[0].to_protobuf().ByteSize()
+    # The entities only fit in one commit without their framing.
+    connection.MAX_COMMIT_BYTES = 2 * size + Connection.COMMIT_ENTITY_OVERHEAD
+    dataset.put_entities(entities)
+    self.assertEqual([1, 1], [len(mutation.upsert)
+                              for mutation in connection.mutations])
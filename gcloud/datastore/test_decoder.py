@@ -0,0 +1,99 @@
+import datetime
+import decimal
+
+import pytz
+import unittest2
+
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore import helpers
+from gcloud.datastore.dataset import Dataset
+from gcloud.datastore.decoder import EntityDecoder
+
+
+def _entity_pb(id):
+  entity_pb = datastore_pb.Entity()
+  entity_pb.key.partition_id.dataset_id = 's~dataset-id'
+  entity_pb.key.path_element.add(kind='Thing', id=id)
+  entity_pb.property.add(name='int').value.integer_value = id
+  entity_pb.property.add(name='str').value.string_value = u'thing'
+  entity_pb.property.add(name='bool').value.boolean_value = True
+  entity_pb.property.add(name='double').value.double_value = 1.5
+  entity_pb.property.add(name='time').value.timestamp_microseconds_value = (
+      1500000)
+  key_value = entity_pb.property.add(name='key').value
+  key_value.key_value.path_element.add(kind='Other', name='other')
+  key_value.indexed = False
+  entity_pb.property.add(name='null')
+  return entity_pb
+
+
+class TestEntityDecoder(unittest2.TestCase):
+
+  def test_decode_entity(self):
+    dataset = Dataset('dataset-id')
+    entity = EntityDecoder(dataset).decode_entity(_entity_pb(1))
+    self.assertIs(dataset, entity.dataset())
+    self.assertEqual(1, entity.key().id())
+    self.assertEqual(1, entity['int'])
+    self.assertEqual(u'thing', entity['str'])
+    self.assertEqual(True, entity['bool'])
+    self.assertEqual(1.5, entity['double'])
+    self.assertEqual(datetime.datetime(1970, 1, 1, 0, 0, 1, 500000,
+                                       tzinfo=pytz.utc), entity['time'])
+    self.assertEqual('other', entity['key'].name())
+    self.assertEqual(None, entity['null'])
+
+  def test_shares_datasets_and_strings(self):
+    batch = datastore_pb.QueryResultBatch()
+    batch.entity_result_type = datastore_pb.EntityResult.FULL
+    for id in (1, 2):
+      batch.entity_result.add().entity.CopyFrom(_entity_pb(id))
+
+    first, second = EntityDecoder().decode_batch(batch)
+    self.assertEqual('s~dataset-id', first.dataset().id())
+    self.assertIs(first.dataset(), second.dataset())
+    self.assertIs(first.keys()[0], second.keys()[0])
+    self.assertIs(first.kind(), second.kind())
+
+  def test_decode_keys_only_batch(self):
+    batch = datastore_pb.QueryResultBatch()
+    batch.entity_result_type = datastore_pb.EntityResult.KEY_ONLY
+    batch.entity_result.add().entity.key.path_element.add(kind='Thing', id=3)
+    keys = EntityDecoder().decode_batch(batch)
+    self.assertEqual([3], [key.id() for key in keys])
+
+  def test_decode_lookup_response(self):
+    response = datastore_pb.LookupResponse()
+    response.found.add().entity.CopyFrom(_entity_pb(4))
+    response.missing.add().entity.CopyFrom(_entity_pb(5))
+    entities = EntityDecoder().decode_response(response)
+    self.assertEqual([4], [entity.key().id() for entity in entities])
+
+  def test_decode_entities_passes_none(self):
+    entities = EntityDecoder().decode_entities([None, _entity_pb(1)])
+    self.assertEqual(None, entities[0])
+    self.assertEqual(1, entities[1]['int'])
+
+  def test_decode_lazy_entity(self):
+    entity = EntityDecoder(lazy=True).decode_entity(_entity_pb(6))
+    self.assertEqual(6, entity.key().id())
+    self.assertEqual(u'thing', entity['str'])
+    self.assertEqual(dict(EntityDecoder().decode_entity(_entity_pb(6))),
+                     dict(entity.materialize()))
+
+  def test_decode_registered_type(self):
+    registry = helpers.CodecRegistry()
+    registry.register(decimal.Decimal, str, decimal.Decimal, meaning=101)
+    entity_pb = _entity_pb(7)
+    value_pb = entity_pb.property.add(name='price').value
+    registry.encode(value_pb, decimal.Decimal('9.99'))
+
+    original, helpers.CODECS = helpers.CODECS, registry
+    try:
+      decoder = EntityDecoder()
+    finally:
+      helpers.CODECS = original
+
+    self.assertEqual(decimal.Decimal('9.99'),
+                     decoder.decode_entity(entity_pb)['price'])
+    self.assertEqual(decimal.Decimal('9.99'), decoder.decode_value(value_pb))
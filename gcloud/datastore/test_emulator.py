@@ -0,0 +1,192 @@
+import unittest2
+
+from gcloud.datastore.connection import RequestError
+from gcloud.datastore.emulator import Emulator
+
+
+class TestEmulator(unittest2.TestCase):
+
+  def _make_people(self, dataset, count):
+    people = []
+    for i in range(count):
+      person = dataset.entity('Person')
+      person['name'] = u'person-%d' % i
+      person['age'] = i % 4
+      people.append(person.save())
+    return people
+
+  def test_save_and_get(self):
+    dataset = Emulator().dataset('dataset-id')
+    person, = self._make_people(dataset, 1)
+    self.assertFalse(person.key().is_partial())
+
+    found = dataset.get_entity(person.key())
+    self.assertEqual(u'person-0', found['name'])
+    self.assertEqual(person.key().path(), found.key().path())
+
+    person.delete()
+    self.assertEqual(None, dataset.get_entity(person.key()))
+
+  def test_filters_and_orders(self):
+    dataset = Emulator().dataset('dataset-id')
+    self._make_people(dataset, 8)
+    query = dataset.query('Person')
+
+    self.assertEqual(
+        [u'person-2', u'person-6'],
+        sorted(person['name'] for person in query.filter('age =', 2).fetch()))
+    self.assertEqual(
+        [3, 3, 2, 2],
+        [person['age'] for person in query.order('-age').fetch(4)])
+    self.assertEqual(
+        [u'person-5', u'person-1'],
+        [person['name'] for person in
+         query.filter('age =', 1).order('-name').fetch()])
+    self.assertEqual(4, len(query.filter('age >', 0).filter('age <', 3).fetch()))
+    self.assertEqual([], dataset.query('Place').fetch())
+
+  def test_pages_through_results(self):
+    dataset = Emulator(batch_size=3).dataset('dataset-id')
+    self._make_people(dataset, 10)
+    query = dataset.query('Person').order('name')
+
+    self.assertEqual(3, len(query.fetch()))
+    names = [person['name'] for person in query.iter(prefetch=False)]
+    self.assertEqual(sorted(u'person-%d' % i for i in range(10)), names)
+
+    iterator = query.limit(5).iter(page_size=2, prefetch=False)
+    self.assertEqual(5, len(list(iterator)))
+    resumed = query.start_cursor(iterator.cursor()).iter(prefetch=False)
+    self.assertEqual(names[5:], [person['name'] for person in resumed])
+
+  def test_pages_past_infinite_and_nan_values(self):
+    dataset = Emulator().dataset('dataset-id')
+    for x in (1.0, float('inf'), 2.0, float('nan'), float('-inf')):
+      thing = dataset.entity('Thing')
+      thing['x'] = x
+      thing.save()
+
+    query = dataset.query('Thing').order('-x')
+    values = [thing['x'] for thing in query.iter(page_size=1, prefetch=False)]
+    self.assertEqual(['inf', '2.0', '1.0', '-inf', 'nan'], map(str, values))
+
+  def test_invalid_cursor(self):
+    dataset = Emulator().dataset('dataset-id')
+    for cursor in ('bogus', 'emulator:!!', 'emulator:' + 'e30='):
+      with self.assertRaises(RequestError) as raised:
+        dataset.query('Thing').start_cursor(cursor).fetch()
+      self.assertEqual(400, raised.exception.status)
+
+  def test_projection_and_keys_only(self):
+    dataset = Emulator().dataset('dataset-id')
+    people = self._make_people(dataset, 2)
+
+    keys = dataset.query('Person').keys_only().fetch()
+    self.assertEqual(sorted(person.key().id() for person in people),
+                     sorted(key.id() for key in keys))
+
+    projected = dataset.query('Person').projection('age').fetch()
+    self.assertEqual([{'age': 0}, {'age': 1}],
+                     sorted(dict(person) for person in projected))
+
+  def test_ancestor_and_split(self):
+    dataset = Emulator().dataset('dataset-id')
+    people = self._make_people(dataset, 20)
+    parent = people[0].key()
+    for i in range(3):
+      pet = dataset.entity('Pet')
+      pet.key(parent.path(parent.path() + [{'kind': 'Pet', 'id': i + 1}]))
+      pet.save()
+
+    query_pb = dataset.query('Pet').to_protobuf()
+    query_pb.filter.composite_filter.operator = (
+        query_pb.filter.composite_filter.AND)
+    filter_pb = query_pb.filter.composite_filter.filter.add().property_filter
+    filter_pb.property.name = '__key__'
+    filter_pb.operator = filter_pb.HAS_ANCESTOR
+    filter_pb.value.key_value.CopyFrom(parent.to_protobuf())
+    batch = dataset.connection().run_query_batch('dataset-id', query_pb)
+    self.assertEqual(3, len(batch.entity_result))
+
+    shards = dataset.query('Person').split(4)
+    self.assertTrue(len(shards) > 1)
+    counts = [len(shard.fetch()) for shard in shards]
+    self.assertEqual(20, sum(counts))
+
+  def test_unindexed_properties_are_not_queryable(self):
+    dataset = Emulator().dataset('dataset-id')
+    person = dataset.entity('Person')
+    person['bio'] = u'Likes long walks.'
+    person.exclude_from_indexes('bio').save()
+
+    self.assertEqual([], dataset.query('Person').filter(
+        'bio =', u'Likes long walks.').fetch())
+    self.assertEqual(u'Likes long walks.',
+                     dataset.get_entity(person.key())['bio'])
+
+  def test_transaction_conflict(self):
+    emulator = Emulator()
+    dataset = emulator.dataset('dataset-id')
+    other = emulator.dataset('dataset-id')
+    person, = self._make_people(dataset, 1)
+
+    transaction = dataset.transaction()
+    transaction.begin()
+    person['age'] = 10
+    person.save()
+
+    other.get_entity(person.key()).save()  # Changed outside the transaction.
+    with self.assertRaises(RequestError) as raised:
+      transaction.commit()
+    self.assertEqual(409, raised.exception.status)
+    self.assertEqual(None, dataset.connection().transaction())
+
+  def test_transaction_commits_and_rolls_back(self):
+    dataset = Emulator().dataset('dataset-id')
+
+    with dataset.transaction():
+      self._make_people(dataset, 2)
+    self.assertEqual(2, len(dataset.query('Person').fetch()))
+
+    transaction = dataset.transaction()
+    transaction.begin()
+    self._make_people(dataset, 1)
+    transaction.rollback()
+    self.assertEqual(2, len(dataset.query('Person').fetch()))
+
+  def test_random_conflicts(self):
+    dataset = Emulator(conflict_rate=1.0).dataset('dataset-id')
+    with self.assertRaises(RequestError):
+      with dataset.transaction():
+        self._make_people(dataset, 1)
+
+  def test_datasets_are_separate(self):
+    emulator = Emulator()
+    self._make_people(emulator.dataset('one'), 2)
+    self.assertEqual(2, emulator.entity_count('one'))
+    self.assertEqual(0, emulator.entity_count('two'))
+
+  def test_allocate_ids(self):
+    dataset = Emulator().dataset('dataset-id')
+    keys = dataset.allocate_ids(dataset.entity('Person').key(), 3)
+    self.assertEqual(3, len(set(key.id() for key in keys)))
+
+  def test_bad_requests(self):
+    emulator = Emulator()
+    with self.assertRaises(RequestError) as raised:
+      emulator.request('dataset-id', 'frobnicate', '')
+    self.assertEqual(404, raised.exception.status)
+
+    dataset = emulator.dataset('dataset-id')
+    person = dataset.entity('Person')
+    person.key(person.key().id(1))
+    with self.assertRaises(RequestError) as raised:
+      dataset.connection().commit('dataset-id', _update(person))
+    self.assertEqual(400, raised.exception.status)
+
+
+def _update(entity):
+  from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+  mutation = datastore_pb.Mutation()
+  mutation.update.add().key.CopyFrom(entity.key().to_protobuf())
+  return mutation
@@ -25,3 +25,109 @@ class TestEntity(unittest2.TestCase):
     self.assertEqual('TestKind', entity.key().kind())
     self.assertEqual(entity.key().kind(), entity.kind())
     self.assertEqual(1234, entity.key().id())
+
+  def test_exclude_from_indexes(self):
+    dataset = Dataset(id='test-dataset')
+    dataset.exclude_from_indexes('TestKind', 'body')
+    entity = Entity(dataset, 'TestKind')
+    self.assertEqual(entity, entity.exclude_from_indexes('views'))
+    self.assertEqual(frozenset(['views']), entity.exclude_from_indexes())
+
+    entity.update({'title': u'Hi', 'body': u'...', 'views': 3})
+    entity_pb = entity.to_protobuf()
+    indexed = dict((property_pb.name, property_pb.value.indexed)
+                   for property_pb in entity_pb.property)
+    self.assertEqual({'title': True, 'body': False, 'views': False}, indexed)
+
+    entity = Entity.from_protobuf(entity_pb)
+    self.assertEqual(frozenset(['body', 'views']), entity.exclude_from_indexes())
+
+
+class _SavingConnection(object):
+
+  def __init__(self):
+    self.saved = []
+
+  def save_entity(self, dataset_id, key_pb, properties, property_pbs=None,
+                  exclude_from_indexes=()):
+    self.saved.append((properties, property_pbs, exclude_from_indexes))
+    return key_pb
+
+  def transaction(self):
+    return None
+
+
+class TestLazyEntity(unittest2.TestCase):
+
+  def _make_one(self, connection=None):
+    # This import is here to avoid circular references.
+    from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+    from gcloud.datastore.entity import LazyEntity
+
+    entity_pb = datastore_pb.Entity()
+    entity_pb.property.add(name='name').value.string_value = u'Sally'
+    entity_pb.property.add(name='age').value.integer_value = 31
+
+    self.decoded = []
+    def decode_value(value_pb):
+      self.decoded.append(value_pb)
+      return value_pb.string_value or value_pb.integer_value
+
+    dataset = Dataset('test-dataset', connection=connection)
+    key = Key(dataset=dataset).kind('Person').id(1)
+    return LazyEntity(key, entity_pb, decode_value)
+
+  def test_decodes_on_access(self):
+    entity = self._make_one()
+    self.assertEqual([], self.decoded)
+    self.assertEqual(2, len(entity))
+    self.assertIn('age', entity)
+    self.assertEqual(31, entity['age'])
+    self.assertEqual(31, entity['age'])
+    self.assertEqual(1, len(self.decoded))
+    self.assertEqual(None, entity.get('missing'))
+    self.assertRaises(KeyError, entity.__getitem__, 'missing')
+
+  def test_acts_like_entity(self):
+    entity = self._make_one()
+    entity['email'] = 'sally@example.com'
+    del entity['age']
+    self.assertEqual(['email', 'name'], sorted(entity))
+    self.assertEqual({'name': u'Sally', 'email': 'sally@example.com'},
+                     entity.copy())
+    self.assertEqual('Person', entity.kind())
+
+  def test_converts_to_dict(self):
+    from gcloud.datastore.entity import Entity
+
+    entity = self._make_one()
+    eager = Entity.from_protobuf(entity._pb)
+    self.assertTrue(isinstance(entity, Entity))
+    self.assertEqual(dict(eager), dict(entity))
+
+    updated = {'email': 'sally@example.com'}
+    updated.update(self._make_one())
+    self.assertEqual(dict(eager, email='sally@example.com'), updated)
+    self.assertEqual(eager, entity)
+    self.assertEqual(sorted(eager.items()), sorted(entity.items()))
+
+  def test_save_reuses_untouched_properties(self):
+    connection = _SavingConnection()
+    entity = self._make_one(connection=connection)
+    entity['name'] = u'Bob'
+    entity.save()
+
+    properties, property_pbs, _ = connection.saved[0]
+    self.assertEqual({'name': u'Bob'}, properties)
+    self.assertEqual(['age'], [property_pb.name for property_pb in property_pbs])
+    self.assertEqual([], self.decoded)
+
+  def test_save_keeps_unindexed_properties_unindexed(self):
+    connection = _SavingConnection()
+    entity = self._make_one(connection=connection)
+    entity._pb.property[1].value.indexed = False
+    entity['age'] = 32
+    entity.save()
+
+    _, _, exclude_from_indexes = connection.saved[0]
+    self.assertEqual(frozenset(['age']), exclude_from_indexes)
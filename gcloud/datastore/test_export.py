@@ -0,0 +1,122 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore.connection import Connection
+from gcloud.datastore.dataset import Dataset
+from gcloud.datastore.export import Exporter
+from gcloud.datastore.export import entity_to_json
+from gcloud.datastore.export import read_records
+from gcloud.datastore.query import Query
+
+
+class _PagingConnection(Connection):
+  """Serves ``count`` entities of kind Thing using offsets as cursors."""
+
+  def __init__(self, count):
+    super(_PagingConnection, self).__init__()
+    self.count = count
+    self.query_pbs = []
+
+  def _rpc(self, dataset_id, method, request_pb, response_pb_cls):
+    query_pb = request_pb.query
+    self.query_pbs.append(query_pb)
+    start = int(query_pb.start_cursor or 0)
+    end = min(self.count, start + query_pb.limit)
+
+    response = response_pb_cls()
+    batch = response.batch
+    batch.entity_result_type = datastore_pb.EntityResult.FULL
+    for id in range(start + 1, end + 1):
+      entity_pb = batch.entity_result.add().entity
+      entity_pb.key.path_element.add(kind='Thing', id=id)
+      entity_pb.property.add(name='name').value.string_value = 'name-%d' % id
+    batch.end_cursor = str(end)
+    if end < self.count:
+      batch.more_results = datastore_pb.QueryResultBatch.MORE_RESULTS_AFTER_LIMIT
+    else:
+      batch.more_results = datastore_pb.QueryResultBatch.NO_MORE_RESULTS
+    return response
+
+
+class _FailingConnection(_PagingConnection):
+  """Fails once after serving ``pages`` pages."""
+
+  def __init__(self, count, pages):
+    super(_FailingConnection, self).__init__(count)
+    self.pages = pages
+
+  def _rpc(self, *args):
+    if len(self.query_pbs) == self.pages:
+      self.pages = None
+      raise IOError('Connection reset.')
+    return super(_FailingConnection, self)._rpc(*args)
+
+
+class TestExporter(unittest2.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'things')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def _query(self, connection):
+    return Query('Thing', dataset=Dataset('dataset-id', connection))
+
+  def _read_ids(self):
+    with gzip.open(self.path) as export_file:
+      return [json.loads(line)['key']['path'][0]['id']
+              for line in export_file]
+
+  def test_json_export(self):
+    stats = Exporter(self._query(_PagingConnection(5)), self.path,
+                     page_size=2, processes=0).run()
+    self.assertEqual([1, 2, 3, 4, 5], self._read_ids())
+    self.assertEqual(5, stats['rows'])
+    self.assertEqual(os.path.getsize(self.path), stats['bytes'])
+    self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+  def test_protobuf_export_in_processes(self):
+    Exporter(self._query(_PagingConnection(5)), self.path, format='protobuf',
+             compress=False, page_size=2, processes=2).run()
+    with open(self.path, 'rb') as export_file:
+      entity_pbs = [datastore_pb.Entity.FromString(data)
+                    for data in read_records(export_file)]
+    self.assertEqual([1, 2, 3, 4, 5],
+                     [entity_pb.key.path_element[0].id
+                      for entity_pb in entity_pbs])
+
+  def test_resumes_from_checkpoint(self):
+    connection = _FailingConnection(5, pages=2)
+    exporter = Exporter(self._query(connection), self.path, page_size=2,
+                        processes=0)
+    self.assertRaises(IOError, exporter.run)
+    self.assertEqual(4, exporter.checkpoint()['rows'])
+
+    stats = exporter.run()
+    self.assertEqual('4', connection.query_pbs[-1].start_cursor)
+    self.assertEqual(5, stats['rows'])
+    self.assertEqual([1, 2, 3, 4, 5], self._read_ids())
+
+  def test_invalid_format(self):
+    self.assertRaises(ValueError, Exporter, None, self.path, format='xml')
+
+  def test_entity_to_json(self):
+    entity_pb = datastore_pb.Entity()
+    entity_pb.key.path_element.add(kind='Thing', name='thing')
+    entity_pb.property.add(name='blob').value.blob_value = '\x00'
+    entity_pb.property.add(
+        name='time').value.timestamp_microseconds_value = 1500000
+    self.assertEqual({'key': {'path': [{'kind': 'Thing', 'name': 'thing'}]},
+                      'properties': {
+                          'blob': {'$blob': 'AA=='},
+                          'time': {'$timestamp': '1970-01-01T00:00:01.500000Z'},
+                          }},
+                     entity_to_json(entity_pb))
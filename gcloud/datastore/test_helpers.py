@@ -0,0 +1,102 @@
+import datetime
+import decimal
+
+import pytz
+import unittest2
+
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore import helpers
+from gcloud.datastore.helpers import CodecRegistry
+from gcloud.datastore.key import Key
+
+
+class _Money(decimal.Decimal):
+  pass
+
+
+class TestHelpers(unittest2.TestCase):
+
+  def test_get_protobuf_attribute_and_value(self):
+    self.assertEqual(('integer_value', 1234),
+                     helpers.get_protobuf_attribute_and_value(1234))
+    self.assertEqual(('boolean_value', True),
+                     helpers.get_protobuf_attribute_and_value(True))
+    self.assertEqual(('string_value', u'abc'),
+                     helpers.get_protobuf_attribute_and_value('abc'))
+    self.assertEqual((None, None),
+                     helpers.get_protobuf_attribute_and_value(None))
+
+  def test_get_protobuf_attribute_and_value_registered_type(self):
+    helpers.register_type(_Money, str, _Money, meaning=199)
+    self.assertEqual(('string_value', u'1.10'),
+                     helpers.get_protobuf_attribute_and_value(_Money('1.10')))
+
+  def test_timestamp_round_trip(self):
+    value = datetime.datetime(2014, 3, 1, 12, 30, 15, 250, tzinfo=pytz.utc)
+    name, microseconds = helpers.get_protobuf_attribute_and_value(value)
+    self.assertEqual('timestamp_microseconds_value', name)
+    self.assertEqual(1393677015000250, microseconds)
+
+    property_pb = datastore_pb.Property(name='created')
+    helpers.set_protobuf_value(property_pb.value, value.replace(tzinfo=None))
+    self.assertEqual(value, helpers.get_value_from_protobuf(property_pb))
+
+  def test_key_value(self):
+    key = Key.from_path('Person', 1234)
+    property_pb = datastore_pb.Property(name='parent')
+    helpers.set_protobuf_value(property_pb.value, key)
+    self.assertEqual(key.path(),
+                     helpers.get_value_from_protobuf(property_pb).path())
+
+  def test_unknown_type(self):
+    with self.assertRaises(ValueError):
+      helpers.set_protobuf_value(datastore_pb.Value(), object())
+
+
+class TestCodecRegistry(unittest2.TestCase):
+
+  def test_subclasses_use_base_codec(self):
+    class Count(int):
+      pass
+
+    registry = CodecRegistry()
+    value_pb = datastore_pb.Value()
+    registry.encode(value_pb, Count(3))
+    self.assertEqual(3, value_pb.integer_value)
+    self.assertEqual(3, registry.decode(value_pb))
+
+  def test_registered_type(self):
+    registry = CodecRegistry()
+    registry.register(decimal.Decimal, str, decimal.Decimal, meaning=101)
+
+    value_pb = datastore_pb.Value()
+    registry.encode(value_pb, decimal.Decimal('1.10'))
+    self.assertEqual(u'1.10', value_pb.string_value)
+    self.assertEqual(101, value_pb.meaning)
+    self.assertEqual(decimal.Decimal('1.10'), registry.decode(value_pb))
+
+    # Other strings are left alone.
+    value_pb = datastore_pb.Value()
+    registry.encode(value_pb, 'plain')
+    self.assertEqual(u'plain', registry.decode(value_pb))
+
+  def test_register_decode_needs_meaning(self):
+    registry = CodecRegistry()
+    with self.assertRaises(ValueError):
+      registry.register(decimal.Decimal, str, decimal.Decimal)
+
+  def test_date_encodes_as_timestamp(self):
+    registry = CodecRegistry()
+    registry.register(
+        datetime.date,
+        lambda date: datetime.datetime(date.year, date.month, date.day),
+        lambda value: value.date(), meaning=102)
+
+    value_pb = datastore_pb.Value()
+    registry.encode(value_pb, datetime.date(2014, 3, 1))
+    self.assertEqual(datetime.date(2014, 3, 1), registry.decode(value_pb))
+
+    # A datetime is a date too, but has its own codec.
+    value_pb = datastore_pb.Value()
+    registry.encode(value_pb, datetime.datetime(2014, 3, 1, 12))
+    self.assertEqual(0, value_pb.meaning)
@@ -0,0 +1,87 @@
+import threading
+
+import unittest2
+
+from gcloud.datastore.connection import Connection
+from gcloud.datastore.dataset import Dataset
+from gcloud.datastore.id_pool import IdPool
+from gcloud.datastore.key import Key
+
+
+class _AllocatingConnection(Connection):
+  """Allocates IDs counting up from 1 for each kind."""
+
+  def __init__(self):
+    super(_AllocatingConnection, self).__init__()
+    self.requests = []
+    self.next_ids = {}
+    self.lock = threading.Lock()
+
+  def _rpc(self, dataset_id, method, request_pb, response_pb_cls):
+    response = response_pb_cls()
+    with self.lock:
+      self.requests.append(len(request_pb.key))
+      for key_pb in request_pb.key:
+        kind = key_pb.path_element[-1].kind
+        self.next_ids[kind] = self.next_ids.get(kind, 0) + 1
+        allocated = response.key.add()
+        allocated.CopyFrom(key_pb)
+        allocated.path_element[-1].id = self.next_ids[kind]
+    return response
+
+
+class TestIdPool(unittest2.TestCase):
+
+  def setUp(self):
+    self.connection = _AllocatingConnection()
+    self.dataset = Dataset('dataset-id', self.connection)
+    self.key = Key(dataset=self.dataset).kind('Thing')
+
+  def test_allocate_ids(self):
+    keys = self.dataset.allocate_ids(self.key, 3)
+    self.assertEqual([1, 2, 3], [key.id() for key in keys])
+    self.assertEqual('Thing', keys[0].kind())
+    self.assertRaises(ValueError, self.dataset.allocate_ids, keys[0], 1)
+
+  def test_reserves_blocks(self):
+    pool = IdPool(self.dataset, block_size=10, prefetch=False)
+    ids = [pool.next_key(self.key).id() for i in range(12)]
+    self.assertEqual(range(1, 13), ids)
+    self.assertEqual([10, 10], self.connection.requests)
+    self.assertEqual(8, pool.available(self.key))
+
+    other = pool.next_key(Key(dataset=self.dataset).kind('Other'))
+    self.assertEqual(1, other.id())
+
+  def test_large_requests_and_prefetch(self):
+    pool = IdPool(self.dataset, block_size=10, low_water=5)
+    keys = pool.next_keys(self.key, 25)
+    self.assertEqual(range(1, 26), [key.id() for key in keys])
+    self.assertEqual(25, self.connection.requests[0])
+
+    # Running dry starts a block in the background.
+    pool._reserve_for(self.key).refill.wait()
+    self.assertEqual(10, pool.available(self.key))
+
+  def test_threads_get_unique_ids(self):
+    pool = IdPool(self.dataset, block_size=7)
+    ids = []
+
+    def take():
+      for i in range(50):
+        ids.append(pool.next_key(self.key).id())
+
+    threads = [threading.Thread(target=take) for i in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(200, len(set(ids)))
+
+  def test_complete(self):
+    pool = IdPool(self.dataset)
+    named = Key(dataset=self.dataset).kind('Thing').name('named')
+    entities = [self.dataset.entity('Thing'), self.dataset.entity('Thing'),
+                self.dataset.entity('Thing').key(named)]
+    pool.complete(entities)
+    self.assertEqual([1, 2, None], [entity.key().id() for entity in entities])
@@ -11,3 +11,41 @@ class TestKey(unittest2.TestCase):
     self.assertEqual('', key.kind())
     self.assertEqual(None, key.dataset())
     self.assertEqual(None, key.namespace())
+
+  def test_setters_return_new_keys(self):
+    key = Key().kind('Thing')
+    with_id = key.id(1234)
+    self.assertEqual(None, key.id())
+    self.assertEqual(1234, with_id.id())
+    self.assertEqual([{'kind': 'Thing', 'id': 1234}], with_id.path())
+    self.assertEqual('foo', with_id.name('foo').name())
+
+  def test_equality_and_hashing(self):
+    from gcloud.datastore.dataset import Dataset
+    key1 = Key.from_path('Thing', 1, dataset=Dataset('dataset-id'))
+    key2 = Key.from_path('Thing', 1, dataset=Dataset('s~dataset-id'))
+    key3 = Key.from_path('Thing', 2, dataset=Dataset('dataset-id'))
+    self.assertEqual(key1, key2)
+    self.assertNotEqual(key1, key3)
+    self.assertEqual(hash(key1), hash(key2))
+    self.assertEqual(2, len(set([key1, key2, key3])))
+
+  def test_protobuf_round_trip(self):
+    from gcloud.datastore.dataset import Dataset
+    dataset = Dataset('dataset-id')
+    key = Key.from_path('Parent', 'p', 'Thing', 1, dataset=dataset,
+                        namespace='ns')
+    key_pb = key.to_protobuf()
+    self.assertIs(key_pb, key.to_protobuf())
+    self.assertEqual('s~dataset-id', key_pb.partition_id.dataset_id)
+    self.assertEqual(key_pb.SerializeToString(), key.serialized())
+
+    restored = Key.from_protobuf(key_pb, dataset=dataset)
+    self.assertEqual(key, restored)
+    self.assertEqual('ns', restored.namespace())
+    self.assertEqual([{'kind': 'Parent', 'name': 'p'},
+                      {'kind': 'Thing', 'id': 1}], restored.path())
+
+  def test_slots(self):
+    with self.assertRaises(AttributeError):
+      Key().foo = 'bar'
@@ -0,0 +1,108 @@
+import threading
+from cStringIO import StringIO
+
+import unittest2
+
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore.connection import Connection
+from gcloud.datastore.dataset import Dataset
+from gcloud.datastore.export import _encode_batch
+from gcloud.datastore import loader
+
+
+class _CommitConnection(Connection):
+  """Records mutations committed, failing any with an entity named 'bad'."""
+
+  def __init__(self):
+    super(_CommitConnection, self).__init__()
+    self.mutations = []
+    self.lock = threading.Lock()
+
+  def _rpc(self, dataset_id, method, request_pb, response_pb_cls):
+    for entity_pb in request_pb.mutation.upsert:
+      if entity_pb.key.path_element[0].name == 'bad':
+        raise ValueError('Bad entity.')
+    with self.lock:
+      self.mutations.append(request_pb.mutation)
+    return response_pb_cls()
+
+
+class TestReaders(unittest2.TestCase):
+
+  def test_read_csv(self):
+    csv_file = StringIO('id,name,age,note\n1,Sally,31,\nbob,Bob,25,hi\n')
+    entity_pbs = list(loader.read_csv(csv_file, 'Person', key_column='id',
+                                      types={'age': int}))
+    self.assertEqual(1, entity_pbs[0].key.path_element[0].id)
+    self.assertEqual('bob', entity_pbs[1].key.path_element[0].name)
+    properties = dict((p.name, p.value) for p in entity_pbs[0].property)
+    self.assertEqual(['age', 'name'], sorted(properties))
+    self.assertEqual(31, properties['age'].integer_value)
+
+  def test_read_jsonl(self):
+    jsonl_file = StringIO(
+        '{"key": {"path": [{"kind": "Thing", "id": 1}]},'
+        ' "properties": {"when": {"$timestamp": "1970-01-01T00:00:01.500000Z"},'
+        ' "tags": ["a", "b"]}}\n'
+        '\n')
+    entity_pb, = loader.read_jsonl(jsonl_file)
+    properties = dict((p.name, p.value) for p in entity_pb.property)
+    self.assertEqual(1500000, properties['when'].timestamp_microseconds_value)
+    self.assertEqual([u'a', u'b'], [value.string_value
+                                    for value in properties['tags'].list_value])
+
+  def test_read_jsonl_properties(self):
+    jsonl_file = StringIO('{"id": "sally", "age": 31}\n')
+    entity_pb, = loader.read_jsonl(jsonl_file, kind='Person', key_property='id')
+    self.assertEqual('sally', entity_pb.key.path_element[0].name)
+    self.assertEqual(['age'], [p.name for p in entity_pb.property])
+
+  def test_read_protobuf_export(self):
+    batch = datastore_pb.QueryResultBatch()
+    batch.entity_result_type = datastore_pb.EntityResult.FULL
+    batch.more_results = datastore_pb.QueryResultBatch.NO_MORE_RESULTS
+    batch.entity_result.add().entity.key.path_element.add(kind='Thing', id=7)
+    data = _encode_batch('protobuf', False, batch.SerializeToString())
+    entity_pb, = loader.read_protobuf(StringIO(data))
+    self.assertEqual(7, entity_pb.key.path_element[0].id)
+
+
+class TestLoader(unittest2.TestCase):
+
+  def _entity_pbs(self, names):
+    for name in names:
+      entity_pb = datastore_pb.Entity()
+      entity_pb.key.partition_id.dataset_id = 's~other-dataset'
+      entity_pb.key.path_element.add(kind='Thing', name=name)
+      entity_pb.property.add(name='data').value.string_value = 'x' * 100
+      yield entity_pb
+
+  def test_batches_bounded_by_count_and_size(self):
+    dataset = Dataset('dataset-id', _CommitConnection())
+    batches = list(loader.Loader(dataset, max_entities=3).batches(
+        self._entity_pbs('abcdefg')))
+    self.assertEqual([3, 3, 1], [batch.count for batch in batches])
+    self.assertEqual([0, 3, 6], [batch.first_row for batch in batches])
+    self.assertFalse(batches[0].mutation.upsert[0].key.partition_id.HasField(
+        'dataset_id'))
+
+    batches = list(loader.Loader(dataset, max_bytes=300).batches(
+        self._entity_pbs('abcde')))
+    self.assertEqual([2, 2, 1], [batch.count for batch in batches])
+
+  def test_load_reports_failed_batches(self):
+    connection = _CommitConnection()
+    load = loader.Loader(Dataset('dataset-id', connection), max_entities=2,
+                         concurrency=2)
+    stats = load.load(self._entity_pbs(['a', 'b', 'c', 'bad', 'e']))
+    self.assertEqual(3, stats['rows'])
+    self.assertEqual(2, stats['batches'])
+    batch, = stats['failed']
+    self.assertEqual(2, batch.first_row)
+    self.assertIsInstance(batch.error, ValueError)
+
+    batch.mutation.upsert[1].key.path_element[0].name = 'd'
+    stats = load.retry([batch])
+    self.assertEqual(2, stats['rows'])
+    self.assertEqual([], stats['failed'])
+    self.assertEqual(3, len(connection.mutations))
@@ -0,0 +1,59 @@
+import unittest2
+
+from gcloud.datastore.connection import RpcStats
+from gcloud.datastore.metrics import Histogram
+from gcloud.datastore.metrics import Metrics
+
+
+def _stats(method, wire_seconds, status=200, entities=0):
+  stats = RpcStats('dataset-id', method)
+  stats.wire_seconds = wire_seconds
+  stats.status = status
+  stats.entities = entities
+  stats.request_bytes = 100
+  return stats
+
+
+class TestHistogram(unittest2.TestCase):
+
+  def test_buckets(self):
+    histogram = Histogram([1, 5])
+    for value in (0.5, 1, 3, 7):
+      histogram.observe(value)
+    self.assertEqual([(1, 2), (5, 3), (float('inf'), 4)], histogram.buckets())
+    self.assertEqual(4, histogram.count())
+    self.assertEqual(11.5, histogram.sum())
+    self.assertEqual(1, histogram.percentile(50))
+    self.assertEqual(float('inf'), histogram.percentile(99))
+    self.assertEqual(None, Histogram([1]).percentile(50))
+
+
+class TestMetrics(unittest2.TestCase):
+
+  def test_records_rpcs(self):
+    metrics = Metrics()
+    metrics(_stats('lookup', 0.02, entities=10))
+    metrics(_stats('lookup', 0.2, entities=20))
+    metrics(_stats('commit', 0.1, status=None))
+
+    self.assertEqual(2, metrics.histogram('lookup', 'wire').count())
+    self.assertEqual(0.25, metrics.histogram('lookup').percentile(99))
+    self.assertEqual(30, metrics.entities('lookup').sum())
+    self.assertEqual({('lookup', '200'): 2, ('commit', 'error'): 1},
+                     metrics.requests())
+    self.assertRaises(ValueError, metrics.histogram, 'lookup', 'thinking')
+
+  def test_prometheus(self):
+    metrics = Metrics(latency_buckets=[0.1])
+    metrics(_stats('lookup', 0.02))
+    text = metrics.prometheus()
+
+    self.assertIn('# TYPE datastore_rpc_duration_seconds histogram\n', text)
+    self.assertIn('datastore_rpc_duration_seconds_bucket'
+                  '{le="0.1",method="lookup",phase="wire"} 1\n', text)
+    self.assertIn('datastore_rpc_duration_seconds_bucket'
+                  '{le="+Inf",method="lookup",phase="wire"} 1\n', text)
+    self.assertIn('datastore_rpcs_total{method="lookup",status="200"} 1\n',
+                  text)
+    self.assertIn('datastore_rpc_request_bytes_total{method="lookup"} 100\n',
+                  text)
@@ -0,0 +1,105 @@
+import random
+import time
+
+import unittest2
+
+from gcloud.datastore import network
+from gcloud.datastore.connection import Connection
+from gcloud.datastore.connection import RequestError
+from gcloud.datastore.emulator import Emulator
+
+
+class TestDistributions(unittest2.TestCase):
+
+  def test_samples(self):
+    rng = random.Random(1)
+    self.assertEqual(0.5, network.constant(0.5)(rng))
+    self.assertTrue(0.1 <= network.uniform(0.1, 0.2)(rng) <= 0.2)
+    self.assertTrue(network.normal(0, 10)(rng) >= 0)
+    self.assertTrue(network.lognormal(0.1, 0.5)(rng) > 0)
+
+
+class TestNetworkBackend(unittest2.TestCase):
+
+  def _dataset(self, backend):
+    return Connection(backend=backend).dataset('dataset-id')
+
+  def test_adds_latency_per_method(self):
+    backend = network.NetworkBackend(
+        Emulator(), latency={'*': 0, 'runQuery': 0.05}, seed=1)
+    dataset = self._dataset(backend)
+
+    start = time.time()
+    dataset.entity('Person').save()
+    self.assertTrue(time.time() - start < 0.05)
+
+    start = time.time()
+    self.assertEqual(1, len(dataset.query('Person').fetch()))
+    self.assertTrue(time.time() - start >= 0.05)
+    self.assertAlmostEqual(0.05, backend.delay_seconds(), delta=0.001)
+
+  def test_connection_setup(self):
+    backend = network.NetworkBackend(Emulator(), connection_setup=0.01,
+                                     idle_timeout=60)
+    dataset = self._dataset(backend)
+    dataset.query('Person').fetch()
+    dataset.query('Person').fetch()
+    self.assertEqual(1, backend.setup_count())
+
+    backend = network.NetworkBackend(Emulator(), idle_timeout=0)
+    dataset = self._dataset(backend)
+    dataset.query('Person').fetch()
+    time.sleep(0.01)
+    dataset.query('Person').fetch()
+    self.assertEqual(2, backend.setup_count())
+
+  def test_bandwidth(self):
+    backend = network.NetworkBackend(Emulator(), bandwidth=10000)
+    dataset = self._dataset(backend)
+    entity = dataset.entity('Person')
+    entity['payload'] = u'x' * 1000
+    start = time.time()
+    entity.save()
+    self.assertTrue(time.time() - start >= 0.1)
+
+  def test_errors(self):
+    backend = network.NetworkBackend(Emulator(),
+                                     error_rate={'commit': 1.0},
+                                     error_status=500)
+    dataset = self._dataset(backend)
+    with self.assertRaises(RequestError) as raised:
+      dataset.entity('Person').save()
+    self.assertEqual(500, raised.exception.status)
+    self.assertEqual([], dataset.query('Person').fetch())
+    self.assertEqual(1, backend.error_count())
+
+    # Errors from the backend itself are passed on.
+    backend = network.NetworkBackend(Emulator())
+    self.assertRaises(RequestError, backend.request, 'dataset-id', 'nope',
+                      '')
+
+  def test_max_connections(self):
+    import threading
+
+    def throughput(max_connections, concurrency, requests=8):
+      backend = network.NetworkBackend(Emulator(), latency=0.04,
+                                       max_connections=max_connections)
+      def work():
+        for _ in range(requests / concurrency):
+          backend.request('dataset-id', 'beginTransaction', '')
+      threads = [threading.Thread(target=work) for _ in range(concurrency)]
+      start = time.time()
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+      self.assertTrue(backend.setup_count() <= (max_connections or concurrency))
+      return requests / (time.time() - start)
+
+    capped = throughput(2, 2)
+    # More threads than connections don't get any more done...
+    self.assertTrue(throughput(2, 8) < capped * 1.5)
+    # ...but they do once there are enough connections.
+    self.assertTrue(throughput(None, 8) > capped * 2.5)
+    self.assertRaises(ValueError, network.NetworkBackend, Emulator(),
+                      max_connections=0)
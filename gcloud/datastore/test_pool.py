@@ -0,0 +1,70 @@
+import threading
+import time
+
+import unittest2
+
+from gcloud.datastore.pool import HttpPool
+
+
+class _Http(object):
+
+  def __init__(self):
+    self.requests = []
+
+  def request(self, *args, **kwargs):
+    self.requests.append((args, kwargs))
+    return {'status': '200'}, 'content'
+
+
+class TestHttpPool(unittest2.TestCase):
+
+  def test_request_reuses_transport(self):
+    created = []
+    def factory():
+      created.append(_Http())
+      return created[-1]
+
+    pool = HttpPool(factory, max_connections=2)
+    self.assertEqual(({'status': '200'}, 'content'), pool.request('uri'))
+    pool.request('uri', method='POST')
+    self.assertEqual(1, len(created))
+    self.assertEqual(2, len(created[0].requests))
+    self.assertEqual(1, pool.size())
+    self.assertEqual(1, pool.idle_count())
+
+  def test_acquire_blocks_when_full(self):
+    pool = HttpPool(_Http, max_connections=1)
+    first = pool.acquire()
+    acquired = []
+
+    thread = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    thread.start()
+    time.sleep(0.05)
+    self.assertEqual([], acquired)
+
+    pool.release(first)
+    thread.join(1)
+    self.assertEqual([first], acquired)
+    self.assertEqual(1, pool.size())
+
+  def test_idle_transports_are_reaped(self):
+    pool = HttpPool(_Http, max_connections=2, idle_timeout=0)
+    first = pool.acquire()
+    pool.release(first)
+    time.sleep(0.01)
+    second = pool.acquire()
+    self.assertIsNot(first, second)
+    self.assertEqual(1, pool.size())
+
+  def test_factory_failure_frees_slot(self):
+    def factory():
+      raise IOError('boom')
+
+    pool = HttpPool(factory, max_connections=1)
+    with self.assertRaises(IOError):
+      pool.acquire()
+    self.assertEqual(0, pool.size())
+
+  def test_max_connections_required(self):
+    with self.assertRaises(ValueError):
+      HttpPool(_Http, max_connections=0)
@@ -0,0 +1,221 @@
+import time
+
+import unittest2
+
+from gcloud.datastore import datastore_v1_pb2 as datastore_pb
+from gcloud.datastore.connection import Connection
+from gcloud.datastore.connection import RequestError
+from gcloud.datastore.dataset import Dataset
+from gcloud.datastore.query import Query
+
+
+class _PagingConnection(Connection):
+  """Serves ``count`` entities of kind Thing using offsets as cursors."""
+
+  def __init__(self, count):
+    super(_PagingConnection, self).__init__()
+    self.count = count
+    self.query_pbs = []
+
+  def _rpc(self, dataset_id, method, request_pb, response_pb_cls):
+    query_pb = request_pb.query
+    self.query_pbs.append(query_pb)
+    low, high = self._key_range(query_pb)
+    start = max(int(query_pb.start_cursor or 0), low)
+    end = min(self.count, high)
+    if query_pb.HasField('limit'):
+      end = min(end, start + query_pb.limit)
+
+    response = response_pb_cls()
+    batch = response.batch
+    projection = [p.property.name for p in query_pb.projection]
+    if projection == ['__key__']:
+      batch.entity_result_type = datastore_pb.EntityResult.KEY_ONLY
+    elif projection:
+      batch.entity_result_type = datastore_pb.EntityResult.PROJECTION
+    else:
+      batch.entity_result_type = datastore_pb.EntityResult.FULL
+
+    for id in range(start + 1, end + 1):
+      entity_pb = batch.entity_result.add().entity
+      entity_pb.key.path_element.add(kind='Thing', id=id)
+      for name in ('name', 'age'):
+        if projection in ([], [name]):
+          prop = entity_pb.property.add(name=name)
+          prop.value.string_value = '%s-%d' % (name, id)
+    batch.end_cursor = str(end)
+    if end < min(self.count, high):
+      batch.more_results = datastore_pb.QueryResultBatch.MORE_RESULTS_AFTER_LIMIT
+    else:
+      batch.more_results = datastore_pb.QueryResultBatch.NO_MORE_RESULTS
+    return response
+
+
+  @staticmethod
+  def _key_range(query_pb):
+    """Get the range of offsets allowed by any ``__key__`` filters."""
+    low, high = 0, float('inf')
+    for filter_pb in query_pb.filter.composite_filter.filter:
+      property_filter = filter_pb.property_filter
+      if property_filter.property.name == '__key__':
+        offset = property_filter.value.key_value.path_element[0].id - 1
+        if property_filter.operator == datastore_pb.PropertyFilter.LESS_THAN:
+          high = offset
+        else:
+          low = offset
+    return low, high
+
+
+class _FailingFirstShardConnection(_PagingConnection):
+  """Fails to run the first shard of a split query, and is slow otherwise."""
+
+  def _rpc(self, dataset_id, method, request_pb, response_pb_cls):
+    low, high = self._key_range(request_pb.query)
+    if high != float('inf'):
+      if low == 0:
+        raise RequestError(method, 500, 'Failed.')
+      time.sleep(0.1)
+    return super(_FailingFirstShardConnection, self)._rpc(
+        dataset_id, method, request_pb, response_pb_cls)
+
+
+class TestQuery(unittest2.TestCase):
+
+  def _query(self, count):
+    connection = _PagingConnection(count)
+    return connection, Query('Thing', dataset=Dataset('dataset-id', connection))
+
+  def test_iter_pages_with_cursors(self):
+    connection, query = self._query(5)
+    iterator = query.iter(page_size=2)
+    self.assertEqual([1, 2, 3, 4, 5],
+                     [entity.key().id() for entity in iterator])
+    self.assertEqual(['', '2', '4'],
+                     [query_pb.start_cursor for query_pb in connection.query_pbs])
+    self.assertEqual('5', iterator.cursor())
+
+  def test_iter_respects_limit(self):
+    connection, query = self._query(10)
+    entities = list(query.limit(3).iter(page_size=2, prefetch=False))
+    self.assertEqual([1, 2, 3], [entity.key().id() for entity in entities])
+    self.assertEqual([2, 1], [query_pb.limit for query_pb in connection.query_pbs])
+
+  def test_iter_entities_keep_dataset(self):
+    connection, query = self._query(1)
+    entity = list(query.iter())[0]
+    self.assertIs(query.dataset(), entity.dataset())
+
+  def test_start_cursor(self):
+    connection, query = self._query(5)
+    self.assertEqual(None, query.start_cursor())
+    resumed = query.start_cursor('3')
+    self.assertEqual(None, query.start_cursor())
+    self.assertEqual([4, 5], [entity.key().id() for entity in resumed.iter()])
+
+  def test_projection(self):
+    connection, query = self._query(2)
+    self.assertEqual([], query.projection())
+    projected = query.projection('name')
+    self.assertEqual(['name'], projected.projection())
+    self.assertEqual(['age'], projected.projection('age').projection())
+    self.assertEqual([{'name': 'name-1'}, {'name': 'name-2'}],
+                     [dict(entity) for entity in projected.fetch()])
+
+  def test_keys_only(self):
+    from gcloud.datastore.key import Key
+    connection, query = self._query(2)
+    keys = query.keys_only().fetch()
+    self.assertEqual(['__key__'], query.keys_only().projection())
+    self.assertTrue(all(isinstance(key, Key) for key in keys))
+    self.assertEqual([1, 2], [key.id() for key in keys])
+    self.assertIs(query.dataset(), keys[0].dataset())
+
+  def test_order(self):
+    connection, query = self._query(0)
+    ordered = query.order('-age', 'name')
+    self.assertEqual([], query.order())
+    self.assertEqual(['-age', 'name'], ordered.order())
+    self.assertEqual(datastore_pb.PropertyOrder.DESCENDING,
+                     ordered.to_protobuf().order[0].direction)
+
+  def test_split(self):
+    connection, query = self._query(30)
+    shards = query.split(3)
+    sample_pb = connection.query_pbs[0]
+    self.assertEqual('__scatter__', sample_pb.order[0].property.name)
+    self.assertEqual(3 * Query.SCATTER_OVERSAMPLING, sample_pb.limit)
+    self.assertEqual(3, len(shards))
+    self.assertEqual([range(1, 11), range(11, 21), range(21, 31)],
+                     [[key.id() for key in shard.keys_only().fetch()]
+                      for shard in shards])
+
+  def test_split_one_shard(self):
+    connection, query = self._query(30)
+    self.assertEqual([query], query.split(1))
+    self.assertEqual([], connection.query_pbs)
+
+  def test_split_samples_with_equality_filters(self):
+    connection, query = self._query(30)
+    query.filter('name =', 'name-1').filter('age >', 'age-0').split(3)
+    filters = connection.query_pbs[0].filter.composite_filter.filter
+    self.assertEqual([('name', datastore_pb.PropertyFilter.EQUAL)],
+                     [(filter_pb.property_filter.property.name,
+                       filter_pb.property_filter.operator)
+                      for filter_pb in filters])
+
+  def test_split_with_limit(self):
+    connection, query = self._query(30)
+    self.assertRaises(ValueError, query.limit(10).split, 3)
+
+  def test_parallel_scan_merged(self):
+    connection, query = self._query(40)
+    results = query.dataset().parallel_scan(query, 4, page_size=3)
+    self.assertEqual(range(1, 41), sorted(entity.key().id()
+                                          for entity in results))
+
+  def test_parallel_scan_per_shard(self):
+    connection, query = self._query(40)
+    counts = query.dataset().parallel_scan(
+        query, 4, func=lambda i, results: (i, len(list(results))))
+    self.assertEqual([(0, 10), (1, 10), (2, 10), (3, 10)], counts)
+
+  def test_parallel_scan_raises_shard_error_promptly(self):
+    connection = _FailingFirstShardConnection(40)
+    query = Query('Thing', dataset=Dataset('dataset-id', connection))
+    start = time.time()
+    with self.assertRaises(RequestError):
+      list(query.dataset().parallel_scan(query, 4, page_size=1))
+    # The other shards take a second to page through.
+    self.assertTrue(time.time() - start < 0.5)
+
+  def test_fetch_and_iter_columns(self):
+    connection, query = self._query(5)
+    columns = query.fetch_columns(page_size=2)
+    self.assertEqual([1, 2, 3, 4, 5], [key.id() for key in columns['__key__']])
+    self.assertEqual('age-5', columns['age'][4])
+    self.assertEqual(3, len(connection.query_pbs))
+
+    pages = list(query.limit(3).iter_columns(page_size=2))
+    self.assertEqual([2, 1], [len(page['name']) for page in pages])
+
+  def test_clones_share_parts_and_leave_original_alone(self):
+    query = Query('Thing').filter('a =', 1)
+    filtered = query.filter('b <=', 2).limit(5)
+    self.assertIs(query._filters[0], filtered._filters[0])
+    self.assertEqual(1, len(query.to_protobuf().filter.composite_filter.filter))
+    self.assertEqual(None, query.limit())
+    self.assertEqual(5, filtered.limit())
+
+    property_filter = filtered.to_protobuf().filter.composite_filter.filter[1]
+    self.assertEqual('b', property_filter.property_filter.property.name)
+    self.assertEqual(datastore_pb.PropertyFilter.LESS_THAN_OR_EQUAL,
+                     property_filter.property_filter.operator)
+
+  def test_protobuf_is_memoized(self):
+    query = Query('Thing').filter('a =', 1)
+    self.assertIs(query.to_protobuf(), query.to_protobuf())
+    self.assertIsNot(query.to_protobuf(), query.limit(1).to_protobuf())
+
+  def test_filter_invalid_expression(self):
+    with self.assertRaises(ValueError):
+      Query('Thing').filter('a', 1)
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import time
+
+import unittest2
+
+from gcloud.datastore.connection import Connection
+from gcloud.datastore.connection import RequestError
+from gcloud.datastore.emulator import Emulator
+from gcloud.datastore.replay import RecordingBackend
+from gcloud.datastore.replay import ReplayBackend
+from gcloud.datastore.replay import read_recording
+
+
+class _SlowBackend(object):
+
+  def __init__(self, backend, seconds):
+    self._backend = backend
+    self._seconds = seconds
+
+  def request(self, dataset_id, method, data):
+    time.sleep(self._seconds)
+    return self._backend.request(dataset_id, method, data)
+
+
+class TestReplay(unittest2.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'traffic.rec')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def _record(self, backend=None):
+    recorder = RecordingBackend(backend or Emulator(), self.path)
+    dataset = Connection(backend=recorder).dataset('dataset-id')
+    person = dataset.entity('Person')
+    person['name'] = u'Sally'
+    person.save()
+    names = [found['name'] for found in dataset.query('Person').fetch()]
+    recorder.close()
+    return recorder, person.key(), names
+
+  def test_replays_recorded_responses(self):
+    recorder, key, names = self._record()
+    self.assertEqual(2, recorder.call_count())
+
+    replay = ReplayBackend(self.path)
+    self.assertEqual(2, replay.call_count())
+    dataset = Connection(backend=replay).dataset('dataset-id')
+    person = dataset.entity('Person')
+    person['name'] = u'Sally'
+    self.assertEqual(key.path(), person.save().key().path())
+    self.assertEqual(names, [found['name'] for found in
+                             dataset.query('Person').fetch()])
+    self.assertEqual(0, replay.miss_count())
+
+  def test_recordings_are_appended_to(self):
+    self._record()
+    self._record()
+    with open(self.path, 'rb') as recording:
+      calls = list(read_recording(recording))
+    self.assertEqual(['commit', 'runQuery'] * 2,
+                     [call.method for call in calls])
+
+    # Repeated requests get their responses in order.
+    replay = ReplayBackend(self.path)
+    first = replay.request('dataset-id', 'runQuery', calls[1].request)
+    second = replay.request('dataset-id', 'runQuery', calls[1].request)
+    self.assertEqual(calls[1].response, first)
+    self.assertEqual(calls[3].response, second)
+    self.assertEqual(second, replay.request('dataset-id', 'runQuery',
+                                            calls[1].request))
+
+  def test_errors_are_replayed(self):
+    recorder = RecordingBackend(Emulator(), self.path)
+    self.assertRaises(RequestError, recorder.request, 'dataset-id', 'nope',
+                      'request')
+    recorder.close()
+
+    with self.assertRaises(RequestError) as raised:
+      ReplayBackend(self.path).request('dataset-id', 'nope', 'request')
+    self.assertEqual(404, raised.exception.status)
+
+  def test_unrecorded_requests(self):
+    self._record()
+    replay = ReplayBackend(self.path)
+    self.assertRaises(RequestError, replay.request, 'dataset-id',
+                      'allocateIds', '')
+    self.assertEqual(1, replay.miss_count())
+
+    emulator = Emulator()
+    replay = ReplayBackend(self.path, fallback=emulator)
+    self.assertEqual('', replay.request('dataset-id', 'allocateIds', ''))
+
+  def test_replays_latency_at_speed(self):
+    self._record(_SlowBackend(Emulator(), 0.02))
+    with open(self.path, 'rb') as recording:
+      request = list(read_recording(recording))[0].request
+
+    start = time.time()
+    ReplayBackend(self.path, speed=0.5).request('dataset-id', 'commit',
+                                                request)
+    self.assertTrue(time.time() - start >= 0.04)
+    self.assertRaises(ValueError, ReplayBackend, self.path, speed=0)
+
+  def test_truncated_recording(self):
+    self._record()
+    with open(self.path, 'rb') as recording:
+      data = recording.read()
+    with open(self.path, 'wb') as recording:
+      recording.write(data[:-5])
+
+    self.assertEqual(1, ReplayBackend(self.path).call_count())
+
+    with open(self.path, 'wb') as recording:
+      recording.write('not a recording')
+    self.assertRaises(ValueError, ReplayBackend, self.path)
@@ -0,0 +1,157 @@
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import unittest2
+
+from gcloud.datastore.tokens import TokenManager
+
+
+class _Credentials(object):
+  """Hands out numbered tokens, each lasting ``lifetime`` seconds."""
+
+  def __init__(self, lifetime=3600, account='app@example.com',
+               scope='https://www.googleapis.com/auth/datastore'):
+    self.lifetime = lifetime
+    self.service_account_name = account
+    self.scope = scope
+    self.refreshes = 0
+    self.access_token = None
+    self.token_expiry = None
+    self.refreshed_at = []
+    self.refreshed = threading.Condition()
+
+  def wait_for(self, refreshes, timeout=10):
+    """Wait until there have been at least ``refreshes`` refreshes."""
+    deadline = time.time() + timeout
+    with self.refreshed:
+      while self.refreshes < refreshes and time.time() < deadline:
+        self.refreshed.wait(deadline - time.time())
+    return self.refreshes >= refreshes
+
+  def refresh(self, http):
+    self.refreshes += 1
+    self.refreshed_at.append(time.time())
+    with self.refreshed:
+      self.refreshed.notify_all()
+    self.access_token = 'token-%d' % self.refreshes
+    self.token_expiry = (datetime.datetime.utcnow() +
+                         datetime.timedelta(seconds=self.lifetime))
+
+
+class _TokenManager(TokenManager):
+  """Doesn't insist on tokens lasting long, so they can be short-lived."""
+
+  MIN_VALIDITY = 0
+
+
+class _Response(dict):
+
+  def __init__(self, status):
+    super(_Response, self).__init__()
+    self.status = status
+
+
+class _Http(object):
+  """Rejects any token in ``revoked``."""
+
+  def __init__(self):
+    self.revoked = set()
+    self.headers = []
+
+  def request(self, uri, method='GET', body=None, headers=None):
+    self.headers.append(dict(headers))
+    token = headers['Authorization'][len('Bearer '):]
+    return _Response(401 if token in self.revoked else 200), ''
+
+
+class TestTokenManager(unittest2.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_token_is_reused(self):
+    credentials = _Credentials()
+    manager = TokenManager(credentials)
+    try:
+      self.assertEqual('token-1', manager.token())
+      self.assertEqual('token-1', manager.token())
+      self.assertEqual(1, credentials.refreshes)
+      self.assertAlmostEqual(time.time() + 3600, manager.expires_at(), delta=5)
+    finally:
+      manager.close()
+
+  def test_expiry_keeps_microseconds(self):
+    credentials = _Credentials()
+    credentials.refresh = lambda http: None
+    credentials.access_token = 'token'
+    credentials.token_expiry = datetime.datetime(2030, 1, 1, 0, 0, 0, 250000)
+    manager = TokenManager(credentials)
+    try:
+      self.assertEqual('token', manager.token())
+      self.assertEqual(1893456000.25, manager.expires_at())
+    finally:
+      manager.close()
+
+  def test_refreshes_in_background(self):
+    credentials = _Credentials(lifetime=2)
+    manager = _TokenManager(credentials)
+    try:
+      self.assertEqual('token-1', manager.token())
+      # The margin is capped at half the lifetime, so the next token
+      # is fetched a second after the first, without any requests.
+      self.assertTrue(credentials.wait_for(2))
+      self.assertNotEqual('token-1', manager.token())
+      self.assertGreaterEqual(
+          credentials.refreshed_at[1] - credentials.refreshed_at[0], 0.9)
+    finally:
+      manager.close()
+
+  def test_shares_tokens_through_cache(self):
+    path = os.path.join(self.directory, 'token.json')
+    first, second = _Credentials(), _Credentials()
+    managers = [TokenManager(first, cache_path=path),
+                TokenManager(second, cache_path=path)]
+    try:
+      self.assertEqual('token-1', managers[0].token())
+      self.assertEqual('token-1', managers[1].token())
+      self.assertEqual(0, second.refreshes)
+      self.assertEqual([1, 0], [manager.refresh_count()
+                                for manager in managers])
+    finally:
+      for manager in managers:
+        manager.close()
+
+  def test_cache_ignores_other_credentials_tokens(self):
+    path = os.path.join(self.directory, 'token.json')
+    credentials = [_Credentials(), _Credentials(account='other@example.com'),
+                   _Credentials(scope='https://www.googleapis.com/auth/other')]
+    managers = [TokenManager(each, cache_path=path) for each in credentials]
+    try:
+      for manager in managers:
+        self.assertEqual('token-1', manager.token())
+      self.assertEqual([1, 1, 1], [each.refreshes for each in credentials])
+    finally:
+      for manager in managers:
+        manager.close()
+
+  def test_authorize_retries_rejected_token(self):
+    credentials = _Credentials()
+    manager = TokenManager(credentials)
+    http = _Http()
+    try:
+      manager.authorize(http)
+      http.request('http://example.com/')
+      http.revoked.add('token-1')
+      response, _ = http.request('http://example.com/')
+      self.assertEqual(200, response.status)
+      self.assertEqual(['Bearer token-1', 'Bearer token-1', 'Bearer token-2'],
+                       [headers['Authorization'] for headers in http.headers])
+    finally:
+      manager.close()
@@ -0,0 +1,42 @@
+import unittest2
+
+from gcloud.datastore.connection import RequestError
+from gcloud.datastore.emulator import Emulator
+
+
+class TestTransaction(unittest2.TestCase):
+
+  def test_commit(self):
+    dataset = Emulator().dataset('dataset-id')
+    transaction = dataset.transaction()
+    transaction.begin()
+    self.assertIs(transaction, dataset.connection().transaction())
+
+    dataset.entity('Person').save()
+    self.assertEqual([], dataset.query('Person').fetch())
+    transaction.commit()
+
+    self.assertEqual(None, dataset.connection().transaction())
+    self.assertEqual(None, transaction.id())
+    self.assertEqual(1, len(dataset.query('Person').fetch()))
+
+  def test_failed_commit_ends_transaction(self):
+    emulator = Emulator(conflict_rate=1.0)
+    dataset = emulator.dataset('dataset-id')
+    transaction = dataset.transaction()
+    transaction.begin()
+    dataset.entity('Person').save()
+
+    with self.assertRaises(RequestError) as raised:
+      transaction.commit()
+    self.assertEqual(409, raised.exception.status)
+    self.assertEqual(None, dataset.connection().transaction())
+    self.assertEqual(None, transaction.id())
+    self.assertEqual(0, emulator.entity_count('dataset-id'))
+
+    # The thread can start another transaction.
+    transaction = dataset.transaction()
+    transaction.begin()
+    self.assertIs(transaction, dataset.connection().transaction())
+    transaction.rollback()
+    self.assertEqual(None, dataset.connection().transaction())
@@ -0,0 +1,44 @@
+import threading
+
+import unittest2
+
+from gcloud.datastore.workers import Future
+from gcloud.datastore.workers import WorkerPool
+
+
+class TestFuture(unittest2.TestCase):
+
+  def test_from_call(self):
+    future = Future.from_call(lambda x, y=0: x + y, 1, y=2)
+    self.assertTrue(future.ready())
+    self.assertEqual(3, future.get())
+
+  def test_from_call_reraises(self):
+    def fail():
+      raise KeyError('missing')
+
+    future = Future.from_call(fail)
+    self.assertTrue(future.ready())
+    with self.assertRaises(KeyError):
+      future.get()
+
+  def test_get_timeout(self):
+    from multiprocessing import TimeoutError
+    future = Future()
+    self.assertFalse(future.ready())
+    with self.assertRaises(TimeoutError):
+      future.get(timeout=0.01)
+
+
+class TestWorkerPool(unittest2.TestCase):
+
+  def test_submit_runs_on_worker_thread(self):
+    pool = WorkerPool(max_workers=2)
+    future = pool.submit(lambda: threading.current_thread())
+    self.assertIsNot(threading.current_thread(), future.get(1))
+    pool.close()
+
+  def test_map_preserves_order(self):
+    pool = WorkerPool(max_workers=4)
+    self.assertEqual([0, 1, 4, 9, 16], pool.map(lambda x: x * x, range(5)))
+    pool.close()
@@ -0,0 +1,282 @@
+"""Access tokens which are refreshed before they expire.
+
+OAuth2 credentials normally refresh their access token
+inside whichever request first finds it has expired,
+so that request waits for a JWT to be signed and exchanged.
+A :class:`TokenManager` instead refreshes the token on a background thread
+a few minutes before it expires,
+so requests only ever wait for the very first token::
+
+  >>> credentials = Credentials.get_for_service_account(email, key_path)
+  >>> tokens = TokenManager(credentials)
+  >>> connection = Connection(credentials=tokens)
+
+Processes on the same host can share one token
+through a cache file (``cache_path``).
+The file is locked while a token is being fetched,
+so only one process signs a JWT for each refresh
+and the rest pick up the token it wrote.
+The file records which service account and scope the token is for,
+and processes using other credentials fetch their own tokens.
+"""
+
+import calendar
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None  # The cache file can still be shared, just not locked.
+
+
+class TokenManager(object):
+  """Keeps an access token fresh ahead of its expiry.
+
+  A token manager can be used anywhere credentials are,
+  since it can :func:`authorize` an HTTP transport.
+  Managers are thread-safe.
+
+  :type credentials: :class:`oauth2client.client.OAuth2Credentials`
+  :param credentials: The credentials to fetch tokens with
+                      (for instance, from
+                      :func:`gcloud.datastore.credentials.Credentials.get_for_service_account`).
+
+  :type refresh_margin: integer or float
+  :param refresh_margin: How many seconds before a token expires
+                         to start fetching the next one
+                         (at most half the token's lifetime,
+                         so short-lived tokens aren't fetched back to back).
+
+  :type cache_path: string
+  :param cache_path: A file in which to share tokens with other processes
+                     (using the same credentials).
+  """
+
+  REFRESH_MARGIN = 300
+  """The default number of seconds before expiry to refresh a token."""
+
+  MIN_VALIDITY = 10
+  """A token expiring within this many seconds isn't used for requests."""
+
+  DEFAULT_LIFETIME = 3600
+  """How long a token is taken to last if the credentials don't say."""
+
+  MAX_RETRY_DELAY = 60
+  """The longest the background thread waits after a failed refresh."""
+
+  MIN_REFRESH_INTERVAL = 1
+  """The shortest time between background refreshes, in seconds."""
+
+  def __init__(self, credentials, refresh_margin=None, cache_path=None):
+    self._credentials = credentials
+    if refresh_margin is None:
+      refresh_margin = self.REFRESH_MARGIN
+    self._refresh_margin = refresh_margin
+    self._cache_path = cache_path
+
+    # An (access token, expiry timestamp, time obtained) tuple.
+    self._token = None
+    self._lock = threading.Lock()
+    self._refresh_http = None
+    self._thread = None
+    self._stopped = threading.Event()
+    self._refreshes = 0
+
+  def token(self):
+    """Get a current access token.
+
+    This only waits for a token to be fetched
+    if there isn't one which is still valid
+    (usually only the first time it's called).
+
+    :rtype: string
+    """
+    self._start()
+    token = self._token
+    if token is None or token[1] - time.time() < self.MIN_VALIDITY:
+      token = self._refresh(self.MIN_VALIDITY)
+    return token[0]
+
+  def expires_at(self):
+    """Get when the current token expires.
+
+    :rtype: float
+    :returns: A Unix timestamp, or ``None`` if there's no token yet.
+    """
+    token = self._token
+    return token[1] if token else None
+
+  def refresh_count(self):
+    """Get the number of tokens fetched (not counting any from the cache file).
+
+    :rtype: integer
+    """
+    return self._refreshes
+
+  def authorize(self, http):
+    """Add an ``Authorization`` header to every request made with a transport.
+
+    If a request is rejected as unauthorized,
+    a new token is fetched and the request is tried once more.
+
+    :type http: :class:`httplib2.Http`
+    :param http: The transport to authorize.
+
+    :rtype: :class:`httplib2.Http`
+    :returns: The same transport.
+    """
+    request = http.request
+
+    def authorized_request(uri, method='GET', body=None, headers=None,
+                           *args, **kwargs):
+      headers = dict(headers or {})
+      access_token = self.token()
+      headers['Authorization'] = 'Bearer ' + access_token
+      response, content = request(uri, method, body, headers, *args, **kwargs)
+
+      if response.status == 401:
+        headers['Authorization'] = 'Bearer ' + self._replace(access_token)
+        response, content = request(uri, method, body, headers,
+                                    *args, **kwargs)
+      return response, content
+
+    http.request = authorized_request
+    return http
+
+  def close(self):
+    """Stop refreshing the token in the background."""
+    self._stopped.set()
+    if self._thread is not None:
+      self._thread.join()
+
+  def _start(self):
+    if self._thread is None:
+      with self._lock:
+        if self._thread is None and not self._stopped.is_set():
+          self._thread = threading.Thread(target=self._run)
+          self._thread.daemon = True
+          self._thread.start()
+
+  def _run(self):
+    failures = 0
+    while not self._stopped.is_set():
+      token = self._token
+      margin = self.MIN_VALIDITY  # Just get a token, if there isn't one.
+      if token is not None:
+        margin = self._margin_for(token)
+        delay = max(token[1] - margin,
+                    token[2] + self.MIN_REFRESH_INTERVAL) - time.time()
+        if delay > 0:
+          self._stopped.wait(delay)
+          continue
+
+      try:
+        self._refresh(margin)
+        failures = 0
+      except Exception:
+        # Requests will try again themselves once the token really expires.
+        failures += 1
+        self._stopped.wait(min(2 ** failures, self.MAX_RETRY_DELAY))
+
+  def _margin_for(self, token):
+    """Get how long before a token expires to refresh it."""
+    return min(self._refresh_margin, (token[1] - token[2]) / 2.0)
+
+  def _replace(self, rejected):
+    """Get a token other than one the API has rejected."""
+    with self._lock:
+      if self._token is not None and self._token[0] != rejected:
+        return self._token[0]
+      self._token = None
+    return self._refresh(self.MIN_VALIDITY, rejected=rejected)[0]
+
+  def _is_fresh(self, token, min_validity, rejected=None):
+    return (token is not None and token[0] != rejected and
+            token[1] - time.time() >= min_validity)
+
+  def _refresh(self, min_validity, rejected=None):
+    """Make sure the token is valid for at least ``min_validity`` seconds."""
+    with self._lock:
+      # Another thread may have got there first.
+      if self._is_fresh(self._token, min_validity):
+        return self._token
+
+      with self._locked_cache():
+        token = self._read_cache()
+        if not self._is_fresh(token, min_validity, rejected):
+          token = self._fetch()
+          self._write_cache(token)
+
+      self._token = token
+      return token
+
+  def _fetch(self):
+    if self._refresh_http is None:
+      # This import is here so httplib2 is only loaded when it's needed.
+      import httplib2
+      self._refresh_http = httplib2.Http()
+
+    self._credentials.refresh(self._refresh_http)
+    self._refreshes += 1
+
+    expiry = self._credentials.token_expiry
+    if expiry is None:
+      expires_at = time.time() + self.DEFAULT_LIFETIME
+    else:
+      # oauth2client keeps expiry times as naive UTC datetimes.
+      expires_at = (calendar.timegm(expiry.utctimetuple()) +
+                    expiry.microsecond / 1e6)
+    return self._credentials.access_token, expires_at, time.time()
+
+  @contextmanager
+  def _locked_cache(self):
+    if self._cache_path is None or fcntl is None:
+      yield
+      return
+
+    with open(self._cache_path + '.lock', 'a') as lock_file:
+      fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+      try:
+        yield
+      finally:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+  def _identity(self):
+    """Get who the credentials' tokens are for, to check cached tokens by."""
+    credentials = self._credentials
+    account = (getattr(credentials, 'service_account_name', None) or
+               getattr(credentials, 'service_account_email', None))
+    scope = getattr(credentials, 'scope', None)
+    if scope is not None and not isinstance(scope, basestring):
+      scope = ' '.join(scope)
+    return {'account': account, 'scope': scope}
+
+  def _read_cache(self):
+    if self._cache_path is None:
+      return None
+    try:
+      with open(self._cache_path) as cache_file:
+        cached = json.load(cache_file)
+      if cached['identity'] != self._identity():
+        return None  # Another process's token, for other credentials.
+      return cached['access_token'], cached['expires_at'], time.time()
+    except (IOError, ValueError, KeyError):
+      return None
+
+  def _write_cache(self, token):
+    if self._cache_path is None:
+      return
+
+    # Write then rename, so no one ever reads a partial token.
+    # Tokens are secrets, so only this user can read the file.
+    temporary_path = '%s.%d.tmp' % (self._cache_path, os.getpid())
+    descriptor = os.open(temporary_path,
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+    with os.fdopen(descriptor, 'w') as cache_file:
+      json.dump({'access_token': token[0], 'expires_at': token[1],
+                 'identity': self._identity()}, cache_file)
+    os.rename(temporary_path, self._cache_path)
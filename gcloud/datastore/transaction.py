@@ -86,12 +86,15 @@ class Transaction(object):
 
   For now,
   this library will enforce a rule of
-  one transaction per connection.
+  one transaction per connection per thread.
   That is,
   If you want to work with two transactions at the same time
+  from the same thread
   (for whatever reason),
   that must happen over two separate
   :class:`gcloud.datastore.connection.Connection` s.
+  Separate threads sharing a single connection
+  can each run their own transaction.
 
   For example, this is perfectly valid::
 
@@ -228,22 +231,68 @@ class Transaction(object):
     - Sets the current transaction's ID to None.
     - Updates paths for any keys that needed an automatically generated ID.
     """
-    # It's possible that they called commit() already, in which case
-    # we shouldn't do any committing of our own.
-    if self.connection().transaction():
-      result = self.connection().commit(self.dataset().id(), self.mutation())
-
-      # For any of the auto-id entities, make sure we update their keys.
-      for i, entity in enumerate(self._auto_id_entities):
-        key_pb = result.insert_auto_id_key[i]
-        key = Key.from_protobuf(key_pb)
-        entity.key(entity.key().path(key.path()))
-
-    # Tell the connection that the transaction is over.
-    self.connection().transaction(None)
+    try:
+      # It's possible that they called commit() already, in which case
+      # we shouldn't do any committing of our own.
+      if self.connection().transaction():
+        result = self.connection().commit(self.dataset().id(),
+                                          self.mutation())
+
+        # For any of the auto-id entities, make sure we update their keys.
+        for i, entity in enumerate(self._auto_id_entities):
+          key_pb = result.insert_auto_id_key[i]
+          key = Key.from_protobuf(key_pb)
+          entity.key(entity.key().path(key.path()))
+    finally:
+      # Tell the connection that the transaction is over
+      # (even if the commit failed, since it can't be committed again).
+      self.connection().transaction(None)
+
+      # Clear our own ID in case this gets accidentally reused.
+      self._id = None
+
+  def commit_async(self):
+    """Like :func:`commit` but returns a future.
+
+    The transaction is handed off to a worker thread,
+    so the calling thread is no longer in the transaction
+    once this returns
+    (and can go on to make other requests).
+
+    :rtype: :class:`gcloud.datastore.workers.Future`
+    :returns: A future which is resolved once the transaction is committed.
+    """
+    return self._hand_off(self.commit)
 
-    # Clear our own ID in case this gets accidentally reused.
-    self._id = None
+  def rollback_async(self):
+    """Like :func:`rollback` but returns a future.
+
+    :rtype: :class:`gcloud.datastore.workers.Future`
+    :returns: A future which is resolved once the transaction is rolled back.
+    """
+    return self._hand_off(self.rollback)
+
+  def _hand_off(self, method):
+    """Detach from the calling thread and run a method on a worker thread.
+
+    Transactions are tracked per thread on the connection,
+    so the worker needs to pick up this transaction before running ``method``.
+    """
+    connection = self.connection()
+    if connection.transaction() is self:
+      connection.transaction(None)
+    else:
+      # We're not active in the calling thread, so there's nothing to send.
+      return connection.submit(method)
+
+    def run():
+      connection.transaction(self)
+      try:
+        return method()
+      finally:
+        connection.transaction(None)
+
+    return connection.submit(run)
 
   def __enter__(self):
     self.begin()
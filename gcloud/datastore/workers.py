@@ -0,0 +1,176 @@
+"""Futures and a pool of worker threads for running API calls concurrently.
+
+These are used by :class:`gcloud.datastore.connection.AsyncConnection`
+to keep many requests in flight at once
+without blocking the calling thread::
+
+  >>> pool = WorkerPool(max_workers=4)
+  >>> future = pool.submit(connection.lookup, 'dataset-id', key_pbs)
+  >>> # Do other work...
+  >>> future.get()
+  [<Entity protobuf>, ...]
+"""
+
+import sys
+import threading
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+
+class Future(object):
+  """The eventual result of a call.
+
+  A future is resolved exactly once,
+  with either the return value of the call
+  or the exception it raised.
+  Calling :func:`get` returns that value (or re-raises that exception).
+  """
+
+  def __init__(self):
+    self._event = threading.Event()
+    self._result = None
+    self._exc_info = None
+
+  @classmethod
+  def from_call(cls, func, *args, **kwargs):
+    """Run a function immediately and return a resolved :class:`Future`.
+
+    :type func: callable
+    :param func: The function to call with the remaining arguments.
+
+    :rtype: :class:`Future`
+    :returns: A future which is already resolved.
+    """
+    future = cls()
+    future._run(func, args, kwargs)
+    return future
+
+  def _run(self, func, args, kwargs):
+    try:
+      self._result = func(*args, **kwargs)
+    except Exception:
+      self._exc_info = sys.exc_info()
+    self._event.set()
+
+  def ready(self):
+    """Check whether the call has finished.
+
+    :rtype: bool
+    """
+    return self._event.is_set()
+
+  def wait(self, timeout=None):
+    """Wait for the call to finish.
+
+    :type timeout: float
+    :param timeout: The maximum number of seconds to wait.
+
+    :rtype: bool
+    :returns: Whether the call has finished.
+    """
+    self._event.wait(timeout)
+    return self.ready()
+
+  def get(self, timeout=None):
+    """Wait for and return the result of the call.
+
+    :type timeout: float
+    :param timeout: The maximum number of seconds to wait.
+
+    :returns: The value returned by the call.
+
+    :raises: :class:`multiprocessing.TimeoutError` if the call didn't finish
+             in time, or whatever exception the call raised.
+    """
+    if not self.wait(timeout):
+      raise TimeoutError('The call did not finish in time.')
+
+    if self._exc_info:
+      raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+
+    return self._result
+
+
+def run_in_thread(func, *args, **kwargs):
+  """Run a function on a new (daemon) thread.
+
+  This is cheaper than a :class:`WorkerPool`
+  for a one-off call in the background.
+
+  :type func: callable
+  :param func: The function to call with the remaining arguments.
+
+  :rtype: :class:`Future`
+  :returns: A future which is resolved when the call finishes.
+  """
+  future = Future()
+  thread = threading.Thread(target=future._run, args=(func, args, kwargs))
+  thread.daemon = True
+  thread.start()
+  return future
+
+
+class WorkerPool(object):
+  """A pool of threads which run calls and resolve :class:`Future` s.
+
+  The threads are started on the first call to :func:`submit`.
+
+  :type max_workers: integer
+  :param max_workers: The maximum number of calls to run at once.
+  """
+
+  def __init__(self, max_workers=10):
+    self._max_workers = max_workers
+    self._pool = None
+    self._lock = threading.Lock()
+
+  def max_workers(self):
+    """Get the maximum number of calls to run at once.
+
+    :rtype: integer
+    """
+    return self._max_workers
+
+  def _thread_pool(self):
+    if self._pool is None:
+      with self._lock:
+        if self._pool is None:
+          self._pool = ThreadPool(self._max_workers)
+    return self._pool
+
+  def submit(self, func, *args, **kwargs):
+    """Run a function on a worker thread.
+
+    :type func: callable
+    :param func: The function to call with the remaining arguments.
+
+    :rtype: :class:`Future`
+    :returns: A future which is resolved when the call finishes.
+    """
+    future = Future()
+    self._thread_pool().apply_async(future._run, (func, args, kwargs))
+    return future
+
+  def map(self, func, items):
+    """Call a function with each item concurrently and wait for all results.
+
+    :type func: callable
+    :param func: The function to call with each item.
+
+    :type items: iterable
+    :param items: The items to pass to ``func``.
+
+    :rtype: list
+    :returns: The results, in the same order as ``items``.
+    """
+    futures = [self.submit(func, item) for item in items]
+    return [future.get() for future in futures]
+
+  def close(self):
+    """Wait for any running calls to finish and stop the worker threads."""
+    with self._lock:
+      pool, self._pool = self._pool, None
+
+    if pool is not None:
+      pool.close()
+      pool.join()